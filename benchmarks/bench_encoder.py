@@ -0,0 +1,72 @@
+"""Measure the host side cost of encoding commands.
+
+Each family is encoded the way ``TeensyToAny`` did before command templates
+were introduced, with an f-string followed by ``str.encode``, and with the
+templates of :mod:`teensytoany.encoder`::
+
+    python benchmarks/bench_encoder.py
+
+"""
+import argparse
+import timeit
+
+from teensytoany.encoder import COMMAND_TEMPLATES, encode_payload
+
+ADDRESS = 0x20
+REGISTER = 0x1F
+DATA = 0xA5
+PIN = 13
+PAYLOAD = list(range(256))
+
+I2C_WRITE_UINT8 = COMMAND_TEMPLATES['i2c_write_uint8']
+I2C_READ_UINT8 = COMMAND_TEMPLATES['i2c_read_uint8']
+GPIO_DIGITAL_WRITE = COMMAND_TEMPLATES['gpio_digital_write']
+REGISTER_WRITE_UINT32 = COMMAND_TEMPLATES['register_write_uint32']
+I2C_WRITE_PAYLOAD = COMMAND_TEMPLATES['i2c_write_payload']
+
+CASES = {
+    'i2c_write_uint8': (
+        lambda: (
+            f"i2c_write_uint8 0x{ADDRESS:02x} 0x{REGISTER:x} 0x{DATA:x}" + '\n'
+        ).encode('utf-8'),
+        lambda: I2C_WRITE_UINT8 % (ADDRESS, REGISTER, DATA),
+    ),
+    'i2c_read_uint8': (
+        lambda: (f"i2c_read_uint8 0x{ADDRESS:02x} 0x{REGISTER:x}" + '\n').encode('utf-8'),
+        lambda: I2C_READ_UINT8 % (ADDRESS, REGISTER),
+    ),
+    'gpio_digital_write': (
+        lambda: (f"gpio_digital_write {PIN} {1}" + '\n').encode('utf-8'),
+        lambda: GPIO_DIGITAL_WRITE % (PIN, 1),
+    ),
+    'register_write_uint32': (
+        lambda: (f"register_write_uint32 {REGISTER} {DATA}" + '\n').encode('utf-8'),
+        lambda: REGISTER_WRITE_UINT32 % (REGISTER, DATA),
+    ),
+    'i2c_write_payload (256 B)': (
+        lambda: (
+            f"i2c_write_payload 0x{ADDRESS:02x} 0x{REGISTER:02x} "
+            + ' '.join([f"0x{val:02x}" for val in PAYLOAD]) + '\n'
+        ).encode('utf-8'),
+        lambda: I2C_WRITE_PAYLOAD % (ADDRESS, REGISTER, encode_payload(PAYLOAD)),
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"{'command':>26} {'before':>10} {'after':>10} {'speedup':>8}")
+    for name, (before, after) in CASES.items():
+        assert before() == after(), name
+        number = args.number if 'payload' not in name else args.number // 100
+        before_time = min(timeit.repeat(before, number=number, repeat=5)) / number
+        after_time = min(timeit.repeat(after, number=number, repeat=5)) / number
+        print(f"{name:>26} {before_time * 1E9:8.0f}ns {after_time * 1E9:8.0f}ns "
+              f"{before_time / after_time:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
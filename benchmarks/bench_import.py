@@ -0,0 +1,64 @@
+"""Measure how long it takes to import the package and start the CLI.
+
+Each target is imported in a fresh interpreter with ``python -X importtime``
+and the median cumulative import time of several runs is compared with its
+budget, in milliseconds. The slowest modules imported along the way are
+listed to find what to defer::
+
+    python benchmarks/bench_import.py --runs 10
+
+The script exits with a non zero status if a target exceeds its budget.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Milliseconds, on a development machine. Importing click alone takes about
+# 40 ms, and running from a git checkout adds a call to git for the version.
+BUDGETS = {
+    'teensytoany': 50,
+    'teensytoany.cli': 120,
+}
+
+
+def importtime(module):
+    """Return the self and cumulative import times, in us, of every module."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_time, cumulative, name = line[len('import time:'):].split('|')
+        if not self_time.strip().isdigit():
+            # The header
+            continue
+        times[name.strip()] = (int(self_time), int(cumulative))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--top', type=int, default=5,
+                        help='Number of slow modules to list for each target.')
+    args = parser.parse_args()
+
+    over_budget = False
+    for module, budget in BUDGETS.items():
+        runs = [importtime(module) for _ in range(args.runs)]
+        median = statistics.median(times[module][1] for times in runs) / 1000
+        status = 'ok' if median <= budget else 'OVER BUDGET'
+        over_budget |= median > budget
+        print(f"{module:>16}: {median:6.1f} ms (budget {budget} ms) {status}")
+        slowest = sorted(runs[-1].items(), key=lambda item: item[1][0], reverse=True)
+        for name, (self_time, _) in slowest[:args.top]:
+            print(f"{'':>18}{self_time / 1000:6.1f} ms  {name}")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
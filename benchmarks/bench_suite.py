@@ -0,0 +1,294 @@
+"""Measure command latency, bulk throughput and host overhead.
+
+The suite measures:
+
+* the latency distribution of ``nop``, ``i2c_read_uint8``,
+  ``gpio_digital_write`` and ``register_read_uint32``,
+* the throughput of ``spi_transfer_bulk``, ``i2c_write_bulk`` and
+  ``i2c_read_payload`` for several payload sizes,
+* the time taken to open a device,
+* the host side cost of encoding commands, parsing responses and recording
+  them with :mod:`teensytoany.instrumentation`.
+
+By default, the device is simulated over a pseudo-terminal by
+:mod:`teensytoany.simulator`, which tracks the host side cost in CI. With
+``--hardware``, a connected board is used instead, optionally selected with
+``--serial-number``::
+
+    python benchmarks/bench_suite.py --output simulated.json
+    python benchmarks/bench_suite.py --hardware --output hardware.json
+    python benchmarks/bench_suite.py --transport fd
+    python benchmarks/bench_suite.py --payload-encoding base64
+
+The same suite runs from pytest, see ``teensytoany/tests/test_benchmarks.py``,
+against the simulated device or, with ``-m hardware``, against a board.
+The results are written as JSON, with latencies in microseconds, so that
+releases can be compared.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import teensytoany
+from teensytoany import TeensyToAny
+from teensytoany.decoder import decode_payload
+from teensytoany.encoder import (COMMAND_TEMPLATES, PAYLOAD_ENCODINGS,
+                                 encode_payload)
+from teensytoany.instrumentation import Instrumentation
+from teensytoany.simulator import TeensyToAnySimulator
+
+ADDRESS = 0x20
+REGISTER = 0x10
+PIN = 13
+# An address of the on chip peripherals, readable on every Teensy
+REGISTER_ADDRESS = 0x400D8000
+
+LATENCY_COMMANDS = {
+    'nop': lambda teensy: teensy.nop(),
+    'i2c_read_uint8': lambda teensy: teensy.i2c_read_uint8(ADDRESS, REGISTER),
+    'gpio_digital_write': lambda teensy: teensy.gpio_digital_write(PIN, 0),
+    'register_read_uint32': lambda teensy: teensy.register_read_uint32(REGISTER_ADDRESS),
+}
+
+# Transfers larger than a command or the buffers of the board are split
+# into back to back commands
+THROUGHPUT_SIZES = {
+    'spi_transfer_bulk': (16, 64, 128, 1024, 8192),
+    'i2c_write_bulk': (32, 256, 1024, 4096),
+    'i2c_read_payload': (1, 16, 64, 128),
+}
+
+THROUGHPUT_COMMANDS = {
+    'spi_transfer_bulk': lambda teensy, size: teensy.spi_transfer_bulk(bytes(size)),
+    'i2c_write_bulk': lambda teensy, size: teensy.i2c_write_bulk(ADDRESS, bytes(size)),
+    'i2c_read_payload': lambda teensy, size: teensy.i2c_read_payload(ADDRESS, REGISTER, size),
+}
+
+
+@contextmanager
+def simulated_device(*, transport='serial', payload_encoding=None, **kwargs):
+    """Yield a function opening a simulated device.
+
+    The keyword arguments are passed to ``TeensyToAnySimulator``, for
+    instance to add ``latency`` and ``jitter``. The simulated firmware
+    accepts the compact payload encodings if one is requested.
+    """
+    if payload_encoding not in (None, 'text'):
+        kwargs.setdefault('payload_encodings', PAYLOAD_ENCODINGS)
+    with TeensyToAnySimulator(**kwargs) as simulator:
+        yield lambda: TeensyToAny(
+            simulator.serial_number, port=simulator.port, transport=transport,
+            payload_encoding=payload_encoding)
+
+
+@contextmanager
+def hardware_device(serial_number=None, *, transport='serial', payload_encoding=None):
+    """Yield a function opening a connected board."""
+    yield lambda: TeensyToAny(
+        serial_number, transport=transport, payload_encoding=payload_encoding)
+
+
+def summarize(samples):
+    """Return the distribution of ``samples``, in seconds, in microseconds."""
+    samples = sorted(sample * 1E6 for sample in samples)
+
+    def percentile(q):
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+    return {
+        'count': len(samples),
+        'mean': statistics.fmean(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'min': samples[0],
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': samples[-1],
+    }
+
+
+def _time_calls(call, repeat):
+    """Return the durations of ``repeat`` calls and the number that raised."""
+    samples = []
+    errors = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            call()
+        except RuntimeError:
+            # Nothing answers on the bus of a bare board, the round trip
+            # is still measured
+            errors += 1
+        samples.append(time.perf_counter() - start)
+    return samples, errors
+
+
+def measure_latency(teensy, repeat):
+    results = {}
+    for name, command in LATENCY_COMMANDS.items():
+        samples, errors = _time_calls(lambda command=command: command(teensy), repeat)
+        results[name] = {**summarize(samples), 'errors': errors}
+    return results
+
+
+def measure_throughput(teensy, repeat, sizes=None):
+    sizes = THROUGHPUT_SIZES if sizes is None else sizes
+    results = {}
+    for name, command in THROUGHPUT_COMMANDS.items():
+        results[name] = {}
+        for size in sizes[name]:
+            samples, errors = _time_calls(
+                lambda command=command, size=size: command(teensy, size), repeat)
+            results[name][str(size)] = {
+                **summarize(samples),
+                'errors': errors,
+                'bytes_per_second': size * len(samples) / sum(samples),
+            }
+    return results
+
+
+def measure_open(open_device, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        teensy = open_device()
+        samples.append(time.perf_counter() - start)
+        teensy.close()
+    return summarize(samples)
+
+
+def measure_host(number):
+    """Return the cost, in microseconds, of encoding, parsing and instrumenting."""
+    payload = list(range(256))
+    response = '0 ' + ' '.join(['0x5a'] * 128)
+    instrumentation = Instrumentation()
+    cases = {
+        'encode i2c_read_uint8': lambda: COMMAND_TEMPLATES['i2c_read_uint8'] % (ADDRESS, REGISTER),
+        'encode payload (256 B)': lambda: encode_payload(payload),
+        'parse response': lambda: TeensyToAny._parse_response(  # pylint: disable=protected-access
+            b'nop\n', '0\n'),
+        'parse payload (128 B)': lambda: decode_payload(
+            TeensyToAny._parse_response(b'', response)),  # pylint: disable=protected-access
+        'instrument command': lambda: instrumentation.record(
+            b'i2c_read_uint8 0x20 0x10\n', '0 0x5a\n', 100E-6),
+    }
+    return {
+        name: min(timeit.repeat(case, number=number, repeat=5)) / number * 1E6
+        for name, case in cases.items()
+    }
+
+
+def run_suite(open_device, *, mode, repeat=200, host_number=10_000, sizes=None):
+    """Run every benchmark and return the results as a JSON compatible dict.
+
+    Parameters
+    ----------
+    open_device: callable
+        Returns a newly opened ``TeensyToAny``.
+
+    mode: str
+        ``'simulated'`` or ``'hardware'``, recorded with the results.
+
+    repeat: int
+        The number of calls measured for each command and payload size.
+
+    host_number: int
+        The number of calls timed for each host side case.
+
+    sizes: dict, optional
+        The payload sizes of each throughput command.
+    """
+    with open_device() as teensy:
+        capabilities = dict(teensy.capabilities)
+        transport = teensy._transport  # pylint: disable=protected-access
+        payload_encoding = teensy.payload_encoding or 'text'
+        teensy.i2c_init()
+        teensy.spi_begin()
+        latency = measure_latency(teensy, repeat)
+        throughput = measure_throughput(teensy, max(1, repeat // 10), sizes)
+    return {
+        'metadata': {
+            'mode': mode,
+            'teensytoany': teensytoany.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'repeat': repeat,
+            'transport': transport,
+            'payload_encoding': payload_encoding,
+            'capabilities': capabilities,
+        },
+        'latency': latency,
+        'throughput': throughput,
+        'open': measure_open(open_device, max(1, repeat // 20)),
+        'host': measure_host(host_number),
+    }
+
+
+def print_results(results):
+    print(f"{'latency':<24} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}  us")
+    for name, stats in results['latency'].items():
+        print(f"{name:<24} {stats['p50']:9.1f} {stats['p90']:9.1f} "
+              f"{stats['p99']:9.1f} {stats['max']:9.1f}")
+    print(f"\n{'throughput':<24} {'bytes':>9} {'p50 us':>9} {'kB/s':>9}")
+    for name, by_size in results['throughput'].items():
+        for size, stats in by_size.items():
+            print(f"{name:<24} {size:>9} {stats['p50']:9.1f} "
+                  f"{stats['bytes_per_second'] / 1E3:9.1f}")
+    print(f"\n{'open':<24} {results['open']['p50']:9.1f} us")
+    print(f"\n{'host':<24}")
+    for name, cost in results['host'].items():
+        print(f"{name:<24} {cost:9.2f} us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hardware', action='store_true',
+                        help='Use a connected board instead of the simulated device.')
+    parser.add_argument('--serial-number', default=None,
+                        help='The board to use with --hardware.')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='Latency, in seconds, of the simulated device.')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='Random latency, in seconds, added by the simulated device.')
+    parser.add_argument('--transport', choices=TeensyToAny.TRANSPORTS, default='serial',
+                        help='How the port is read and written.')
+    parser.add_argument('--payload-encoding', choices=('auto', 'text') + PAYLOAD_ENCODINGS,
+                        default=None,
+                        help='How bulk payloads are encoded, text by default. auto '
+                             'uses the most compact one the firmware supports.')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--output', default=None,
+                        help='Write the results to this JSON file.')
+    args = parser.parse_args()
+
+    if args.hardware:
+        device = hardware_device(
+            args.serial_number, transport=args.transport,
+            payload_encoding=args.payload_encoding)
+    else:
+        device = simulated_device(
+            transport=args.transport, payload_encoding=args.payload_encoding,
+            latency=args.latency, jitter=args.jitter)
+    with device as open_device:
+        results = run_suite(
+            open_device,
+            mode='hardware' if args.hardware else 'simulated',
+            repeat=args.repeat,
+        )
+
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1)
+        print(f"\nResults written to {args.output}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""Compare the per command cost of the serial and threaded transports.
+
+The device is simulated over a pseudo-terminal, so this only runs on
+Linux and macOS::
+
+    python benchmarks/bench_transport.py --commands 2000
+
+"""
+import argparse
+import time
+from unittest import mock
+
+from teensytoany import TeensyToAny
+from teensytoany.tests.fake_device import FakeTeensy
+
+
+def _handler(command):
+    if command == 'version':
+        return '0 0.18.0'
+    if command.startswith('i2c_read_payload'):
+        num_bytes = int(command.split()[-1])
+        return '0 ' + ' '.join(['0x5a'] * num_bytes)
+    return '0'
+
+
+def bench(transport, commands, payload):
+    with FakeTeensy(_handler) as device, mock.patch.object(
+        TeensyToAny, 'device_serial_number_pairs',
+        return_value=[(device.port, 'FAKE')],
+    ):
+        with TeensyToAny(transport=transport) as teensy:
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            for _ in range(commands):
+                if payload:
+                    teensy.i2c_read_payload(0x20, 0x00, payload)
+                else:
+                    teensy.nop()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+    return wall / commands, cpu / commands
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--commands', type=int, default=2000)
+    parser.add_argument(
+        '--payload', type=int, default=0,
+        help='Read this many bytes with i2c_read_payload instead of sending nop.')
+    args = parser.parse_args()
+
+    for transport in TeensyToAny.TRANSPORTS:
+        wall, cpu = bench(transport, args.commands, args.payload)
+        print(f"{transport:>8}: {wall * 1E6:8.1f} us/command wall, "
+              f"{cpu * 1E6:8.1f} us/command CPU")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,52 @@
-"""Top-level package for Python TeensyToAny."""
+"""Top-level package for Python TeensyToAny.
+
+The classes are imported the first time they are used, so that importing the
+package, or running a command line tool that does not need them, does not
+load ``serial``, ``packaging`` or ``asyncio``.
+"""
+from importlib import import_module
+from typing import TYPE_CHECKING
 
 __author__ = 'Ramona Optics'
 __email__ = 'info@ramonaoptics.com'
 from ._version import __version__  # noqa
-from .teensypower import TeensyPower
-from .teensytoany import TeensyToAny
+
+if TYPE_CHECKING:
+    from .async_teensytoany import AsyncTeensyToAny
+    from .broker import TeensyToAnyBroker, TeensyToAnyClient
+    from .fleet import TeensyFleet
+    from .teensypower import TeensyPower
+    from .teensytoany import TeensyToAny
 
 __all__ = [
+    'AsyncTeensyToAny',
+    'TeensyFleet',
     'TeensyToAny',
+    'TeensyToAnyBroker',
+    'TeensyToAnyClient',
     'TeensyPower',
 ]
+
+# The module defining each of the lazily imported names
+_LAZY_IMPORTS = {
+    'AsyncTeensyToAny': '.async_teensytoany',
+    'TeensyFleet': '.fleet',
+    'TeensyToAny': '.teensytoany',
+    'TeensyToAnyBroker': '.broker',
+    'TeensyToAnyClient': '.broker',
+    'TeensyPower': '.teensypower',
+}
+
+
+def __getattr__(name):
+    module = _LAZY_IMPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    # Later lookups find the name directly and skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
@@ -0,0 +1,113 @@
+import heapq
+import threading
+from contextlib import contextmanager
+from itertools import count
+from time import perf_counter
+
+__all__ = []
+
+
+class _FairLock:
+    """A reentrant lock granted by priority, then in order of arrival.
+
+    Threads waiting for the lock are queued and the lock is handed directly
+    to the next thread in the queue when it is released, so that a busy
+    thread cannot starve the others by reacquiring the lock immediately.
+    Waiters with a higher priority are served first.
+
+    The lock keeps statistics about contention that are reported by
+    :meth:`statistics`.
+    """
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._owner = None
+        self._depth = 0
+        self._waiters = []
+        self._tickets = count()
+        self._local = threading.local()
+        self._reset_statistics()
+
+    def _reset_statistics(self):
+        self._acquisitions = 0
+        self._contended = 0
+        self._total_wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._max_queue_depth = 0
+
+    @contextmanager
+    def priority(self, value):
+        """Set the priority used by the calling thread to acquire the lock."""
+        old_value = getattr(self._local, 'priority', 0)
+        self._local.priority = value
+        try:
+            yield
+        finally:
+            self._local.priority = old_value
+
+    def acquire(self, priority=None):
+        if priority is None:
+            priority = getattr(self._local, 'priority', 0)
+        ident = threading.get_ident()
+        with self._mutex:
+            if self._owner == ident:
+                self._depth += 1
+                return
+            self._acquisitions += 1
+            if self._owner is None and not self._waiters:
+                self._owner = ident
+                self._depth = 1
+                return
+            event = threading.Event()
+            heapq.heappush(
+                self._waiters, (-priority, next(self._tickets), ident, event))
+            self._contended += 1
+            self._max_queue_depth = max(self._max_queue_depth, len(self._waiters))
+
+        start = perf_counter()
+        event.wait()
+        waited = perf_counter() - start
+        with self._mutex:
+            self._total_wait_time += waited
+            self._max_wait_time = max(self._max_wait_time, waited)
+
+    def release(self):
+        with self._mutex:
+            if self._owner != threading.get_ident():
+                raise RuntimeError("Cannot release a lock owned by another thread.")
+            self._depth -= 1
+            if self._depth:
+                return
+            if self._waiters:
+                _, _, ident, event = heapq.heappop(self._waiters)
+                self._owner = ident
+                self._depth = 1
+                event.set()
+            else:
+                self._owner = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def statistics(self, *, reset=False):
+        with self._mutex:
+            statistics = {
+                'queue_depth': len(self._waiters),
+                'max_queue_depth': self._max_queue_depth,
+                'acquisitions': self._acquisitions,
+                'contended_acquisitions': self._contended,
+                'total_wait_time': self._total_wait_time,
+                'max_wait_time': self._max_wait_time,
+                'mean_wait_time': (
+                    self._total_wait_time / self._contended
+                    if self._contended else 0.0
+                ),
+            }
+            if reset:
+                self._reset_statistics()
+        return statistics
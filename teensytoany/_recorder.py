@@ -0,0 +1,91 @@
+# pylint: disable=protected-access
+from contextlib import nullcontext
+from types import FunctionType, MethodType
+
+__all__ = []
+
+
+class _CommandCaptured(BaseException):
+    """Raised by the recorder when a method needs a response it doesn't have.
+
+    This derives from ``BaseException`` so that ``except Exception`` clauses
+    in the methods being recorded don't swallow it.
+    """
+
+    def __init__(self, command, timeout):
+        super().__init__(command)
+        self.command = command
+        self.timeout = timeout
+
+
+class _CommandRecorder:
+    """Run a ``TeensyToAny`` method without touching the serial port.
+
+    The recorder stands in for ``self`` when calling a method of the device
+    class. Calls to ``_ask`` are answered from ``responses`` in order; the
+    first call that has no response left raises ``_CommandCaptured`` with the
+    command that would have been written.
+
+    Replaying the same method with one more response each time lets callers
+    that own the transport (pipelines, asynchronous clients) send the
+    commands themselves while reusing the argument formatting and response
+    parsing of the synchronous methods.
+    """
+
+    def __init__(self, teensy, responses=(), cls=None):
+        self._teensy = teensy
+        self._cls = type(teensy) if cls is None else cls
+        self._responses = list(responses)
+        self._index = 0
+        self._timeout = teensy._timeout
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._timeout = value
+
+    def locked(self):
+        # Whoever replays the method is responsible for any locking
+        return nullcontext()
+
+    def _ask(self, data, **kwargs):  # pylint: disable=unused-argument
+        if self._index < len(self._responses):
+            returned = self._responses[self._index]
+            self._index += 1
+            return self._cls._parse_response(data, returned)
+        if not isinstance(data, str):
+            # Don't hold on to a buffer the caller may reuse
+            data = bytes(data)
+        raise _CommandCaptured(data, self._timeout)
+
+    def _ask_many(self, commands):
+        # Replayed one command at a time
+        return [self._ask(command) for command in commands]
+
+    def __getattr__(self, name):
+        value = getattr(self._cls, name, None)
+        if isinstance(value, FunctionType):
+            return MethodType(value, self)
+        if isinstance(value, property):
+            return value.__get__(self)
+        return getattr(self._teensy, name)
+
+
+def _record_command(teensy, function, args, kwargs, *, responses=(), cls=None):
+    """Return the next command ``function`` would send, or ``None`` if done.
+
+    When the method completes with the provided ``responses`` its return
+    value is stored in the second element of the returned tuple.
+
+    ``cls`` is the class whose methods ``function`` calls on ``self``, it
+    defaults to the class of ``teensy``.
+    """
+    recorder = _CommandRecorder(teensy, responses, cls=cls)
+    try:
+        result = function(recorder, *args, **kwargs)
+    except _CommandCaptured as captured:
+        return captured, None
+    return None, result
@@ -0,0 +1,405 @@
+# pylint: disable=protected-access,no-member
+import asyncio
+import os
+from collections import deque
+from functools import update_wrapper
+from types import FunctionType
+
+from serial import Serial
+
+from ._recorder import _record_command
+from .teensytoany import _RESYNC_MAX_LINES, TeensyToAny
+
+__all__ = ['AsyncTeensyToAny']
+
+
+class _Slot:  # pylint: disable=too-few-public-methods
+    """A command waiting for its response line."""
+    __slots__ = ('future', 'size', 'timer')
+
+    def __init__(self, future, size):
+        self.future = future
+        # The bytes the command occupies in the input buffer of the device
+        self.size = size
+        # Expires the slot once the timeout of the command has elapsed
+        self.timer = None
+
+    def release(self, line):
+        if self.timer is not None:
+            self.timer.cancel()
+        if not self.future.done():
+            self.future.set_result(line)
+
+
+class AsyncTeensyToAny:
+    """Control a TeensyToAny device from an asyncio event loop.
+
+    The commands of :class:`TeensyToAny` are available as coroutines with the
+    same names and arguments. The serial port is read and written without
+    blocking, so a single event loop can drive many devices concurrently::
+
+        async with AsyncTeensyToAny(serial_number) as teensy:
+            await teensy.gpio_pin_mode(13, 'OUTPUT')
+            value = await teensy.i2c_read_uint8(0x20, 0x0F)
+
+    Commands issued concurrently from several tasks are written back to back
+    and their responses are matched in order. At most ``INPUT_BUFFER_SIZE``
+    unanswered bytes are sent to the device at any time. As with
+    :class:`TeensyToAny`, the responses that arrive after their command
+    timed out are discarded, resynchronizing the device before the next
+    command if needed.
+
+    This class relies on ``loop.add_reader`` with the file descriptor of the
+    serial port, and therefore does not support Windows.
+    """
+    INPUT_BUFFER_SIZE = TeensyToAny.INPUT_BUFFER_SIZE
+
+    def __init__(
+        self,
+        serial_number=None, *,
+        baudrate=115200,
+        timeout=0.205,
+        device_name='TeensyToAny',
+        payload_encoding=None,
+    ):
+        """Create the device, it must then be opened with :meth:`open`.
+
+        The parameters have the same meaning as those of :class:`TeensyToAny`.
+        """
+        self._requested_serial_number = serial_number
+        self._baudrate = baudrate
+        self._timeout = timeout
+        self._device_name = device_name
+        self._serial = None
+        self._fd = None
+        self._loop = None
+        self._buffer = bytearray()
+        # The slots of the commands waiting for a response, in order
+        self._pending = deque()
+        self._in_flight_bytes = 0
+        # Responses of commands that timed out that may still arrive, after
+        # those of the pending commands, see _resynchronize
+        self._unanswered = 0
+        # Receives the lines read while resynchronizing
+        self._resync_lines = None
+        self._resync_statistics = {'resyncs': 0, 'failures': 0, 'discarded_lines': 0}
+        self._write_lock = None
+        self._space_available = None
+        self.serial_number = None
+        self._version = None
+        self._capabilities = None
+        self._requested_payload_encoding = payload_encoding
+        self._payload_encoding = None
+
+    async def open(self):
+        try:
+            await self._open()
+        except Exception as e:
+            self.close()
+            raise e
+
+    async def _open(self):
+        if self._requested_serial_number is None:
+            serial_numbers = None
+        else:
+            serial_numbers = [self._requested_serial_number]
+
+        # Finding the device scans the USB devices, which blocks
+        pairs = await asyncio.to_thread(
+            TeensyToAny.device_serial_number_pairs,
+            serial_numbers=serial_numbers, device_name=self._device_name)
+        port, found_serial_number = pairs[0]
+
+        self._loop = asyncio.get_running_loop()
+        self._write_lock = asyncio.Lock()
+        self._space_available = asyncio.Event()
+        # pyserial configures the port, we only use its file descriptor,
+        # which it opens in non blocking mode.
+        self._serial = Serial(port=port, baudrate=self._baudrate, timeout=0)
+        self._serial.reset_output_buffer()
+        self._serial.reset_input_buffer()
+        self._fd = self._serial.fileno()
+        self._loop.add_reader(self._fd, self._on_readable)
+        self.serial_number = found_serial_number
+
+        response_version = await self._ask("version")
+        TeensyToAny._validate_version(response_version)
+        self._version = response_version
+
+        commands = TeensyToAny._capability_probes(
+            self._version, self._requested_payload_encoding)
+        responses = await asyncio.gather(
+            *[self._ask(command) for command in commands],
+            return_exceptions=True,
+        )
+        probed = {
+            command: None if isinstance(response, Exception) else response
+            for command, response in zip(commands, responses)
+        }
+        self._capabilities = TeensyToAny._build_capabilities(self._version, probed)
+        self._payload_encoding = TeensyToAny._negotiate_payload_encoding(
+            self._capabilities, self._requested_payload_encoding)
+
+    def close(self):
+        self.serial_number = None
+        self._version = None
+        self._capabilities = None
+        self._payload_encoding = None
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+        self._fd = None
+        self._fail_pending(RuntimeError("The device was closed."))
+        self._in_flight_bytes = 0
+        self._unanswered = 0
+        self._buffer.clear()
+        if self._serial is not None:
+            self._serial.close()
+        self._serial = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def capabilities(self):
+        """The features of the connected firmware, see :attr:`TeensyToAny.capabilities`."""
+        return self._capabilities
+
+    @property
+    def payload_encoding(self):
+        """The encoding of bulk payloads, see :attr:`TeensyToAny.payload_encoding`."""
+        return self._payload_encoding
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._timeout = value
+
+    def resync_statistics(self, *, reset=False):
+        """Report how often the device was resynchronized after timeouts.
+
+        See :meth:`TeensyToAny.resync_statistics`.
+        """
+        return TeensyToAny.resync_statistics(self, reset=reset)
+
+    async def resynchronize(self):
+        """Discard responses that arrived after their command timed out.
+
+        See :meth:`TeensyToAny.resynchronize`.
+        """
+        async with self._write_lock:
+            return await self._resynchronize()
+
+    def _fail_pending(self, exception):
+        while self._pending:
+            slot = self._pending.popleft()
+            if slot.timer is not None:
+                slot.timer.cancel()
+            if not slot.future.done():
+                slot.future.set_exception(exception)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self._loop.remove_reader(self._fd)
+            self._fail_pending(e)
+            return
+
+        self._buffer += data
+        while True:
+            index = self._buffer.find(b'\n')
+            if index < 0:
+                break
+            line = bytes(self._buffer[:index + 1])
+            del self._buffer[:index + 1]
+            if self._pending:
+                slot = self._pending.popleft()
+                self._in_flight_bytes -= slot.size
+                self._space_available.set()
+                slot.release(line.decode())
+            elif self._resync_lines is not None:
+                self._resync_lines.put_nowait(line)
+            elif self._unanswered:
+                # The late response of a command that timed out. No command
+                # is written until these are read or resynchronized, so it
+                # cannot be the response of another command.
+                self._unanswered -= 1
+                self._resync_statistics['discarded_lines'] += 1
+
+    def _expire(self, slot):
+        """Give up on the response of a command and of those sent after it."""
+        try:
+            index = self._pending.index(slot)
+        except ValueError:
+            return
+        # If the response never arrives, the responses of the commands sent
+        # after it would be matched to the wrong commands, so none of them
+        # are trusted.
+        expired = [self._pending.pop() for _ in range(len(self._pending) - index)]
+        self._unanswered += len(expired)
+        for expired_slot in reversed(expired):
+            self._in_flight_bytes -= expired_slot.size
+            expired_slot.release('')
+        self._space_available.set()
+
+    async def _resynchronize(self):
+        """Read stale responses until the device answers a marker command.
+
+        This is :meth:`TeensyToAny._resynchronize`, for the event loop. It
+        must be called while holding the write lock.
+        """
+        if self._fd is None or self._version is None:
+            # Still opening, the version handshake fails on its own
+            return False
+        self._resync_statistics['resyncs'] += 1
+        # Once the commands in flight are answered or time out, the lines
+        # read are the stale responses followed by the marker
+        waiting = [slot.future for slot in self._pending if not slot.future.done()]
+        if waiting:
+            await asyncio.wait(waiting)
+        marker = f"0 {self._version}".encode()
+        self._resync_lines = lines = asyncio.Queue()
+        synchronized = False
+        try:
+            await self._write(b'version\n')
+            self._unanswered += 1
+            for _ in range(_RESYNC_MAX_LINES):
+                try:
+                    line = await asyncio.wait_for(lines.get(), self._timeout)
+                except asyncio.TimeoutError:
+                    break
+                synchronized = TeensyToAny._count_resync_line(self, line, marker)
+                if synchronized and self._unanswered <= 0:
+                    break
+        finally:
+            self._resync_lines = None
+        return TeensyToAny._end_resync(self, synchronized)
+
+    async def _write(self, data) -> None:
+        view = memoryview(data)
+        while view:
+            try:
+                written = os.write(self._fd, view)
+            except BlockingIOError:
+                written = 0
+            view = view[written:]
+            if view:
+                writable = self._loop.create_future()
+                self._loop.add_writer(self._fd, writable.set_result, None)
+                try:
+                    await writable
+                finally:
+                    self._loop.remove_writer(self._fd)
+
+    async def _ask(self, data, *, timeout=None) -> str:
+        returned = await self._ask_raw(data, timeout=timeout)
+        return TeensyToAny._parse_response(data, returned)
+
+    async def _ask_raw(self, data, *, timeout=None) -> str:
+        """Send a command and return its response line, empty on timeout."""
+        if self._fd is None:
+            raise RuntimeError("Device must be opened first")
+        if isinstance(data, str):
+            encoded = (data + '\n').encode('utf-8')
+        else:
+            encoded = bytes(data)
+        if timeout is None:
+            timeout = self._timeout
+
+        async with self._write_lock:
+            if self._unanswered and not await self._resynchronize():
+                raise RuntimeError(
+                    f"Failed to resynchronize after a timeout, before command: {data}")
+            while (self._in_flight_bytes and
+                   self._in_flight_bytes + len(encoded) > self.INPUT_BUFFER_SIZE):
+                self._space_available.clear()
+                await self._space_available.wait()
+            slot = _Slot(self._loop.create_future(), len(encoded))
+            self._pending.append(slot)
+            self._in_flight_bytes += len(encoded)
+            await self._write(encoded)
+            if timeout is not None and not slot.future.done():
+                slot.timer = self._loop.call_later(timeout, self._expire, slot)
+
+        return await slot.future
+
+    async def _call(self, function, args, kwargs):
+        # Replay the synchronous method, answering one more of its commands
+        # each time, until it completes.
+        responses = []
+        while True:
+            captured, result = _record_command(
+                self, function, args, kwargs, responses=responses, cls=TeensyToAny)
+            if captured is None:
+                return result
+            returned = await self._ask_raw(captured.command, timeout=captured.timeout)
+            responses.append(returned)
+
+    async def i2c_write_bulk(self, address: int, data):
+        """Write large amounts of data to the I2C device in chunks."""
+        if len(data) > 8192:
+            raise ValueError("Data size exceeds maximum of 8192 bytes")
+
+        buffer_size = self._capabilities['i2c_buffer_size'] or await self.i2c_buffer_size()
+        await self.i2c_begin_transaction(address)
+        try:
+            for i in range(0, len(data), buffer_size):
+                await self.i2c_write(data[i:i + buffer_size])
+        finally:
+            await self.i2c_end_transaction()
+
+    async def i2c_1_write_bulk(self, address: int, data):
+        """Write large amounts of data to the I2C_1 device in chunks."""
+        if len(data) > 8192:
+            raise ValueError("Data size exceeds maximum of 8192 bytes")
+
+        buffer_size = self._capabilities['i2c_1_buffer_size'] or await self.i2c_1_buffer_size()
+        await self.i2c_1_begin_transaction(address)
+        try:
+            for i in range(0, len(data), buffer_size):
+                await self.i2c_1_write(data[i:i + buffer_size])
+        finally:
+            await self.i2c_1_end_transaction()
+
+
+# Methods of TeensyToAny that manage the connection or the threads sharing
+# it rather than send commands
+_NOT_COMMANDS = {
+    'open',
+    'close',
+    'pipeline',
+    'increased_timeout',
+    'locked',
+    'priority',
+    'lock_statistics',
+    'stats',
+}
+
+
+def _make_command(function):
+    async def command(self, *args, **kwargs):
+        return await self._call(function, args, kwargs)
+    update_wrapper(command, function)
+    return command
+
+
+for _name, _function in vars(TeensyToAny).items():
+    if (_name.startswith('_') or _name in _NOT_COMMANDS or
+            not isinstance(_function, FunctionType) or
+            hasattr(AsyncTeensyToAny, _name)):
+        continue
+    setattr(AsyncTeensyToAny, _name, _make_command(_function))
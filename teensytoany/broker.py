@@ -0,0 +1,609 @@
+"""Share TeensyToAny devices between processes.
+
+Only one process at a time can open the serial port of a device. The broker
+keeps the ports open and accepts commands from any number of clients over a
+Unix domain socket::
+
+    $ teensytoany serve --serial-number 12345
+
+Clients connect with :class:`TeensyToAnyClient`, which has the same methods
+as :class:`~teensytoany.TeensyToAny`::
+
+    from teensytoany import TeensyToAnyClient
+
+    with TeensyToAnyClient('12345') as teensy:
+        teensy.gpio_digital_write(13, 1)
+
+Connecting to the broker skips the port enumeration and the handshake with
+the firmware, whose version and capabilities are answered by the broker.
+
+Each device is served by a single thread that writes the commands of all the
+clients back to back, keeping up to ``INPUT_BUFFER_SIZE`` bytes unanswered as
+:meth:`~teensytoany.TeensyToAny.pipeline` does, and returns every response
+to the client that sent the command. Commands of different clients are
+therefore pipelined instead of each waiting for the others' round trips,
+while the commands of each client are still executed in order.
+
+Protocol
+--------
+Clients send the same lines as they would to the firmware and receive one
+line per command. An empty line means that the device did not respond in
+time. Lines starting with ``#`` are handled by the broker:
+
+``#open [serial_number]``
+    The first line of every connection. It selects the device, which is
+    opened if needed, and is answered with ``0 <serial_number>`` or an error
+    code followed by a message.
+
+``#timeout <seconds>``
+    How long to wait for the responses to the following commands, ``None``
+    to wait forever. It is not answered.
+"""
+# pylint: disable=protected-access
+import errno
+import getpass
+import os
+import queue
+import socket
+import stat
+import tempfile
+import threading
+from collections import deque, namedtuple
+
+from serial import LF, SerialException
+
+from .teensytoany import TeensyToAny
+
+__all__ = [
+    'TeensyToAnyBroker',
+    'TeensyToAnyClient',
+    'default_socket_path',
+]
+
+# Sent by the broker in place of the response of a command that timed out
+_NO_RESPONSE = b'\n'
+# How long, in seconds, clients wait for the broker beyond the timeout of a
+# command, as the commands of other clients may be answered first
+_BROKER_GRACE_PERIOD = 30
+_STOP = object()
+
+_Request = namedtuple('_Request', ['connection', 'line', 'timeout', 'response'])
+
+
+def default_socket_path():
+    """The socket used by the broker and its clients when none is specified.
+
+    It is ``teensytoany.sock`` in ``$XDG_RUNTIME_DIR`` if it is defined,
+    otherwise a file named after the user in the temporary directory.
+    """
+    runtime_directory = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_directory:
+        return os.path.join(runtime_directory, 'teensytoany.sock')
+    return os.path.join(
+        tempfile.gettempdir(), f'teensytoany-{getpass.getuser()}.sock')
+
+
+def _send(connection, data):
+    try:
+        connection.sendall(data)
+    except OSError:
+        # The client is gone, the response is no longer needed
+        pass
+
+
+class _DeviceWorker:
+    """Forward the commands of every client to one device, in order."""
+
+    def __init__(self, teensy):
+        self.teensy = teensy
+        self.failed = False
+        self._requests = queue.Queue()
+        self._in_flight = deque()
+        self._bytes_in_flight = 0
+        # A request that did not fit in the input buffer of the device
+        self._next = None
+        self._stopping = False
+        # Queries that were answered when the device was opened
+        capabilities = teensy.capabilities
+        self._cached = {b'version\n': f'0 {teensy.version}\n'.encode('utf-8')}
+        for name in teensy._PROBED_CAPABILITIES:
+            value = capabilities[name]
+            if isinstance(value, tuple):
+                # Clients read an empty list of encodings as none supported
+                value = ' '.join(value)
+            if value is not None:
+                self._cached[f'{name}\n'.encode('utf-8')] = (
+                    f'0 {value}'.rstrip().encode('utf-8') + b'\n')
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f'TeensyToAny broker {teensy.serial_number}',
+            daemon=True,
+        )
+        self._thread.start()
+
+    def submit(self, connection, line, timeout):
+        self._requests.put(_Request(connection, line, timeout, self._cached.get(line)))
+
+    def close(self):
+        self._requests.put(_STOP)
+        self._thread.join()
+        self.teensy.close()
+
+    def _run(self):
+        try:
+            self._forward()
+        except (SerialException, OSError):
+            self.failed = True
+            # Nothing else can be sent, answer everybody that is still waiting
+            while self._in_flight:
+                _send(self._in_flight.popleft().connection, _NO_RESPONSE)
+            if self._next is not None:
+                _send(self._next.connection, _NO_RESPONSE)
+                self._next = None
+            while not self._stopping:
+                request = self._requests.get()
+                if request is _STOP:
+                    self._stopping = True
+                else:
+                    _send(request.connection, _NO_RESPONSE)
+
+    def _forward(self):
+        serial = self.teensy._serial
+        max_bytes_in_flight = self.teensy.INPUT_BUFFER_SIZE
+        while True:
+            batch = self._gather(max_bytes_in_flight)
+            if batch and self.teensy._unanswered and not self.teensy._resynchronize():
+                # As in TeensyToAny._exchange, nothing is written while the
+                # device may still answer earlier commands
+                while self._in_flight:
+                    request = self._in_flight.popleft()
+                    _send(request.connection, request.response or _NO_RESPONSE)
+                self._bytes_in_flight = 0
+                continue
+            if batch:
+                serial.write(batch)
+            if not self._in_flight:
+                return
+
+            # Requests stay in flight until they are answered, so that they
+            # are answered by _run if the device fails
+            oldest = self._in_flight[0]
+            if oldest.response is not None:
+                self._in_flight.popleft()
+                _send(oldest.connection, oldest.response)
+                continue
+            if serial.timeout != oldest.timeout:
+                serial.timeout = oldest.timeout
+            returned = serial.read_until(LF)
+            self._in_flight.popleft()
+            self._bytes_in_flight -= len(oldest.line)
+            if returned[-1:] == LF:
+                _send(oldest.connection, returned)
+                continue
+
+            # Without a response we no longer know which line belongs to which
+            # command, so none of the commands in flight are answered.
+            _send(oldest.connection, _NO_RESPONSE)
+            unanswered = 1
+            while self._in_flight:
+                request = self._in_flight.popleft()
+                unanswered += request.response is None
+                _send(request.connection, _NO_RESPONSE)
+            self._bytes_in_flight = 0
+            # Drop the responses that may still arrive for these commands
+            self.teensy._unanswered += unanswered
+            self.teensy._resynchronize()
+
+    def _gather(self, max_bytes_in_flight):
+        """Return every queued command that fits in the input buffer of the device.
+
+        This only blocks when no command is waiting for its response.
+        """
+        batch = []
+        while not self._stopping:
+            request = self._next
+            if request is None:
+                try:
+                    request = self._requests.get(block=not self._in_flight)
+                except queue.Empty:
+                    break
+            self._next = None
+            if request is _STOP:
+                self._stopping = True
+                break
+            if request.response is None:
+                size = len(request.line)
+                if self._in_flight and self._bytes_in_flight + size > max_bytes_in_flight:
+                    self._next = request
+                    break
+                batch.append(request.line)
+                self._bytes_in_flight += size
+            self._in_flight.append(request)
+        return b''.join(batch)
+
+
+class TeensyToAnyBroker:
+    """Serve TeensyToAny devices to many processes over a Unix domain socket.
+
+    Parameters
+    ----------
+    socket_path: str, optional
+        The path of the socket, :func:`default_socket_path` by default.
+
+    serial_numbers: list of str, optional
+        The devices to open when the broker starts. Other devices are opened
+        the first time a client asks for them. Clients that do not specify a
+        serial number are served the first of these devices, or the first
+        device found.
+
+    timeout: float
+        The default time to wait for the response of each command.
+
+    transport: str
+        The transport used to open the devices, see
+        :class:`~teensytoany.TeensyToAny`.
+
+    poll_interval: float
+        How often, in seconds, the threads of the broker check whether it was
+        closed.
+    """
+
+    def __init__(
+        self,
+        socket_path=None,
+        serial_numbers=None,
+        *,
+        timeout=0.205,
+        transport='serial',
+        poll_interval=0.1,
+    ):
+        if socket_path is None:
+            socket_path = default_socket_path()
+        self.socket_path = socket_path
+        self._serial_numbers = list(serial_numbers or [])
+        self._timeout = timeout
+        self._transport = transport
+        self._poll_interval = poll_interval
+        self._workers = {}
+        self._default_serial_number = None
+        self._workers_lock = threading.Lock()
+        self._server = None
+        self._closing = threading.Event()
+        self._accept_thread = None
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def serial_numbers(self):
+        """The serial numbers of the devices currently opened by the broker."""
+        with self._workers_lock:
+            return list(self._workers)
+
+    def open(self):
+        """Open the requested devices and start accepting clients."""
+        try:
+            for serial_number in self._serial_numbers:
+                self._get_worker(serial_number)
+            self._remove_stale_socket()
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            server.bind(self.socket_path)
+        except Exception:
+            self._close_workers()
+            raise
+        server.settimeout(self._poll_interval)
+        server.listen()
+        self._server = server
+        self._closing.clear()
+        self._accept_thread = threading.Thread(
+            target=self._accept, name='TeensyToAny broker', daemon=True)
+        self._accept_thread.start()
+
+    def serve_forever(self):
+        """Serve the clients until the broker is closed or interrupted."""
+        if self._server is None:
+            self.open()
+        try:
+            while self._accept_thread.is_alive():
+                self._accept_thread.join(self._poll_interval)
+        finally:
+            self.close()
+
+    def close(self):
+        """Disconnect the clients, close the devices and remove the socket."""
+        if self._server is None:
+            return
+        self._closing.set()
+        self._accept_thread.join()
+        self._server.close()
+        self._server = None
+        with self._connections_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._close_workers()
+        try:
+            os.unlink(self.socket_path)
+        except OSError:
+            pass
+
+    def _close_workers(self):
+        with self._workers_lock:
+            workers = list(self._workers.values())
+            self._workers.clear()
+            self._default_serial_number = None
+        for worker in workers:
+            worker.close()
+
+    def _remove_stale_socket(self):
+        try:
+            mode = os.lstat(self.socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise RuntimeError(
+                f"{self.socket_path} exists and is not a socket, "
+                "choose another path for the broker.")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                # Left behind by a broker that did not exit cleanly
+                os.unlink(self.socket_path)
+                return
+        raise RuntimeError(
+            f"Another broker is already serving on {self.socket_path}.")
+
+    def _get_worker(self, serial_number):
+        with self._workers_lock:
+            if serial_number is None:
+                serial_number = self._default_serial_number
+            worker = self._workers.get(serial_number)
+            if worker is not None and not worker.failed:
+                return worker
+            if worker is not None:
+                del self._workers[serial_number]
+                worker.close()
+
+            teensy = TeensyToAny(
+                serial_number, timeout=self._timeout, transport=self._transport)
+            worker = _DeviceWorker(teensy)
+            self._workers[teensy.serial_number] = worker
+            if self._default_serial_number is None:
+                self._default_serial_number = teensy.serial_number
+            return worker
+
+    def _accept(self):
+        while not self._closing.is_set():
+            try:
+                connection, _ = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            connection.settimeout(None)
+            with self._connections_lock:
+                self._connections.add(connection)
+            threading.Thread(
+                target=self._serve_client,
+                args=(connection,),
+                name='TeensyToAny broker client',
+                daemon=True,
+            ).start()
+
+    def _open_device(self, connection, hello):
+        command, _, serial_number = hello.decode('utf-8').strip().partition(' ')
+        if command != '#open':
+            _send(connection, f'{errno.EPROTO} Expected #open\n'.encode('utf-8'))
+            return None
+        try:
+            worker = self._get_worker(serial_number or None)
+        except Exception as e:  # pylint: disable=broad-except
+            message = str(e).replace('\n', ' ')
+            _send(connection, f'{errno.ENODEV} {message}\n'.encode('utf-8'))
+            return None
+        _send(connection, f'0 {worker.teensy.serial_number}\n'.encode('utf-8'))
+        return worker
+
+    def _serve_client(self, connection):
+        try:
+            with connection.makefile('rb') as lines:
+                worker = self._open_device(connection, lines.readline())
+                if worker is None:
+                    return
+                timeout = self._timeout
+                for line in lines:
+                    if line[-1:] != LF:
+                        # Disconnected in the middle of a command
+                        break
+                    if line.startswith(b'#timeout '):
+                        value = line.split()[1]
+                        timeout = None if value == b'None' else float(value)
+                        continue
+                    worker.submit(connection, line, timeout)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._connections_lock:
+                self._connections.discard(connection)
+            connection.close()
+
+
+class _BrokerConnection:
+    """The transport of :class:`TeensyToAnyClient`.
+
+    It implements the subset of the ``serial.Serial`` interface used by
+    :class:`~teensytoany.TeensyToAny`.
+    """
+
+    def __init__(self, socket_path, timeout):
+        self.port = socket_path
+        self._timeout = timeout
+        self._buffer = bytearray()
+        # Commands sent, but not yet answered by the broker
+        self._unanswered = 0
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._apply_timeout()
+        try:
+            self._socket.connect(socket_path)
+        except OSError as e:
+            self._socket.close()
+            raise RuntimeError(
+                f"Could not connect to the TeensyToAny broker at {socket_path}: {e}"
+            ) from e
+
+    def open_device(self, serial_number):
+        """Ask the broker for a device and return its serial number."""
+        self._socket.sendall(f"#open {serial_number or ''}\n".encode('utf-8'))
+        self._unanswered += 1
+        response = self.read_until(LF).decode('utf-8').strip()
+        error, _, message = response.partition(' ')
+        if error != '0':
+            raise RuntimeError(f"The broker could not open the device: {message}")
+        self._send_timeout()
+        return message
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._timeout = value
+        self._apply_timeout()
+        self._send_timeout()
+
+    def _apply_timeout(self):
+        # The broker answers every command once its timeout expires, so it
+        # only stops answering if it is stuck
+        self._socket.settimeout(
+            None if self._timeout is None else self._timeout + _BROKER_GRACE_PERIOD)
+
+    def _send_timeout(self):
+        self._socket.sendall(f'#timeout {self._timeout}\n'.encode('utf-8'))
+
+    def write(self, data):
+        self._socket.sendall(data)
+        self._unanswered += data.count(LF)
+        return len(data)
+
+    def read_until(self, expected=LF, size=None):
+        """Return the next response, or ``b''`` if the device did not respond.
+
+        The broker answers every command, even those that time out, so this
+        waits for as long as it takes for the broker to answer, unless it does
+        not answer for ``_BROKER_GRACE_PERIOD`` seconds beyond the timeout.
+        """
+        if expected != LF:
+            raise ValueError("Only LF terminated lines are supported.")
+        while True:
+            end = self._buffer.find(LF)
+            if end >= 0:
+                end += 1
+                break
+            try:
+                data = self._socket.recv(65536)
+            except socket.timeout as e:
+                # The responses that may still arrive can no longer be matched
+                # to their commands
+                self.close()
+                raise RuntimeError("The TeensyToAny broker did not answer in time.") from e
+            if not data:
+                raise RuntimeError("The TeensyToAny broker closed the connection.")
+            self._buffer += data
+        if size is not None and end > size:
+            end = size
+        else:
+            self._unanswered -= 1
+        line = bytes(self._buffer[:end])
+        del self._buffer[:end]
+        if line == _NO_RESPONSE:
+            return b''
+        return line
+
+    def reset_input_buffer(self):
+        # Responses are never lost, wait for those that are still expected
+        while self._unanswered > 0:
+            self.read_until(LF)
+        self._buffer.clear()
+
+    def reset_output_buffer(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._socket.close()
+
+
+class TeensyToAnyClient(TeensyToAny):
+    """Control a device shared by a :class:`TeensyToAnyBroker`.
+
+    The client has the same methods as :class:`~teensytoany.TeensyToAny`, but
+    sends its commands through the broker instead of opening the serial port.
+    Methods that program the firmware must be used without the broker since
+    it keeps the port open.
+
+    Parameters
+    ----------
+    serial_number: optional
+        The device to control. If not provided, the default device of the
+        broker is used.
+
+    socket_path: str, optional
+        The socket of the broker, :func:`default_socket_path` by default.
+
+    timeout: float
+        Timeout before reading a command fails. It is enforced by the broker.
+
+    open, device_name, thread_safe:
+        See :class:`~teensytoany.TeensyToAny`.
+    """
+    TRANSPORTS = ('broker',)
+
+    def __init__(
+        self,
+        serial_number=None, *,
+        socket_path=None,
+        timeout=0.205,
+        open=True,  # pylint: disable=redefined-builtin
+        device_name='TeensyToAny',
+        thread_safe=False,
+    ):
+        if socket_path is None:
+            socket_path = default_socket_path()
+        self._socket_path = socket_path
+        super().__init__(
+            serial_number,
+            timeout=timeout,
+            open=open,
+            device_name=device_name,
+            thread_safe=thread_safe,
+            transport='broker',
+        )
+
+    def _resynchronize(self):
+        # The broker answers every command, even those that time out, and
+        # resynchronizes the device itself
+        self._unanswered = 0
+        return True
+
+    def _connect(self):
+        connection = _BrokerConnection(self._socket_path, self._timeout)
+        try:
+            self.serial_number = connection.open_device(self._requested_serial_number)
+        except Exception:
+            connection.close()
+            raise
+        self._serial = connection
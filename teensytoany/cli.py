@@ -1,9 +1,12 @@
+"""The ``teensytoany`` command.
+
+Each subcommand imports what it needs when it runs, so that short commands
+such as ``teensytoany list`` do not pay for loading the others.
+"""
+# pylint: disable=import-outside-toplevel
 import click
 
 import teensytoany
-from teensytoany.i2c_scan import i2c_scan
-from teensytoany.list import teensytoany_list
-from teensytoany.programmer import teensytoany_programmer
 
 
 @click.group(epilog=f"Version {teensytoany.__version__}")
@@ -15,13 +18,27 @@ def teensytoany_cli():
 @teensytoany_cli.command()
 @click.option(
     '--serial-number',
-    default=None,
+    multiple=True,
     help=(
         'Serial number of the Teensy device to program. '
         'If not provided and only one Teensy device found, '
-        'it will be programmed.'
+        'it will be programmed. May be repeated to program many devices '
+        'in parallel.'
     )
 )
+@click.option(
+    '--all', 'all_devices',
+    is_flag=True,
+    default=False,
+    help='Program every connected TeensyToAny device in parallel.'
+)
+@click.option(
+    '--jobs', '-j',
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help='Maximum number of devices programmed at the same time.'
+)
 @click.option(
     '--mcu',
     type=click.Choice(['TEENSY40', 'TEENSY32']),
@@ -47,20 +64,28 @@ def teensytoany_cli():
     help='Download the firmware only, do not program the device.'
 )
 def programmer(
-    serial_number=None,
+    serial_number=(),
     mcu='TEENSY40',
     firmware_version=None,
     firmware_variant=None,
-    download_only=False
+    download_only=False,
+    *,
+    all_devices=False,
+    jobs=4,
 ):
     """Program a Teensy device with a given firmware version"""
+    from teensytoany.programmer import teensytoany_programmer
+
     # pylint: disable=duplicate-code
     teensytoany_programmer(
-        serial_number=serial_number,
+        serial_number=serial_number[0] if len(serial_number) == 1 else None,
         mcu=mcu,
         firmware_version=firmware_version,
         firmware_variant=firmware_variant,
-        download_only=download_only
+        download_only=download_only,
+        serial_numbers=serial_number if len(serial_number) > 1 else None,
+        all_devices=all_devices,
+        jobs=jobs,
     )
 
 
@@ -111,6 +136,8 @@ def i2c_scan_command(
     verbose=False,
 ):
     """Scan I2C devices connected to TeensyToAny"""
+    from teensytoany.i2c_scan import i2c_scan
+
     # pylint: disable=duplicate-code
     i2c_scan(
         serial_number=serial_number,
@@ -143,11 +170,99 @@ def list_command(
     teensyduino=False,
 ):
     """List available TeensyToAny devices"""
+    from teensytoany.list import teensytoany_list
+
     teensytoany_list(
         manufacturer=manufacturer,
         teensyduino=teensyduino,
     )
 
 
+@teensytoany_cli.command()
+@click.option(
+    '--serial-number', '-s',
+    type=str,
+    multiple=True,
+    help=(
+        'Serial number of a device to open when the broker starts. '
+        'May be repeated. Other devices are opened when a client asks for them.'
+    ),
+)
+@click.option(
+    '--socket', 'socket_path',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help=(
+        'Unix domain socket to listen on. Defaults to teensytoany.sock in '
+        '$XDG_RUNTIME_DIR, or teensytoany-<user>.sock in the temporary directory.'
+    ),
+)
+@click.option(
+    '--timeout',
+    type=float,
+    default=0.205,
+    show_default=True,
+    help='Default time, in seconds, to wait for the response of each command.',
+)
+@click.option(
+    '--transport',
+    type=click.Choice(['serial', 'thread', 'fd']),
+    default='serial',
+    show_default=True,
+    help='How the serial ports are read.',
+)
+def serve(
+    serial_number=(),
+    socket_path=None,
+    timeout=0.205,
+    transport='serial',
+):
+    """Share TeensyToAny devices with other processes"""
+    from teensytoany.broker import TeensyToAnyBroker
+
+    broker = TeensyToAnyBroker(
+        socket_path,
+        serial_number,
+        timeout=timeout,
+        transport=transport,
+    )
+    broker.open()
+    click.echo(
+        f"Serving {', '.join(broker.serial_numbers) or 'TeensyToAny devices'} "
+        f"on {broker.socket_path}"
+    )
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@teensytoany_cli.command()
+@click.argument('log', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--max-bytes-in-flight',
+    type=click.IntRange(min=1),
+    default=2048,
+    show_default=True,
+    help='Bytes a pipeline sends before reading the responses.',
+)
+def session_report(log, max_bytes_in_flight=2048):
+    """Estimate the time a recorded session would take pipelined"""
+    from teensytoany.replay import analyze_session
+
+    report = analyze_session(log, max_bytes_in_flight=max_bytes_in_flight)
+    click.echo(f"{'commands':<24} {report['commands']:>12}")
+    click.echo(f"{'duration':<24} {report['duration']:12.6f} s")
+    click.echo(f"{'  waiting for responses':<24} {report['waiting']:12.6f} s")
+    click.echo(f"{'  host':<24} {report['host']:12.6f} s")
+    click.echo(f"{'link latency':<24} {report['link_latency'] * 1E6:12.1f} us")
+    click.echo(f"{'pipelined':<24} {report['pipelined']:12.6f} s "
+               f"in {report['batches']} batches ({report['speedup']:.1f}x)")
+    click.echo(f"\n{'verb':<24} {'count':>12} {'total':>12}")
+    verbs = sorted(report['verbs'].items(), key=lambda item: -item[1]['total_time'])
+    for verb, stats in verbs:
+        click.echo(f"{verb:<24} {stats['count']:>12} {stats['total_time']:12.6f} s")
+
+
 if __name__ == '__main__':
     teensytoany_cli()
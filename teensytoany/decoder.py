@@ -0,0 +1,94 @@
+"""Decode the payloads returned by the device.
+
+Bulk reads are returned by the firmware as space separated numbers such as
+``0x3f 0x00 0xff``. When every value is written as ``0x`` followed by two
+hexadecimal digits, the payload is decoded by ``bytes.fromhex`` in a single
+call instead of converting each value with ``int``. Payloads returned in a
+compact encoding, see :mod:`teensytoany.encoder`, are decoded in one call.
+"""
+from array import array
+from binascii import Error, a2b_base64, b2a_base64
+
+__all__ = [
+    'OUTPUTS',
+    'decode_payload',
+]
+
+OUTPUTS = ('list', 'bytes', 'array', 'numpy')
+
+
+def _fromhex(returned):
+    try:
+        data = bytes.fromhex(returned.replace('0x', ''))
+    except ValueError:
+        return None
+    # Values written in decimal, or with more than two digits, would be
+    # decoded as the wrong number of bytes
+    if len(data) != returned.count('0x'):
+        return None
+    return data
+
+
+def _decode_compact(returned, encoding):
+    try:
+        if encoding == 'hex':
+            return bytes.fromhex(returned)
+        if encoding == 'base64':
+            data = a2b_base64(returned)
+            # Invalid characters are skipped rather than rejected
+            if b2a_base64(data, newline=False).decode('ascii') != returned:
+                raise Error("Non-base64 characters or padding")
+            return data
+    except Error as e:
+        raise ValueError(f"Invalid {encoding} payload: {e}") from e
+    raise ValueError(f"Unknown encoding '{encoding}'.")
+
+
+def decode_payload(returned, output='list', *, encoding=None):
+    """Decode a payload returned by the device.
+
+    Parameters
+    ----------
+    returned: str or None
+        The message returned by the device.
+
+    output: 'list', 'bytes', 'array' or 'numpy'
+        The type of the returned payload. ``'array'`` returns an
+        ``array.array`` of unsigned bytes and ``'numpy'`` a ``numpy.uint8``
+        array.
+
+    encoding: 'hex' or 'base64', optional
+        The compact encoding of the payload. By default, the payload is made
+        of space separated numbers.
+
+        .. versionadded:: 0.15.0
+
+    Returns
+    -------
+    payload: list, bytes, array.array or numpy.ndarray
+        The decoded values.
+    """
+    if output not in OUTPUTS:
+        raise ValueError(
+            f"Unknown output '{output}'. Must be one of {', '.join(OUTPUTS)}.")
+    if returned is None:
+        returned = ''
+
+    if encoding is not None:
+        data = _decode_compact(returned, encoding)
+    else:
+        data = _fromhex(returned)
+    if data is None:
+        values = [int(val, base=0) for val in returned.split()]
+        if output == 'list':
+            return values
+        data = bytes(values)
+
+    if output == 'list':
+        return list(data)
+    if output == 'bytes':
+        return data
+    if output == 'array':
+        return array('B', data)
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    return np.frombuffer(bytearray(data), dtype=np.uint8)
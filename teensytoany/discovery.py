@@ -0,0 +1,166 @@
+"""Locate TeensyToAny serial ports quickly.
+
+``serial.tools.list_ports.comports`` inspects every serial port of the
+computer, which can take hundreds of milliseconds on hosts with many USB
+serial devices. On Linux, a port with a known serial number can instead be
+resolved directly from the symbolic links that udev creates in
+``/dev/serial/by-id``, or from the USB attributes that the kernel exposes for
+each ``ttyACM`` port under ``/sys/class/tty``.
+
+Results are kept in a short-lived, in-process cache so that the many calls
+made while opening or programming a device do not repeat the enumeration.
+Call :func:`invalidate_cache` after devices are plugged, unplugged or
+rebooted.
+"""
+import os
+import threading
+from time import monotonic
+
+__all__ = [
+    'CACHE_TTL',
+    'comports',
+    'find_serial_numbers',
+    'invalidate_cache',
+]
+
+# Seconds for which discovered ports are trusted
+CACHE_TTL = 2.0
+
+BY_ID_DIRECTORY = '/dev/serial/by-id'
+SYSFS_TTY_DIRECTORY = '/sys/class/tty'
+
+_cache_lock = threading.Lock()
+# Both map a key to the time it was discovered and the result
+_comports_cache = {}
+_port_cache = {}
+
+
+def invalidate_cache():
+    """Forget all the ports discovered so far."""
+    with _cache_lock:
+        _comports_cache.clear()
+        _port_cache.clear()
+
+
+def comports():
+    """Return ``serial.tools.list_ports.comports()``, cached for ``CACHE_TTL`` seconds."""
+    with _cache_lock:
+        cached = _comports_cache.get(None)
+    if cached is not None and monotonic() - cached[0] < CACHE_TTL:
+        return cached[1]
+
+    from serial.tools import \
+        list_ports  # pylint: disable=import-outside-toplevel
+    ports = list_ports.comports()
+    with _cache_lock:
+        _comports_cache[None] = (monotonic(), ports)
+    return ports
+
+
+def _read_attribute(directory, name):
+    try:
+        with open(os.path.join(directory, name), encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _usb_attributes(port, sysfs_directory):
+    """Return the USB vid, pid and serial number of a tty, or None."""
+    device = os.path.join(sysfs_directory, os.path.basename(port), 'device')
+    if not os.path.exists(device):
+        return None
+    # The tty's device is the USB interface, its parent the USB device
+    usb_device = os.path.dirname(os.path.realpath(device))
+    vid = _read_attribute(usb_device, 'idVendor')
+    pid = _read_attribute(usb_device, 'idProduct')
+    if vid is None or pid is None:
+        return None
+    try:
+        return int(vid, 16), int(pid, 16), _read_attribute(usb_device, 'serial')
+    except ValueError:
+        return None
+
+
+def _find_by_id(serial_number, by_id_directory):
+    try:
+        names = os.listdir(by_id_directory)
+    except OSError:
+        return None
+    for name in names:
+        # usb-<manufacturer>_<product>_<serial number>-if<interface>
+        stem, _, interface = name.rpartition('-if')
+        if interface and stem.endswith('_' + serial_number):
+            return os.path.realpath(os.path.join(by_id_directory, name))
+    return None
+
+
+def _find_by_sysfs(serial_number, vid_pids, sysfs_directory):
+    try:
+        names = os.listdir(sysfs_directory)
+    except OSError:
+        return None
+    for name in names:
+        if not name.startswith('ttyACM'):
+            continue
+        attributes = _usb_attributes(name, sysfs_directory)
+        if attributes is None:
+            continue
+        vid, pid, found_serial_number = attributes
+        if (vid, pid) in vid_pids and found_serial_number == serial_number:
+            return os.path.join('/dev', name)
+    return None
+
+
+def _find_port(serial_number, vid_pids, by_id_directory, sysfs_directory):
+    port = _find_by_id(serial_number, by_id_directory)
+    if port is not None:
+        attributes = _usb_attributes(port, sysfs_directory)
+        if attributes is not None and attributes[:2] in vid_pids:
+            return port
+    return _find_by_sysfs(serial_number, vid_pids, sysfs_directory)
+
+
+def find_serial_numbers(
+    serial_numbers,
+    vid_pids,
+    *,
+    by_id_directory=BY_ID_DIRECTORY,
+    sysfs_directory=SYSFS_TTY_DIRECTORY,
+):
+    """Resolve the ports of the given serial numbers without enumerating every port.
+
+    Parameters
+    ----------
+    serial_numbers: list of str
+        The serial numbers to find.
+
+    vid_pids: list of (int, int)
+        The USB vendor and product ids that the devices may have.
+
+    by_id_directory, sysfs_directory: str
+        The directories to search. They may be changed for testing.
+
+    Returns
+    -------
+    pairs: list of (port, serial_number) or None
+        The ports of the devices, in the order of ``serial_numbers``. None if
+        any of the devices could not be resolved this way, in which case the
+        caller should fall back to :func:`comports`.
+    """
+    now = monotonic()
+    pairs = []
+    for serial_number in serial_numbers:
+        key = (serial_number, by_id_directory, sysfs_directory)
+        with _cache_lock:
+            cached = _port_cache.get(key)
+        if cached is not None and now - cached[0] < CACHE_TTL:
+            port = cached[1]
+        else:
+            port = _find_port(serial_number, vid_pids, by_id_directory, sysfs_directory)
+            if port is None:
+                return None
+            with _cache_lock:
+                _port_cache[key] = (now, port)
+        pairs.append((port, serial_number))
+    return pairs
@@ -0,0 +1,250 @@
+"""Download firmware files from the GitHub releases or a mirror.
+
+Downloads are streamed to a partial file next to their destination in the
+cache. If the connection drops, the download resumes where it stopped with
+an HTTP ``Range`` request, both within a call and in later calls. The
+``ETag`` of the partial file is sent in ``If-Range``, so that the download
+starts over if the file was replaced on the server in the meantime. Finished
+files are verified and indexed by
+:class:`~teensytoany.firmware_cache.FirmwareCache`.
+
+Every download goes through one shared ``requests.Session``, which reuses its
+connections to the server, and :func:`prefetch_firmware` downloads all the
+files of a version concurrently, for instance to provision a computer that
+will be offline::
+
+    from teensytoany.downloads import prefetch_firmware
+
+    prefetch_firmware(version='0.18.0', variants=[None, 'spi'])
+
+The files are downloaded from the GitHub releases unless the
+``TEENSYTOANY_FIRMWARE_MIRROR`` environment variable, or the ``base_url``
+argument, points to a mirror with the same layout:
+``<base_url>/<version>/firmware_<mcu>[_<variant>].hex``.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import firmware_cache
+
+__all__ = [
+    'RELEASES_URL',
+    'download_firmware',
+    'firmware_url',
+    'prefetch_firmware',
+    'session',
+]
+
+RELEASES_URL = "https://github.com/ramonaoptics/teensy-to-any/releases/download"
+MCUS = ('TEENSY40', 'TEENSY32')
+# Bytes received in an unfinished chunk are lost if the connection drops
+CHUNK_SIZE = 16384
+
+_session = []
+_session_lock = threading.Lock()
+
+
+class _IncompleteDownload(Exception):
+    pass
+
+
+def session():
+    """Return the ``requests.Session`` shared by the downloads."""
+    with _session_lock:
+        if not _session:
+            import requests  # pylint: disable=import-outside-toplevel
+            _session.append(requests.Session())
+        return _session[0]
+
+
+def firmware_url(*, mcu, version, variant=None, base_url=None):
+    """Return the URL of a firmware file."""
+    if base_url is None:
+        base_url = os.environ.get('TEENSYTOANY_FIRMWARE_MIRROR') or RELEASES_URL
+    if variant is None:
+        filename = f"firmware_{mcu.lower()}.hex"
+    else:
+        filename = f"firmware_{mcu.lower()}_{variant}.hex"
+    return f"{base_url.rstrip('/')}/{version}/{filename}"
+
+
+def _content_range_total(response):
+    # bytes <start>-<end>/<total>, or bytes */<total>
+    _, _, total = response.headers.get('Content-Range', '').rpartition('/')
+    return int(total) if total.isdigit() else None
+
+
+def _etag_path(partial):
+    """The file holding the ``ETag`` of the partial download."""
+    return partial.with_name(f'{partial.name}.etag')
+
+
+def _read_etag(partial):
+    try:
+        return _etag_path(partial).read_text(encoding='utf-8')
+    except OSError:
+        return None
+
+
+def _write_etag(partial, response):
+    etag = response.headers.get('ETag')
+    path = _etag_path(partial)
+    # Weak validators cannot be used in If-Range
+    if etag is None or etag.startswith('W/'):
+        path.unlink(missing_ok=True)
+    else:
+        path.write_text(etag, encoding='utf-8')
+
+
+def _remove_partial(partial):
+    partial.unlink(missing_ok=True)
+    _etag_path(partial).unlink(missing_ok=True)
+
+
+def _download(url, partial, timeout):
+    """Download ``url`` into ``partial``, resuming from its current size."""
+    offset = partial.stat().st_size if partial.exists() else 0
+    etag = _read_etag(partial) if offset else None
+    # Without the ETag of the partial file, we cannot know whether the
+    # rest of the file on the server belongs with it
+    headers = {'Range': f'bytes={offset}-', 'If-Range': etag} if etag else {}
+    with session().get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 416 and etag:
+            # The server only answers 416 if the ETag matched
+            if (_content_range_total(response) == offset and
+                    response.headers.get('ETag', etag) == etag):
+                # The previous attempt had already received everything
+                return
+            _remove_partial(partial)
+            raise _IncompleteDownload("the partial download is larger than the file")
+        if response.status_code == 206 and etag:
+            mode = 'ab'
+            total = _content_range_total(response)
+        elif response.status_code == 200:
+            # The file changed since the partial download, or the server does
+            # not support ranges, start over
+            mode = 'wb'
+            _write_etag(partial, response)
+            total = None
+            if response.headers.get('Content-Encoding', 'identity') == 'identity':
+                content_length = response.headers.get('Content-Length')
+                if content_length is not None:
+                    total = int(content_length)
+        else:
+            raise RuntimeError(
+                f"Failed to download firmware from {url}. "
+                f"Status code: {response.status_code}")
+
+        with open(partial, mode) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+    size = partial.stat().st_size
+    if total is not None and size != total:
+        raise _IncompleteDownload(f"received {size} of {total} bytes")
+
+
+def download_firmware(
+    *,
+    mcu,
+    version,
+    variant=None,
+    timeout=2,
+    base_url=None,
+    retries=3,
+    cache=None,
+):
+    """Download a firmware file into the cache and return its path.
+
+    Parameters
+    ----------
+    mcu, version, variant:
+        The firmware to download.
+
+    timeout: float
+        The timeout, in seconds, to connect and to receive each chunk.
+
+    base_url: str, optional
+        The URL of a mirror of the releases, see :func:`firmware_url`.
+
+    retries: int
+        How many times an interrupted download is resumed before giving up.
+
+    cache: FirmwareCache, optional
+        The cache receiving the file, the default cache otherwise.
+    """
+    import requests  # pylint: disable=import-outside-toplevel
+
+    if cache is None:
+        cache = firmware_cache.default_cache()
+    url = firmware_url(mcu=mcu, version=version, variant=variant, base_url=base_url)
+    partial = cache.partial_path(mcu=mcu, version=version, variant=variant)
+    partial.parent.mkdir(parents=True, exist_ok=True)
+
+    attempts = 0
+    while True:
+        try:
+            _download(url, partial, timeout)
+            break
+        except (requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError, _IncompleteDownload) as e:
+            attempts += 1
+            if attempts > retries:
+                raise RuntimeError(f"Failed to download firmware from {url}: {e}") from e
+
+    path = cache.add_file(partial, mcu=mcu, version=version, variant=variant)
+    _remove_partial(partial)
+    return path
+
+
+def prefetch_firmware(
+    *,
+    version,
+    mcus=MCUS,
+    variants=(None,),
+    max_workers=4,
+    timeout=2,
+    base_url=None,
+    cache=None,
+):
+    """Download every combination of mcu and variant of a version concurrently.
+
+    Files that are already cached, and match their recorded digest, are not
+    downloaded again.
+
+    Returns
+    -------
+    results: dict
+        Maps each ``(mcu, variant)`` to the path of its file, or to the
+        exception raised while downloading it.
+    """
+    if cache is None:
+        cache = firmware_cache.default_cache()
+
+    def fetch(mcu, variant):
+        path = cache.lookup(mcu=mcu, version=version, variant=variant, verify=True)
+        if path is not None:
+            return path
+        return download_firmware(
+            mcu=mcu, version=version, variant=variant,
+            cache=cache, base_url=base_url, timeout=timeout)
+
+    combinations = [(mcu, variant) for mcu in mcus for variant in variants]
+    results = {}
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(combinations))),
+        thread_name_prefix='TeensyToAny download',
+    ) as executor:
+        futures = {
+            combination: executor.submit(fetch, *combination)
+            for combination in combinations
+        }
+    for combination, future in futures.items():
+        try:
+            results[combination] = future.result()
+        except Exception as e:  # pylint: disable=broad-except
+            results[combination] = e
+    return results
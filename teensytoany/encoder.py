@@ -0,0 +1,157 @@
+"""Encode commands directly into the bytes sent to the device.
+
+Each command has a precompiled ``bytes`` template, including the trailing
+newline, whose arguments are filled in with ``%`` formatting. This produces
+the encoded command in a single step, without the intermediate strings of an
+f-string followed by ``str.encode``::
+
+    from teensytoany.encoder import encode
+
+    command = encode('i2c_write_uint8', 0x20, 0x10, 0xFF)
+    # b'i2c_write_uint8 0x20 0x10 0xff\\n'
+    teensy.send_raw(command)
+
+Encoded commands may be computed once and sent many times with
+:meth:`TeensyToAny.send_raw`.
+
+Firmware that lists ``hex`` or ``base64`` in its ``payload_encodings`` also
+accepts bulk payloads as a single compact token, with commands suffixed by
+the encoding, such as ``spi_transfer_bulk_base64 AAH/``. Their payloads are
+encoded with :func:`encode_compact_payload`.
+"""
+from binascii import b2a_base64
+
+__all__ = [
+    'COMMAND_TEMPLATES',
+    'PAYLOAD_ENCODINGS',
+    'compact_payload_length',
+    'encode',
+    'encode_compact_payload',
+    'encode_payload',
+]
+
+COMMAND_TEMPLATES = {}
+
+# The compact encodings of bulk payloads, the most compact first
+PAYLOAD_ENCODINGS = ('base64', 'hex')
+
+
+def _add_template(name, arguments=''):
+    template = name.encode('utf-8')
+    if arguments:
+        template += b' ' + arguments.encode('utf-8')
+    COMMAND_TEMPLATES[name] = template + b'\n'
+
+
+for _prefix in ('i2c', 'i2c_1'):
+    _add_template(f'{_prefix}_init', '%d %d %d')
+    _add_template(f'{_prefix}_read_uint8', '0x%02x 0x%x')
+    _add_template(f'{_prefix}_read_uint16', '0x%02x 0x%x')
+    _add_template(f'{_prefix}_write_uint8', '0x%02x 0x%x 0x%x')
+    _add_template(f'{_prefix}_write_uint16', '0x%02x 0x%x 0x%x')
+    _add_template(f'{_prefix}_write_payload', '0x%02x 0x%02x %b')
+    _add_template(f'{_prefix}_read_payload', '0x%02x 0x%02x %d')
+    _add_template(f'{_prefix}_read_payload_no_register', '0x%02x %d')
+    _add_template(f'{_prefix}_read_payload_uint16', '0x%02x 0x%04x %d')
+    _add_template(f'{_prefix}_ping', '0x%02x')
+    _add_template(f'{_prefix}_reset')
+    _add_template(f'{_prefix}_read_no_register_uint8', '0x%02x')
+    _add_template(f'{_prefix}_write_no_register_uint8', '0x%02x 0x%02x')
+    _add_template(f'{_prefix}_begin_transaction', '0x%02x')
+    _add_template(f'{_prefix}_write', '%b')
+    _add_template(f'{_prefix}_end_transaction', '%b')
+    _add_template(f'{_prefix}_buffer_size')
+
+for _encoding in PAYLOAD_ENCODINGS:
+    for _prefix in ('i2c', 'i2c_1'):
+        _add_template(f'{_prefix}_write_payload_{_encoding}', '0x%02x 0x%02x %b')
+        _add_template(f'{_prefix}_read_payload_{_encoding}', '0x%02x 0x%02x %d')
+        _add_template(f'{_prefix}_read_payload_no_register_{_encoding}', '0x%02x %d')
+        _add_template(f'{_prefix}_read_payload_uint16_{_encoding}', '0x%02x 0x%04x %d')
+    _add_template(f'spi_transfer_bulk_{_encoding}', '%b')
+    _add_template(f'fastled_set_rgb_bulk_{_encoding}', '%d %b')
+
+_add_template('gpio_digital_write', '%d %d')
+_add_template('gpio_pin_mode', '%d %d')
+_add_template('gpio_digital_read', '%d')
+
+for _width in ('uint8', 'uint16', 'uint32'):
+    _add_template(f'register_read_{_width}', '%d')
+    _add_template(f'register_write_{_width}', '%d %d')
+
+_add_template('nop')
+
+_HEX_TOKENS = tuple(b'0x%02x' % value for value in range(256))
+_DECIMAL_TOKENS = tuple(b'%d' % value for value in range(256))
+
+
+def encode(command, *args) -> bytes:
+    """Encode a command and its arguments, including the trailing newline.
+
+    Parameters
+    ----------
+    command: str
+        The name of a command in ``COMMAND_TEMPLATES``.
+
+    *args:
+        The arguments of the command. They must be integers, except for
+        payloads which must be encoded with :func:`encode_payload`.
+    """
+    return COMMAND_TEMPLATES[command] % args
+
+
+def encode_payload(values, *, base=16) -> bytes:
+    """Encode a sequence of bytes as space separated numbers.
+
+    Parameters
+    ----------
+    values: bytes or sequence of int
+        The values to encode, each must be between 0 and 255.
+
+    base: 16 or 10
+        With 16, each value is written as ``0x`` followed by two hexadecimal
+        digits, otherwise it is written in decimal.
+    """
+    if not isinstance(values, (bytes, bytearray)):
+        try:
+            # Validates that every value fits in a byte
+            values = bytes(values)
+        except TypeError:
+            if base == 16:
+                raise
+            # Decimal payloads have historically accepted anything that
+            # formats as a number, such as strings
+            return ' '.join(str(value) for value in values).encode('utf-8')
+    tokens = _HEX_TOKENS if base == 16 else _DECIMAL_TOKENS
+    return b' '.join(map(tokens.__getitem__, values))
+
+
+def encode_compact_payload(values, encoding) -> bytes:
+    """Encode a sequence of bytes as a single token.
+
+    Parameters
+    ----------
+    values: bytes or sequence of int
+        The values to encode, each must be between 0 and 255.
+
+    encoding: 'hex' or 'base64'
+        With ``'hex'``, each value is written as two hexadecimal digits,
+        without prefix or separator. ``'base64'`` uses the standard alphabet
+        with padding.
+    """
+    if not isinstance(values, (bytes, bytearray)):
+        # Not bytes(values), which copies the memory of arrays of wider integers
+        values = bytes(list(values))
+    if encoding == 'hex':
+        return values.hex().encode('ascii')
+    if encoding == 'base64':
+        return b2a_base64(values, newline=False)
+    raise ValueError(
+        f"Unknown encoding '{encoding}'. Must be one of {', '.join(PAYLOAD_ENCODINGS)}.")
+
+
+def compact_payload_length(encoding, size):
+    """The number of bytes whose compact encoding fits in ``size`` characters."""
+    if encoding == 'hex':
+        return size // 2
+    return size // 4 * 3
@@ -0,0 +1,408 @@
+"""An indexed, verified cache of the downloaded firmware.
+
+Firmware files are stored in the user cache directory as
+``<mcu>/<version>/firmware.hex``, or ``firmware_<variant>.hex`` for variants.
+Files are found by their mcu, version and variant, not by their content: the
+``index.json`` file next to them records the version, mcu, variant, size
+and SHA-256 digest of every file, so that:
+
+* the cached versions are found without listing any directory,
+* a file that was truncated or modified is detected before it is programmed.
+
+Files and the index are written to a temporary file that is then renamed,
+so an interrupted download never leaves a partial file in the cache. The
+index is changed while holding a lock on ``index.lock``, so processes that
+share the cache do not lose each other's changes. Once the cache holds more
+than ``max_entries`` files, the least recently used ones are removed.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from pathlib import Path
+
+__all__ = [
+    'CachedFirmware',
+    'FirmwareCache',
+    'default_cache',
+]
+
+INDEX_FILENAME = 'index.json'
+LOCK_FILENAME = 'index.lock'
+INDEX_FORMAT = 1
+DEFAULT_MAX_ENTRIES = 20
+
+CachedFirmware = namedtuple(
+    'CachedFirmware',
+    ['mcu', 'version', 'variant', 'size', 'sha256', 'last_used', 'path'],
+)
+
+
+def _parse_version(version):
+    # packaging is only imported once a version is compared, which keeps it
+    # out of the start up of scripts that never open a device
+    from packaging.version import \
+        Version  # pylint: disable=import-outside-toplevel
+    return Version(version)
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _lock_file(f):
+    """Block until the process holds an exclusive lock on an open file."""
+    if os.name == 'nt':
+        import msvcrt  # pylint: disable=import-outside-toplevel,import-error
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl  # pylint: disable=import-outside-toplevel
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _replace_atomically(path, write):
+    """Call ``write(file)`` on a temporary file, then rename it to ``path``."""
+    fd, temporary = tempfile.mkstemp(
+        dir=path.parent, prefix=f'.{path.name}.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            result = write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.unlink(temporary)
+        except OSError:
+            pass
+        raise
+    return result
+
+
+class FirmwareCache:
+    """An indexed directory of firmware files.
+
+    Parameters
+    ----------
+    directory: str or Path
+        The directory holding the firmware files and the index.
+
+    max_entries: int or None
+        The number of files to keep. Once it is exceeded, the least
+        recently added or programmed files are removed. None keeps every file.
+    """
+
+    def __init__(self, directory, *, max_entries=DEFAULT_MAX_ENTRIES):
+        self.directory = Path(directory)
+        self.max_entries = max_entries
+        self._lock = threading.RLock()
+        # The lock file, while the lock on the index is held
+        self._lock_file = None
+        self._index = None
+        self._index_mtime = None
+
+    @property
+    def index_path(self):
+        return self.directory / INDEX_FILENAME
+
+    @staticmethod
+    def _key(mcu, version, variant):
+        return f"{mcu.lower()}/{version}/{variant or ''}"
+
+    def path(self, *, mcu, version, variant=None):
+        """The path of a firmware file, whether or not it is cached."""
+        if variant is None:
+            filename = 'firmware.hex'
+        else:
+            filename = f'firmware_{variant}.hex'
+        return self.directory / mcu.lower() / str(version) / filename
+
+    @contextmanager
+    def _locked(self):
+        """Hold the lock on the index, which is reloaded before it is changed."""
+        with self._lock:
+            if self._lock_file is not None:
+                yield
+                return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / LOCK_FILENAME, 'ab') as f:
+                _lock_file(f)
+                self._lock_file = f
+                # The modification time of the index may not change when it
+                # is replaced twice in quick succession
+                self._index_mtime = None
+                try:
+                    yield
+                finally:
+                    # Closing the file releases the lock
+                    self._lock_file = None
+
+    def _load(self):
+        """Load the index from its file, return False if it has none that is valid."""
+        try:
+            mtime = self.index_path.stat().st_mtime_ns
+            with open(self.index_path, encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('format') != INDEX_FORMAT:
+                return False
+        except (OSError, ValueError, AttributeError):
+            return False
+        self._index = index
+        self._index_mtime = mtime
+        return True
+
+    def _entries(self):
+        """Return the entries of the index, reloading it if another process changed it."""
+        try:
+            mtime = self.index_path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._index is not None and mtime == self._index_mtime:
+            return self._index['entries']
+
+        if not self._load():
+            with self._locked():
+                # Another process may have written it in the meantime
+                if not self._load():
+                    self._index = {
+                        'format': INDEX_FORMAT, 'entries': self._scan(), 'latest': {}}
+                    self._update_latest()
+                    self._save()
+        return self._index['entries']
+
+    def _scan(self):
+        """Index the files of a cache that has no index, such as older caches."""
+        entries = {}
+        if not self.directory.is_dir():
+            return entries
+        now = time.time()
+        for path in self.directory.glob('*/*/firmware*.hex'):
+            stem = path.stem
+            if stem == 'firmware':
+                variant = None
+            elif stem.startswith('firmware_'):
+                variant = stem[len('firmware_'):]
+            else:
+                continue
+            mcu, version = path.parent.parent.name, path.parent.name
+            try:
+                _parse_version(version)
+            except ValueError:
+                continue
+            entries[self._key(mcu, version, variant)] = self._entry(
+                mcu, version, variant, path.stat().st_size, _sha256(path), now)
+        return entries
+
+    @staticmethod
+    def _entry(mcu, version, variant, size, sha256, last_used):
+        return {
+            'mcu': mcu.lower(),
+            'version': str(version),
+            'variant': variant,
+            'size': size,
+            'sha256': sha256,
+            'last_used': last_used,
+        }
+
+    def _update_latest(self):
+        latest = {}
+        for entry in self._index['entries'].values():
+            if entry['variant'] is not None:
+                continue
+            mcu = entry['mcu'].lower()
+            if mcu not in latest or _parse_version(entry['version']) > _parse_version(latest[mcu]):
+                latest[mcu] = entry['version']
+        self._index['latest'] = latest
+
+    def _save(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(self._index, indent=1, sort_keys=True).encode('utf-8')
+        _replace_atomically(self.index_path, lambda f: f.write(data))
+        self._index_mtime = self.index_path.stat().st_mtime_ns
+
+    def _remove(self, key):
+        entry = self._index['entries'].pop(key)
+        path = self.path(
+            mcu=entry['mcu'], version=entry['version'], variant=entry['variant'])
+        try:
+            path.unlink()
+            path.parent.rmdir()
+        except OSError:
+            # Other variants of the version are still cached
+            pass
+
+    def entries(self):
+        """Return every cached firmware file, as a list of ``CachedFirmware``."""
+        with self._lock:
+            return [
+                CachedFirmware(path=self.path(
+                    mcu=entry['mcu'], version=entry['version'], variant=entry['variant']
+                ), **entry)
+                for entry in self._entries().values()
+            ]
+
+    def versions(self, *, mcu, variant=None):
+        """Return the cached versions for an mcu and variant, oldest first."""
+        with self._lock:
+            versions = [
+                entry['version']
+                for entry in self._entries().values()
+                if entry['mcu'].lower() == mcu.lower() and entry['variant'] == variant
+            ]
+        versions.sort(key=_parse_version)
+        return versions
+
+    def latest_version(self, *, mcu):
+        """Return the latest cached version of the standard firmware, or None."""
+        with self._lock:
+            self._entries()
+            return self._index['latest'].get(mcu.lower())
+
+    def lookup(self, *, mcu, version, variant=None, verify=False):
+        """Return the path of a cached firmware file, or None if it is not cached.
+
+        Parameters
+        ----------
+        mcu, version, variant:
+            The firmware to find.
+
+        verify: bool
+            If True, the SHA-256 digest of the file is checked and the file
+            is marked as used, and a file that does not match the index is
+            removed from the cache. Otherwise only its size is checked, and
+            a file that does not match is not returned, but kept.
+
+        A file that is not in the index, such as one copied into the cache
+        directory by hand, is added to it.
+        """
+        key = self._key(mcu, version, variant)
+        path = self.path(mcu=mcu, version=version, variant=variant)
+        with self._locked():
+            entry = self._entries().get(key)
+            if entry is None:
+                if not path.is_file():
+                    return None
+                self._record(mcu, version, variant, path.stat().st_size, _sha256(path))
+                return path
+            try:
+                size = path.stat().st_size
+            except OSError:
+                size = None
+            if size != entry['size'] or (verify and _sha256(path) != entry['sha256']):
+                if verify:
+                    self._remove(key)
+                    self._update_latest()
+                    self._save()
+                return None
+            if verify:
+                entry['last_used'] = time.time()
+                self._save()
+            return path
+
+    def add(self, chunks, *, mcu, version, variant=None, expected_size=None):
+        """Store a firmware file in the cache and return its path.
+
+        Parameters
+        ----------
+        chunks: iterable of bytes
+            The content of the file.
+
+        mcu, version, variant:
+            The firmware being stored.
+
+        expected_size: int, optional
+            If provided, the file is only stored if it has this size, which
+            detects interrupted downloads.
+        """
+        path = self.path(mcu=mcu, version=version, variant=variant)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        def write(f):
+            digest = hashlib.sha256()
+            size = 0
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+            if expected_size is not None and size != expected_size:
+                raise RuntimeError(
+                    f"Failed to download firmware: received {size} of "
+                    f"{expected_size} bytes."
+                )
+            return size, digest.hexdigest()
+
+        size, sha256 = _replace_atomically(path, write)
+        self._record(mcu, version, variant, size, sha256)
+        return path
+
+    def partial_path(self, *, mcu, version, variant=None):
+        """The path where a firmware file is downloaded before it is added."""
+        path = self.path(mcu=mcu, version=version, variant=variant)
+        return path.with_name(f'.{path.name}.download')
+
+    def add_file(self, source, *, mcu, version, variant=None):
+        """Move a complete file, such as a finished download, into the cache.
+
+        The file must be on the same file system as the cache, typically at
+        :meth:`partial_path`, so that it is moved atomically.
+        """
+        path = self.path(mcu=mcu, version=version, variant=variant)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        size = os.stat(source).st_size
+        sha256 = _sha256(source)
+        os.replace(source, path)
+        self._record(mcu, version, variant, size, sha256)
+        return path
+
+    def _record(self, mcu, version, variant, size, sha256):
+        with self._locked():
+            entries = self._entries()
+            key = self._key(mcu, version, variant)
+            entries[key] = self._entry(mcu, version, variant, size, sha256, time.time())
+            self._evict(keep=key)
+            self._update_latest()
+            self._save()
+
+    def remove(self, *, mcu, version, variant=None):
+        """Remove a firmware file from the cache, if it is cached."""
+        key = self._key(mcu, version, variant)
+        with self._locked():
+            if key not in self._entries():
+                return
+            self._remove(key)
+            self._update_latest()
+            self._save()
+
+    def _evict(self, keep=None):
+        if self.max_entries is None:
+            return
+        entries = self._index['entries']
+        by_age = sorted(
+            (key for key in entries if key != keep),
+            key=lambda key: entries[key]['last_used'],
+        )
+        for key in by_age[:max(len(entries) - self.max_entries, 0)]:
+            self._remove(key)
+
+
+_default_cache = []
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """Return the cache in the user cache directory, used by ``TeensyToAny``."""
+    with _default_cache_lock:
+        if not _default_cache:
+            from appdirs import \
+                AppDirs  # pylint: disable=import-outside-toplevel
+            app = AppDirs('teensytoany', 'ramonaoptics')
+            _default_cache.append(FirmwareCache(app.user_cache_dir))
+        return _default_cache[0]
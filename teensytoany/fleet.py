@@ -0,0 +1,305 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from warnings import warn
+
+from .teensytoany import TeensyToAny
+
+__all__ = [
+    'FleetError',
+    'FleetResults',
+    'TeensyFleet',
+]
+
+
+class FleetError(RuntimeError):
+    """Raised by :meth:`FleetResults.raise_on_error` when a device failed.
+
+    The exception raised by each device is available in ``errors``.
+    """
+
+    def __init__(self, message, errors):
+        super().__init__(message)
+        self.errors = errors
+
+
+class FleetResults(dict):
+    """The results of a call made on many devices, keyed by serial number.
+
+    Only the devices that succeeded are in the dictionary. The exceptions
+    raised by the other devices are in ``errors`` and the time taken by every
+    device, in seconds, in ``durations``.
+    """
+
+    def __init__(self, name='call'):
+        super().__init__()
+        self.name = name
+        self.errors = {}
+        self.durations = {}
+
+    @property
+    def ok(self):
+        """True if the call succeeded on every device."""
+        return not self.errors
+
+    def raise_on_error(self):
+        """Raise a :class:`FleetError` if the call failed on any device."""
+        if self.errors:
+            failures = '; '.join(
+                f'{serial_number}: {error}'
+                for serial_number, error in self.errors.items()
+            )
+            raise FleetError(
+                f"'{self.name}' failed on {len(self.errors)} of "
+                f"{len(self.errors) + len(self)} devices: {failures}",
+                dict(self.errors),
+            )
+        return self
+
+    def __repr__(self):
+        return (
+            f'<{type(self).__name__} {self.name!r} {dict(self)!r} '
+            f'errors={self.errors!r}>'
+        )
+
+
+class TeensyFleet:
+    """Open and control many TeensyToAny boards concurrently.
+
+    The connected boards are discovered once, with
+    :meth:`TeensyToAny.device_serial_number_pairs`, then opened in parallel
+    on a thread pool so that starting a rig takes about as long as opening
+    its slowest board. Commands may then be broadcast to every board, or
+    scattered with different arguments to each one::
+
+        with TeensyFleet() as fleet:
+            fleet.map('gpio_pin_mode', 13, 1)
+            fleet.map('gpio_digital_write', 13, 1).raise_on_error()
+            versions = fleet.map(lambda teensy: teensy.version)
+            fleet.scatter('i2c_write_uint8', {
+                '12345': (0x20, 0x10, 1),
+                '67890': (0x20, 0x10, 2),
+            })
+
+    Each call returns :class:`FleetResults`. A board that fails does not
+    prevent the call from completing on the others, its exception is
+    reported in ``FleetResults.errors``.
+
+    Parameters
+    ----------
+    serial_numbers: list of str, optional
+        The boards to open. By default, every connected TeensyToAny board is
+        opened.
+
+    max_workers: int, optional
+        The number of threads used to talk to the boards. By default, one
+        thread per board.
+
+    open: bool
+        If True, the boards are opened immediately. Otherwise, call
+        :meth:`open`.
+
+    device_name: str
+        The name of the device returned in error messages.
+
+    **kwargs:
+        Additional keyword arguments are passed to the ``TeensyToAny``
+        constructor.
+    """
+
+    def __init__(
+        self,
+        serial_numbers=None,
+        *,
+        max_workers=None,
+        open=True,  # pylint: disable=redefined-builtin
+        device_name='TeensyToAny',
+        **kwargs
+    ):
+        self._requested_serial_numbers = serial_numbers
+        self._max_workers = max_workers
+        self._device_name = device_name
+        self._kwargs = kwargs
+        self._devices = {}
+        self._executor = None
+        self.open_errors = {}
+        if open:
+            self.open()
+
+    def open(self):
+        """Discover the boards and open them concurrently.
+
+        Boards that cannot be opened are left out of the fleet and their
+        exceptions are reported in ``open_errors``.
+
+        Returns
+        -------
+        results: FleetResults
+            The opened devices, and the exceptions of those that failed.
+        """
+        if self._executor is not None:
+            raise RuntimeError("The fleet is already open.")
+
+        pairs = TeensyToAny.device_serial_number_pairs(
+            serial_numbers=self._requested_serial_numbers,
+            device_name=self._device_name,
+        )
+        max_workers = self._max_workers or len(pairs)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='TeensyFleet')
+
+        def open_device(serial_number, port):
+            return TeensyToAny(
+                serial_number,
+                port=port,
+                device_name=self._device_name,
+                **self._kwargs,
+            )
+
+        results = self._gather(
+            'open',
+            {serial_number: (port,) for port, serial_number in pairs},
+            open_device,
+        )
+        self._devices = dict(results)
+        self.open_errors = dict(results.errors)
+        if results.errors:
+            warn(
+                f"Could not open {len(results.errors)} of {len(pairs)} "
+                f"{self._device_name} devices: {', '.join(results.errors)}.",
+                stacklevel=2,
+            )
+        return results
+
+    def close(self):
+        """Close every board concurrently."""
+        if self._executor is None:
+            return
+        devices = self._devices
+        self._gather(
+            'close',
+            {serial_number: () for serial_number in devices},
+            lambda serial_number: devices[serial_number].close(),
+        )
+        self._devices = {}
+        self._executor.shutdown()
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def serial_numbers(self):
+        """The serial numbers of the opened boards."""
+        return list(self._devices)
+
+    @property
+    def devices(self):
+        """The opened boards, keyed by serial number."""
+        return dict(self._devices)
+
+    def __getitem__(self, serial_number):
+        return self._devices[serial_number]
+
+    def __iter__(self):
+        return iter(self._devices.values())
+
+    def __len__(self):
+        return len(self._devices)
+
+    def _function(self, method):
+        if callable(method):
+            return method
+        function = getattr(TeensyToAny, method, None)
+        if not callable(function):
+            raise AttributeError(f"TeensyToAny has no method '{method}'.")
+        return function
+
+    def _gather(self, name, arguments, function):
+        """Call ``function(serial_number, *args)`` for each item of ``arguments``."""
+        def timed(serial_number, args, kwargs):
+            start = perf_counter()
+            try:
+                return function(serial_number, *args, **kwargs), None, perf_counter() - start
+            except Exception as e:  # pylint: disable=broad-except
+                return None, e, perf_counter() - start
+
+        futures = {}
+        for serial_number, args in arguments.items():
+            kwargs = {}
+            if isinstance(args, dict):
+                args, kwargs = (), args
+            futures[serial_number] = self._executor.submit(
+                timed, serial_number, tuple(args), kwargs)
+
+        results = FleetResults(name)
+        for serial_number, future in futures.items():
+            result, error, duration = future.result()
+            results.durations[serial_number] = duration
+            if error is None:
+                results[serial_number] = result
+            else:
+                results.errors[serial_number] = error
+        return results
+
+    def map(self, method, *args, **kwargs):
+        """Call the same method, with the same arguments, on every board.
+
+        Parameters
+        ----------
+        method: str or callable
+            The name of a ``TeensyToAny`` method, or a function that takes the
+            board as its first argument.
+
+        *args, **kwargs:
+            The arguments passed to every call.
+
+        Returns
+        -------
+        results: FleetResults
+            The result of each board, keyed by serial number.
+        """
+        function = self._function(method)
+        devices = self._devices
+        return self._gather(
+            getattr(method, '__name__', method),
+            {serial_number: () for serial_number in devices},
+            lambda serial_number: function(devices[serial_number], *args, **kwargs),
+        )
+
+    def scatter(self, method, arguments):
+        """Call a method on some of the boards, with different arguments for each.
+
+        Parameters
+        ----------
+        method: str or callable
+            The name of a ``TeensyToAny`` method, or a function that takes the
+            board as its first argument.
+
+        arguments: dict
+            Maps the serial number of each board to call to its positional
+            arguments as a tuple, or its keyword arguments as a dict.
+
+        Returns
+        -------
+        results: FleetResults
+            The result of each board, keyed by serial number.
+        """
+        function = self._function(method)
+        devices = self._devices
+        unknown = set(arguments) - set(devices)
+        if unknown:
+            raise KeyError(
+                f"Unknown serial numbers: {', '.join(sorted(unknown))}.")
+        return self._gather(
+            getattr(method, '__name__', method),
+            arguments,
+            lambda serial_number, *args, **kwargs: function(
+                devices[serial_number], *args, **kwargs),
+        )
@@ -0,0 +1,197 @@
+"""Count the commands sent to a device and measure their round trips.
+
+Instrumentation is enabled per device with ``TeensyToAny(instrument=True)``.
+Every command then records its verb, the bytes written and read, the time
+from writing the command to reading its response, and whether it timed out
+or the device answered with an error code. Commands sent through a
+:class:`~teensytoany.pipeline.TeensyToAnyPipeline` are timed from the write
+of their batch to the read of their response::
+
+    with TeensyToAny(instrument=True) as teensy:
+        run_acquisition(teensy)
+        stats = teensy.stats()
+
+    for verb, command in stats['commands'].items():
+        print(verb, command['count'], command['p99'], command['total_time'])
+
+Comparing the ``total_time`` of the commands with the ``elapsed`` time shows
+how much of a loop is spent waiting on the serial link. Round trips are
+counted in fixed logarithmic buckets, ``BUCKET_BOUNDS``, so recording a
+command only takes a few dictionary and list updates.
+
+Exporters receive every :class:`CommandRecord` through the callbacks added
+with :meth:`Instrumentation.add_callback`. An ``Instrumentation`` instance
+may also be shared by many devices to aggregate their statistics.
+
+Devices opened without instrumentation only check that it is disabled
+before each command.
+"""
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from time import perf_counter
+
+__all__ = [
+    'BUCKET_BOUNDS',
+    'CommandRecord',
+    'Instrumentation',
+]
+
+# Upper bounds of the round trip buckets, in seconds, from 10 us to 10.5 s.
+# Longer round trips fall in a last, unbounded, bucket.
+BUCKET_BOUNDS = tuple(10E-6 * 2 ** i for i in range(21))
+
+CommandRecord = namedtuple(
+    'CommandRecord',
+    ['verb', 'bytes_sent', 'bytes_received', 'duration', 'error_code', 'timeout'],
+)
+CommandRecord.__doc__ = """\
+A command sent to the device.
+
+``duration`` is the time, in seconds, from writing the command to reading
+its response. ``error_code`` is the non zero code the device answered with,
+or None, and ``timeout`` is True if no complete response was read.
+"""
+
+
+def _verb(data):
+    if isinstance(data, str):
+        return data.split(' ', 1)[0].strip()
+    return bytes(data[:64]).split(b' ', 1)[0].strip().decode('utf-8', errors='replace')
+
+
+def _error_code(returned):
+    code = returned.split(maxsplit=1)[:1]
+    try:
+        code = int(code[0]) if code else 0
+    except ValueError:
+        return None
+    return code or None
+
+
+class _CommandStats:
+    __slots__ = (
+        'count', 'bytes_sent', 'bytes_received', 'total_time', 'min_time',
+        'max_time', 'histogram', 'timeouts', 'errors',
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_time = 0.0
+        self.min_time = float('inf')
+        self.max_time = 0.0
+        self.histogram = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.timeouts = 0
+        self.errors = {}
+
+    def percentile(self, q):
+        """The upper bound of the bucket holding the ``q``-th percentile."""
+        rank = q / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else self.max_time
+        return 0.0
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'total_time': self.total_time,
+            'mean_time': self.total_time / self.count if self.count else 0.0,
+            'min_time': self.min_time if self.count else 0.0,
+            'max_time': self.max_time,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'histogram': list(self.histogram),
+            'timeouts': self.timeouts,
+            'errors': dict(self.errors),
+        }
+
+
+class Instrumentation:
+    """Statistics of the commands sent to one or more devices, by verb."""
+
+    def __init__(self):
+        self._mutex = threading.Lock()
+        self._callbacks = []
+        self._reset()
+
+    def _reset(self):
+        self._commands = {}
+        self._start = perf_counter()
+
+    def add_callback(self, callback):
+        """Call ``callback(record)`` with a ``CommandRecord`` after every command.
+
+        Callbacks run on the thread that sent the command, once its response
+        was read. They should return quickly, for instance by queueing the
+        record for an exporter.
+        """
+        self._callbacks = self._callbacks + [callback]
+
+    def remove_callback(self, callback):
+        self._callbacks = [c for c in self._callbacks if c is not callback]
+
+    def record(self, data, returned, duration):
+        """Record a command ``data``, its response ``returned`` and its round trip."""
+        if isinstance(data, str):
+            bytes_sent = len(data) + 1
+        else:
+            bytes_sent = len(data)
+        timeout = not returned.endswith(b'\n' if isinstance(returned, bytes) else '\n')
+        error_code = None if timeout else _error_code(returned)
+        verb = _verb(data)
+        with self._mutex:
+            stats = self._commands.get(verb)
+            if stats is None:
+                stats = self._commands[verb] = _CommandStats()
+            stats.count += 1
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += len(returned)
+            stats.total_time += duration
+            stats.min_time = min(stats.min_time, duration)
+            stats.max_time = max(stats.max_time, duration)
+            stats.histogram[bisect_left(BUCKET_BOUNDS, duration)] += 1
+            if timeout:
+                stats.timeouts += 1
+            elif error_code is not None:
+                stats.errors[error_code] = stats.errors.get(error_code, 0) + 1
+        for callback in self._callbacks:
+            callback(CommandRecord(
+                verb, bytes_sent, len(returned), duration, error_code, timeout))
+
+    def stats(self, *, reset=False):
+        """Report the statistics recorded since the last reset.
+
+        Parameters
+        ----------
+        reset: bool
+            If True, the statistics are reset after they are reported.
+
+        Returns
+        -------
+        stats: dict
+            ``elapsed`` is the time, in seconds, since the statistics were
+            reset, ``totals`` sums every command and ``commands`` holds the
+            count, bytes sent and received, round trip times, percentiles,
+            histogram (see ``BUCKET_BOUNDS``), timeouts and error codes of
+            each verb. Percentiles are the upper bound of their bucket.
+        """
+        with self._mutex:
+            commands = {verb: stats.as_dict() for verb, stats in self._commands.items()}
+            elapsed = perf_counter() - self._start
+            if reset:
+                self._reset()
+        totals = {
+            key: sum(command[key] for command in commands.values())
+            for key in ('count', 'bytes_sent', 'bytes_received', 'total_time', 'timeouts')
+        }
+        totals['errors'] = sum(
+            sum(command['errors'].values()) for command in commands.values())
+        return {'elapsed': elapsed, 'totals': totals, 'commands': commands}
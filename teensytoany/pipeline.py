@@ -0,0 +1,248 @@
+# pylint: disable=protected-access
+from collections import deque, namedtuple
+from time import perf_counter
+
+from ._recorder import _record_command
+
+__all__ = [
+    'PipelinedResponse',
+    'TeensyToAnyPipeline',
+]
+
+
+class PipelinedResponse:
+    """The deferred result of a command queued in a pipeline.
+
+    The result becomes available once the pipeline is flushed. Errors
+    reported by the device are raised from :meth:`result` as the same
+    ``RuntimeError`` that the synchronous method would have raised.
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self._done = False
+        self._result = None
+        self._exception = None
+
+    def done(self):
+        """Return ``True`` once a response was received or the command failed."""
+        return self._done
+
+    def result(self):
+        """Return the parsed response, raising the error reported for it."""
+        if not self._done:
+            raise RuntimeError(
+                f"The pipeline must be flushed before the result of "
+                f"'{self.command}' is available."
+            )
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+    def exception(self):
+        """Return the error reported for this command, or ``None``."""
+        if not self._done:
+            raise RuntimeError(
+                f"The pipeline must be flushed before the result of "
+                f"'{self.command}' is available."
+            )
+        return self._exception
+
+    def _set_result(self, result):
+        self._result = result
+        self._done = True
+
+    def _set_exception(self, exception):
+        self._exception = exception
+        self._done = True
+
+    def __repr__(self):
+        if not self._done:
+            state = 'pending'
+        elif self._exception is not None:
+            state = f'failed: {self._exception}'
+        else:
+            state = f'result={self._result!r}'
+        return f"<{type(self).__name__} '{self.command}' {state}>"
+
+
+_PipelineEntry = namedtuple('_PipelineEntry', ['data', 'command', 'parse', 'response'])
+
+
+class TeensyToAnyPipeline:
+    """Queue commands and send them to the device back to back.
+
+    Obtain a pipeline with :meth:`TeensyToAny.pipeline`. Any method of the
+    device that sends a single command may be called on the pipeline, it
+    returns a :class:`PipelinedResponse` instead of the parsed value::
+
+        with teensy.pipeline() as p:
+            for register, value in settings:
+                p.i2c_write_uint8(0x20, register, value)
+            whoami = p.i2c_read_uint8(0x20, 0x0F)
+        print(whoami.result())
+
+    Commands are written without waiting for the previous response, but the
+    number of unanswered bytes never exceeds ``max_bytes_in_flight`` so that
+    the input buffer of the firmware is never overrun.
+
+    Methods that send more than one command, such as ``i2c_write_bulk``,
+    cannot be pipelined since their later commands depend on earlier
+    responses.
+
+    On devices opened with ``thread_safe=True`` other threads are prevented
+    from sending commands while the pipeline is flushed.
+    """
+
+    def __init__(self, teensy, *, max_bytes_in_flight=None, raise_on_error=True):
+        if max_bytes_in_flight is None:
+            max_bytes_in_flight = teensy.INPUT_BUFFER_SIZE
+        self._teensy = teensy
+        self._max_bytes_in_flight = max_bytes_in_flight
+        self._raise_on_error = raise_on_error
+        self._queue = []
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self._abort(RuntimeError(
+                "The pipeline was not flushed due to an earlier exception."))
+            return False
+        self.flush()
+        return False
+
+    def ask(self, data):
+        """Queue a raw command, the result is the message returned by the device."""
+        teensy = self._teensy
+        return self._append(data, lambda returned: teensy._parse_response(data, returned))
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        teensy = self._teensy
+        function = getattr(type(teensy), name, None)
+        if not callable(function):
+            raise AttributeError(
+                f"'{type(teensy).__name__}.{name}' cannot be pipelined.")
+
+        def queue(*args, **kwargs):
+            captured, result = _record_command(teensy, function, args, kwargs)
+            if captured is None:
+                # The method did not need to communicate with the device
+                response = PipelinedResponse(name)
+                response._set_result(result)
+                return response
+
+            def parse(returned):
+                next_command, result = _record_command(
+                    teensy, function, args, kwargs, responses=[returned])
+                if next_command is not None:
+                    raise RuntimeError(
+                        f"'{name}' sends more than one command and "
+                        "cannot be pipelined."
+                    )
+                return result
+
+            return self._append(captured.command, parse)
+
+        queue.__name__ = name
+        queue.__doc__ = function.__doc__
+        return queue
+
+    def _append(self, data, parse):
+        if isinstance(data, str):
+            command = data
+            data = (data + '\n').encode('utf-8')
+        else:
+            data = bytes(data)
+            command = data.decode('utf-8', errors='replace').strip()
+        response = PipelinedResponse(command)
+        self._queue.append(_PipelineEntry(data, command, parse, response))
+        return response
+
+    def _abort(self, exception, entries=None):
+        if entries is None:
+            entries = self._queue
+            self._queue = []
+        for entry in entries:
+            entry.response._set_exception(exception)
+
+    def flush(self):
+        """Send all queued commands and collect their responses in order.
+
+        Raises
+        ------
+        RuntimeError
+            The first error reported by the device if the pipeline was created
+            with ``raise_on_error=True``.
+        """
+        with self._teensy.locked():
+            self._flush()
+
+    def _flush(self):
+        teensy = self._teensy
+        if teensy._unanswered and not teensy._resynchronize():
+            error = RuntimeError(
+                "Failed to resynchronize after a timeout, the pipeline was not sent.")
+            self._abort(error)
+            if self._raise_on_error:
+                raise error
+            return
+        pending = deque(self._queue)
+        self._queue = []
+        in_flight = deque()
+        # When the commands in flight were written, for the instrumentation
+        written_at = deque()
+        in_flight_bytes = 0
+        first_error = None
+
+        while pending or in_flight:
+            batch = []
+            while pending and (
+                not in_flight or
+                in_flight_bytes + len(pending[0].data) <= self._max_bytes_in_flight
+            ):
+                entry = pending.popleft()
+                batch.append(entry.data)
+                in_flight.append(entry)
+                in_flight_bytes += len(entry.data)
+            if batch:
+                teensy._write(b''.join(batch))
+                written_at.extend([perf_counter()] * len(batch))
+
+            entry = in_flight.popleft()
+            in_flight_bytes -= len(entry.data)
+            returned = teensy._read()
+            start = written_at.popleft()
+            if teensy._instrumentation is not None:
+                teensy._instrumentation.record(entry.data, returned, perf_counter() - start)
+            if not returned.endswith('\n'):
+                # Nothing, or part of a line, was read before the timeout, as
+                # in TeensyToAny._exchange the rest may still arrive
+                error = RuntimeError(
+                    f"Failed to read a response for command: {entry.command}")
+                entry.response._set_exception(error)
+                # Without a response we no longer know which line belongs to
+                # which command, so nothing else in the pipeline is trusted.
+                self._abort(RuntimeError(
+                    f"Pipeline aborted after failing to read a response for "
+                    f"command: {entry.command}"
+                ), list(in_flight) + list(pending))
+                first_error = first_error or error
+                # The responses that may still arrive for the commands in
+                # flight are dropped before the next command
+                teensy._unanswered += 1 + len(in_flight)
+                break
+            try:
+                entry.response._set_result(entry.parse(returned))
+            except Exception as e:  # pylint: disable=broad-except
+                entry.response._set_exception(e)
+                first_error = first_error or e
+
+        if first_error is not None and self._raise_on_error:
+            raise first_error
@@ -0,0 +1,157 @@
+"""Keep the connections to remote devices open between uses.
+
+Connecting to a device exposed by a serial server, such as ``ser2net``,
+costs a TCP handshake, and opening a :class:`~teensytoany.TeensyToAny` asks
+its version and probes its capabilities. Scripts that open a device for
+each short task pay them every time. With a pool, closing the device keeps
+its connection, with what the handshake learned, for the next
+``TeensyToAny`` opened on the same URL::
+
+    from teensytoany.pool import ConnectionPool
+
+    pool = ConnectionPool()
+    for _ in range(100):
+        with TeensyToAny(port='socket://rack3:4001', pool=pool) as teensy:
+            teensy.gpio_digital_write(13, 1)
+
+``pool=True`` uses the pool shared by the process, see :func:`default_pool`.
+
+.. versionadded:: 0.15.0
+"""
+import threading
+from collections import namedtuple
+from time import monotonic
+
+__all__ = [
+    'ConnectionPool',
+    'PooledConnection',
+    'default_pool',
+]
+
+PooledConnection = namedtuple('PooledConnection', ['transport', 'version', 'capabilities'])
+PooledConnection.__doc__ = """An idle connection and what its handshake learned."""
+
+
+def _close(transport):
+    try:
+        transport.close()
+    except Exception:  # pylint: disable=broad-exception-caught
+        # The connection may already be broken
+        pass
+
+
+def _reset(transport):
+    """Drop what was received while the connection was idle.
+
+    Returns False if the connection is broken.
+    """
+    if not getattr(transport, 'is_open', True):
+        return False
+    try:
+        transport.reset_input_buffer()
+    except OSError:
+        return False
+    return True
+
+
+class ConnectionPool:
+    """Idle connections to devices, keyed by URL.
+
+    A connection is only returned to the pool if every response was read,
+    so that the next user does not read the responses of the previous one.
+    The input buffer of a connection is reset when it is acquired, and
+    connections whose peer closed them are discarded.
+
+    Parameters
+    ----------
+    max_idle: int
+        The number of idle connections kept. The oldest ones are closed
+        beyond it.
+
+    idle_timeout: float
+        Time, in seconds, after which an idle connection is closed rather
+        than reused, as serial servers and firewalls drop idle connections.
+    """
+
+    def __init__(self, *, max_idle=4, idle_timeout=60):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._mutex = threading.Lock()
+        # (released at, key, connection), oldest first
+        self._idle = []
+        self._hits = 0
+        self._misses = 0
+
+    def acquire(self, key):
+        """Take an idle connection for ``key``.
+
+        Returns
+        -------
+        connection: PooledConnection or None
+            None if no usable connection is idle.
+        """
+        now = monotonic()
+        expired = []
+        found = None
+        with self._mutex:
+            for entry in list(self._idle):
+                released_at, entry_key, connection = entry
+                if now - released_at > self.idle_timeout:
+                    self._idle.remove(entry)
+                    expired.append(connection.transport)
+                elif found is None and entry_key == key:
+                    self._idle.remove(entry)
+                    found = connection
+        for transport in expired:
+            _close(transport)
+
+        if found is not None and not _reset(found.transport):
+            _close(found.transport)
+            found = None
+        with self._mutex:
+            if found is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return found
+
+    def release(self, key, connection):
+        """Return an open connection to the pool."""
+        with self._mutex:
+            self._idle.append((monotonic(), key, connection))
+            evicted = self._idle[:max(0, len(self._idle) - self.max_idle)]
+            del self._idle[:len(evicted)]
+        for _, _, evicted_connection in evicted:
+            _close(evicted_connection.transport)
+
+    def clear(self):
+        """Close every idle connection."""
+        with self._mutex:
+            idle, self._idle = self._idle, []
+        for _, _, connection in idle:
+            _close(connection.transport)
+
+    def statistics(self):
+        """Report the number of connections reused.
+
+        Returns
+        -------
+        statistics: dict
+            The ``hits``, connections reused, the ``misses``, connections
+            opened because none was idle, and the number of ``idle``
+            connections.
+        """
+        with self._mutex:
+            return {'hits': self._hits, 'misses': self._misses, 'idle': len(self._idle)}
+
+
+_default_pool = []
+_default_pool_lock = threading.Lock()
+
+
+def default_pool():
+    """Return the pool shared by the process, used with ``pool=True``."""
+    with _default_pool_lock:
+        if not _default_pool:
+            _default_pool.append(ConnectionPool())
+        return _default_pool[0]
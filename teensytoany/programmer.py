@@ -1,6 +1,10 @@
+import sys
+
 import click
 
 import teensytoany
+from teensytoany.downloads import MCUS, prefetch_firmware
+from teensytoany.programming import program_firmware_parallel
 
 
 def teensytoany_programmer(
@@ -8,25 +12,52 @@ def teensytoany_programmer(
     mcu='TEENSY40',
     firmware_version=None,
     firmware_variant=None,
-    download_only=False
+    download_only=False,
+    *,
+    serial_numbers=None,
+    all_devices=False,
+    jobs=4,
 ):
-    """Program a Teensy device with a given firmware version"""
+    """Program a Teensy device with a given firmware version
+
+    Many devices are programmed in parallel, at most ``jobs`` at a time,
+    if ``serial_numbers`` are provided or ``all_devices`` is True.
+    """
+    if all_devices and (serial_number is not None or serial_numbers):
+        raise click.UsageError("--all cannot be combined with --serial-number.")
+
     variant_str = f"variant {firmware_variant} of " if firmware_variant else ""
     if download_only:
-        for mcu_to_download in ['TEENSY40', 'TEENSY32']:
-            if firmware_version is None:
-                firmware_version = teensytoany.TeensyToAny.get_latest_available_firmware_version(
-                    mcu=mcu_to_download, online=True, local=False
-                )
-            print(
-                f"Downloading {variant_str} firmware version {firmware_version} "
-                f"for {mcu_to_download}."
-            )
-            teensytoany.TeensyToAny.download_firmware(
-                mcu=mcu_to_download,
-                version=firmware_version,
-                variant=firmware_variant
+        if firmware_version is None:
+            firmware_version = teensytoany.TeensyToAny.get_latest_available_firmware_version(
+                mcu='TEENSY40', online=True, local=False
             )
+        print(
+            f"Downloading {variant_str}firmware version {firmware_version} "
+            f"for {', '.join(MCUS)}."
+        )
+        results = prefetch_firmware(
+            version=firmware_version,
+            mcus=MCUS,
+            variants=[firmware_variant],
+        )
+        failed = False
+        for (mcu_downloaded, _), result in results.items():
+            if isinstance(result, Exception):
+                failed = True
+                print(f"{mcu_downloaded}: {result}")
+        if failed:
+            sys.exit(1)
+        return
+
+    if serial_numbers is not None or all_devices:
+        _program_many(
+            None if all_devices else serial_numbers,
+            mcu=mcu,
+            firmware_version=firmware_version,
+            firmware_variant=firmware_variant,
+            jobs=jobs,
+        )
         return
 
     print('Programming please wait...')
@@ -42,6 +73,32 @@ def teensytoany_programmer(
         print(f"TeensyToAny serial_number: {teensy.serial_number}")
 
 
+def _program_many(serial_numbers, *, mcu, firmware_version, firmware_variant, jobs):
+    print('Programming please wait...')
+    results = program_firmware_parallel(
+        serial_numbers,
+        mcu=mcu,
+        version=firmware_version,
+        variant=firmware_variant,
+        max_concurrency=jobs,
+    )
+    for result in results:
+        if result.ok:
+            print(
+                f"{result.serial_number}: programmed version {result.version} "
+                f"in {result.duration:.1f} s"
+            )
+        else:
+            print(
+                f"{result.serial_number}: FAILED after {result.duration:.1f} s: "
+                f"{result.error}"
+            )
+    failed = sum(not result.ok for result in results)
+    if failed:
+        print(f"Failed to program {failed} of {len(results)} devices.")
+        sys.exit(1)
+
+
 @click.command(epilog=f"Version {teensytoany.__version__}")
 @click.option(
     '--serial-number',
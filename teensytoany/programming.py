@@ -0,0 +1,139 @@
+"""Program the firmware of many TeensyToAny boards at once.
+
+Programming a board runs ``teensy_loader_cli`` and waits for the board to
+reboot, which mostly consists of waiting on the board itself. Boards are
+therefore programmed concurrently, each from its own thread, with at most
+``max_concurrency`` loaders running at a time::
+
+    from teensytoany.programming import program_firmware_parallel
+
+    results = program_firmware_parallel(mcu='TEENSY40')
+    for result in results:
+        print(result.serial_number, result.ok, result.duration)
+"""
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from .teensytoany import TeensyToAny
+
+__all__ = [
+    'ProgrammingResult',
+    'program_firmware_parallel',
+]
+
+
+class ProgrammingResult(namedtuple(
+    'ProgrammingResult', ['serial_number', 'version', 'duration', 'error']
+)):
+    """The outcome of programming one board.
+
+    ``version`` is the version reported by the board once it rebooted and
+    ``duration`` the time taken, in seconds, from starting the loader until
+    the board answered. If programming failed, ``error`` is the exception
+    that was raised and ``version`` is None.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """True if the board was programmed and answered after rebooting."""
+        return self.error is None
+
+
+def program_firmware_parallel(
+    serial_numbers=None,
+    *,
+    mcu,
+    version=None,
+    variant=None,
+    max_concurrency=4,
+    verbose=False,
+    timeout=2,
+    reboot_timeout=10,
+    poll_interval=0.1,
+    run=subprocess.check_call,
+    find_devices=None,
+    query_version=None,
+):
+    """Program many boards concurrently.
+
+    Parameters
+    ----------
+    serial_numbers: list of str, optional
+        The boards to program. By default, every connected TeensyToAny board
+        is programmed.
+
+    mcu, version, variant:
+        The firmware to program, see :meth:`TeensyToAny.program_firmware`.
+        It is downloaded once, before any board is programmed.
+
+    max_concurrency: int
+        The maximum number of boards programmed at the same time.
+
+    verbose: bool
+        Passed to ``teensy_loader_cli``.
+
+    timeout: float
+        The timeout used to download the firmware.
+
+    reboot_timeout: float
+        How long to wait, in seconds, for each board to answer after it was
+        programmed.
+
+    poll_interval: float
+        How often, in seconds, to look for the rebooted boards.
+
+    run: callable
+        Runs the loader command, given as a list of arguments, and raises on
+        failure. It may be replaced for testing.
+
+    find_devices, query_version: callable, optional
+        Used to find the rebooted boards and ask their version, see
+        :meth:`TeensyToAny.wait_for_device`. They may be replaced for testing.
+
+    Returns
+    -------
+    results: list of ProgrammingResult
+        The result of each board, in the order of ``serial_numbers``. A board
+        that fails does not stop the others from being programmed.
+    """
+    if serial_numbers is None:
+        serial_numbers = TeensyToAny.list_all_serial_numbers()
+    serial_numbers = list(serial_numbers)
+    if len(set(serial_numbers)) != len(serial_numbers):
+        raise ValueError("Each board may only be programmed once.")
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1.")
+
+    firmware_filename = TeensyToAny._prepare_firmware(  # pylint: disable=protected-access
+        mcu=mcu, version=version, variant=variant, timeout=timeout)
+
+    def program(serial_number):
+        start = perf_counter()
+        try:
+            run(TeensyToAny._loader_command(  # pylint: disable=protected-access
+                serial_number,
+                mcu=mcu,
+                firmware_filename=firmware_filename,
+                verbose=verbose,
+            ))
+            found_version = TeensyToAny.wait_for_device(
+                serial_number,
+                timeout=reboot_timeout,
+                poll_interval=poll_interval,
+                find_devices=find_devices,
+                query_version=query_version,
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            return ProgrammingResult(serial_number, None, perf_counter() - start, e)
+        return ProgrammingResult(serial_number, found_version, perf_counter() - start, None)
+
+    if not serial_numbers:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=min(max_concurrency, len(serial_numbers)),
+        thread_name_prefix='TeensyToAny programmer',
+    ) as executor:
+        return list(executor.map(program, serial_numbers))
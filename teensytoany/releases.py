@@ -0,0 +1,211 @@
+"""Cache the latest firmware release published on GitHub.
+
+Asking GitHub for the latest release takes a round trip, or a full timeout
+when the computer is offline. The answer is therefore stored in the user
+cache directory, with the time it was fetched and its ``ETag``, and reused
+for ``ttl`` seconds. After that, the release is requested again with
+``If-None-Match`` so that an unchanged release is confirmed by a short
+``304 Not Modified`` response.
+
+Threads of the same process that need the release at the same time share a
+single request. Failed requests are not repeated for ``retry_interval``
+seconds, during which the last known release, if any, is returned.
+
+Setting the ``TEENSYTOANY_OFFLINE`` environment variable to ``1`` disables
+the requests entirely: the cached release is returned, however old it is.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from .firmware_cache import _replace_atomically, default_cache
+
+__all__ = [
+    'LATEST_RELEASE_URL',
+    'ReleaseCache',
+    'default_release_cache',
+    'offline_mode',
+]
+
+LATEST_RELEASE_URL = (
+    "https://api.github.com/repos/ramonaoptics/teensy-to-any/releases/latest")
+DEFAULT_TTL = 3600
+DEFAULT_RETRY_INTERVAL = 60
+
+
+def offline_mode():
+    """Return True if the ``TEENSYTOANY_OFFLINE`` environment variable is set."""
+    return os.environ.get('TEENSYTOANY_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+class ReleaseCache:
+    """The latest release, stored in a file and refreshed when it is too old.
+
+    Parameters
+    ----------
+    path: str or Path
+        The JSON file holding the cached release.
+
+    url: str
+        The GitHub API endpoint of the latest release.
+
+    ttl: float
+        How long, in seconds, the cached release is used without asking
+        GitHub again.
+
+    retry_interval: float
+        How long, in seconds, to wait after a failed request before trying
+        again.
+    """
+
+    def __init__(
+        self,
+        path,
+        *,
+        url=LATEST_RELEASE_URL,
+        ttl=DEFAULT_TTL,
+        retry_interval=DEFAULT_RETRY_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.url = url
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._in_flight = None
+        self._failure = None
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(record, dict) or record.get('url') != self.url:
+            return None
+        if not isinstance(record.get('tag'), str):
+            return None
+        fetched = record.get('fetched')
+        if isinstance(fetched, bool) or not isinstance(fetched, (int, float)):
+            return None
+        if not isinstance(record.get('etag'), (str, type(None))):
+            return None
+        return record
+
+    def _write(self, record):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(record, indent=1, sort_keys=True).encode('utf-8')
+        _replace_atomically(self.path, lambda f: f.write(data))
+
+    def clear(self):
+        """Forget the cached release."""
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def latest(self, *, timeout=2, max_age=None, offline=None):
+        """Return the tag of the latest release.
+
+        Parameters
+        ----------
+        timeout: float
+            The timeout of the request, if one is needed.
+
+        max_age: float, optional
+            How old, in seconds, the cached release may be. Defaults to
+            ``ttl``. With 0, GitHub is always asked, with a conditional
+            request.
+
+        offline: bool, optional
+            If True, return the cached release without making any request.
+            Defaults to the ``TEENSYTOANY_OFFLINE`` environment variable.
+
+        Raises
+        ------
+        RuntimeError
+            If the release could not be fetched and none is cached.
+        """
+        if max_age is None:
+            max_age = self.ttl
+        if offline is None:
+            offline = offline_mode()
+
+        record = self._read()
+        if record is not None and (
+            offline or 0 <= time.time() - record['fetched'] < max_age
+        ):
+            return record['tag']
+        if offline:
+            raise RuntimeError(
+                "The latest release is unknown and requests are disabled by "
+                "offline mode."
+            )
+
+        with self._lock:
+            future = self._in_flight
+            fetching = future is None
+            if fetching:
+                future = self._in_flight = Future()
+        if not fetching:
+            # Another thread is already asking GitHub
+            return future.result()
+
+        try:
+            tag = self._fetch(record, timeout)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(tag)
+        finally:
+            with self._lock:
+                self._in_flight = None
+        return tag
+
+    def _fetch(self, record, timeout):
+        if self._failure is not None and time.monotonic() - self._failure[0] < self.retry_interval:
+            if record is not None:
+                return record['tag']
+            raise self._failure[1]
+
+        import requests  # pylint: disable=import-outside-toplevel
+        headers = {'Accept': 'application/vnd.github+json'}
+        if record is not None and record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        try:
+            response = requests.get(self.url, headers=headers, timeout=timeout)
+            if response.status_code == 304 and record is not None:
+                tag, etag = record['tag'], record.get('etag')
+            elif response.status_code == 200:
+                tag = response.json()["tag_name"]
+                etag = response.headers.get('ETag')
+            else:
+                raise RuntimeError(
+                    "Failed to fetch the latest release information. "
+                    f"Status code: {response.status_code}")
+        except (requests.RequestException, RuntimeError, ValueError, KeyError) as e:
+            error = RuntimeError(f"Failed to fetch the latest release information: {e}")
+            self._failure = (time.monotonic(), error)
+            if record is not None:
+                return record['tag']
+            raise error from e
+
+        self._failure = None
+        self._write({'url': self.url, 'tag': tag, 'etag': etag, 'fetched': time.time()})
+        return tag
+
+
+_default_release_cache = []
+_default_release_cache_lock = threading.Lock()
+
+
+def default_release_cache():
+    """Return the release cache in the user cache directory, used by ``TeensyToAny``."""
+    with _default_release_cache_lock:
+        if not _default_release_cache:
+            _default_release_cache.append(
+                ReleaseCache(default_cache().directory / 'latest_release.json'))
+        return _default_release_cache[0]
@@ -0,0 +1,332 @@
+"""Record the commands sent to a device and replay them offline.
+
+A device opened with ``TeensyToAny(record='session.jsonl')`` appends every
+write to its port and every response it reads, with their timestamps, to a
+JSON lines log. Each line is written and flushed as it happens, so that
+captures lasting hours do not accumulate in memory and a crash does not lose
+the end of the session::
+
+    {"open": "2026-10-18T09:12:03.120021+00:00", "port": "/dev/ttyACM0", "format": 1}
+    {"t": 0.000051, "w": "version\\n"}
+    {"t": 0.000902, "r": "0 0.18.0\\n", "dt": 0.000843}
+
+``t`` is the time, in seconds, since the port was opened, at which the write
+or read returned and ``dt`` the time spent waiting for the response. The
+bytes are stored as latin-1 strings so that any payload round trips.
+
+:class:`ReplayTransport` answers the commands of a ``TeensyToAny`` from such
+a log, with the original timing, scaled timing, or no waiting at all::
+
+    from functools import partial
+
+    with TeensyToAny(port='session.jsonl',
+                     transport=partial(ReplayTransport, time_scale=0)) as teensy:
+        run_acquisition(teensy)
+
+:func:`analyze_session` estimates what a captured session would have taken
+if its commands had been pipelined, see ``teensytoany session-report``.
+"""
+import json
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from .instrumentation import _verb
+from .teensytoany import TeensyToAny
+
+__all__ = [
+    'ReplayMismatch',
+    'ReplayTransport',
+    'SessionRecorder',
+    'analyze_session',
+    'read_session',
+]
+
+FORMAT = 1
+
+
+def _encode(data):
+    return bytes(data).decode('latin-1')
+
+
+def _decode(text):
+    return text.encode('latin-1')
+
+
+class SessionRecorder:
+    """Log the writes and reads of a serial port to a JSON lines file.
+
+    The recorder implements the subset of the ``serial.Serial`` interface
+    used by :class:`TeensyToAny`, forwarding every call to ``serial``.
+
+    Parameters
+    ----------
+    serial:
+        The opened port. The recorder takes ownership of it and closes it
+        when it is closed.
+
+    log: str, path or file
+        The log to append to. Files opened by the caller are flushed, but
+        not closed, when the recorder is closed.
+    """
+
+    def __init__(self, serial, log):
+        self._serial = serial
+        if hasattr(log, 'write'):
+            self._file = log
+            self._owns_file = False
+        else:
+            self._file = open(log, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+            self._owns_file = True
+        self._start = time.perf_counter()
+        self._log({
+            'open': datetime.now(timezone.utc).isoformat(),
+            'port': getattr(serial, 'port', None),
+            'format': FORMAT,
+        })
+
+    def _log(self, event):
+        self._file.write(json.dumps(event, separators=(', ', ': ')) + '\n')
+        self._file.flush()
+
+    @property
+    def port(self):
+        return self._serial.port
+
+    @property
+    def timeout(self):
+        return self._serial.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._serial.timeout = value
+
+    def write(self, data):
+        written = self._serial.write(data)
+        self._log({'t': round(time.perf_counter() - self._start, 6), 'w': _encode(data)})
+        return written
+
+    def read_until(self, expected=b'\n', size=None):
+        start = time.perf_counter()
+        data = self._serial.read_until(expected, size=size)
+        end = time.perf_counter()
+        self._log({
+            't': round(end - self._start, 6),
+            'r': _encode(data),
+            'dt': round(end - start, 6),
+        })
+        return data
+
+    def flush(self):
+        self._serial.flush()
+
+    def reset_output_buffer(self):
+        self._serial.reset_output_buffer()
+
+    def reset_input_buffer(self):
+        self._serial.reset_input_buffer()
+
+    def close(self):
+        try:
+            self._serial.close()
+        finally:
+            if self._owns_file:
+                self._file.close()
+            else:
+                self._file.flush()
+
+
+def read_session(log):
+    """Iterate over the events of a session log without loading it at once.
+
+    Yields dicts with the ``kind`` of each event: the header of each
+    connection, ``'open'``, then its ``'write'`` and ``'read'`` events with
+    their time ``t``, their ``data`` as bytes and, for reads, ``dt``.
+    """
+    with open(log, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            if 'w' in event:
+                yield {'kind': 'write', 't': event['t'], 'data': _decode(event['w'])}
+            elif 'r' in event:
+                yield {
+                    'kind': 'read', 't': event['t'], 'data': _decode(event['r']),
+                    'dt': event['dt'],
+                }
+            else:
+                yield {'kind': 'open', **event}
+
+
+class ReplayMismatch(RuntimeError):
+    """The commands sent during a replay differ from the recorded ones."""
+
+
+class ReplayTransport:
+    """Answer the commands of a ``TeensyToAny`` from a session log.
+
+    Pass the class, or a ``functools.partial`` of it, as the ``transport``
+    of ``TeensyToAny`` and the log as its ``port``.
+
+    Parameters
+    ----------
+    port: str or path
+        The session log recorded with ``TeensyToAny(record=...)``.
+
+    time_scale: float
+        Each read waits for the recorded response time multiplied by
+        ``time_scale``: 1 replays the original timing, 0.5 a link twice as
+        fast and 0 does not wait.
+
+    strict: bool
+        If True, raise :class:`ReplayMismatch` when a write differs from the
+        recorded one.
+
+    baudrate, timeout:
+        Accepted for compatibility with ``serial.Serial`` and ignored, the
+        recorded responses and timeouts are replayed instead.
+    """
+
+    def __init__(self, port, *, time_scale=1.0, strict=True, baudrate=None, timeout=None):
+        # pylint: disable=unused-argument
+        self.port = port
+        self.timeout = timeout
+        self.time_scale = time_scale
+        self.strict = strict
+        self._events = read_session(port)
+        # Skip the header of the first connection
+        self._next_event('open')
+
+    def _next_event(self, kind):
+        for event in self._events:
+            if event['kind'] == kind:
+                return event
+            if event['kind'] != 'open':
+                raise ReplayMismatch(
+                    f"Expected a {kind} but the session recorded a {event['kind']} of "
+                    f"{event['data']!r} at {event['t']} s."
+                )
+        raise ReplayMismatch(f"The session ended before the next {kind}.")
+
+    def write(self, data):
+        event = self._next_event('write')
+        if self.strict and event['data'] != bytes(data):
+            raise ReplayMismatch(
+                f"Wrote {bytes(data)!r} but the session recorded {event['data']!r} "
+                f"at {event['t']} s."
+            )
+        return len(data)
+
+    def read_until(self, expected=b'\n', size=None):  # pylint: disable=unused-argument
+        event = self._next_event('read')
+        if self.time_scale:
+            time.sleep(event['dt'] * self.time_scale)
+        return event['data']
+
+    def flush(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self._events.close()
+
+
+def analyze_session(log, *, max_bytes_in_flight=TeensyToAny.INPUT_BUFFER_SIZE):
+    """Estimate how long a session would have taken with pipelining.
+
+    The round trip of each command is measured from the write that sent it
+    to the read of its response. The shortest round trip of the session
+    estimates the latency of the link, and the rest of each round trip the
+    time the device and the transfer took. Sending consecutive commands in
+    batches of up to ``max_bytes_in_flight`` bytes pays the latency of the
+    link once per batch instead of once per command.
+
+    The estimate assumes the host never waits for a response before sending
+    the next command, so it bounds what pipelining can save.
+
+    Returns
+    -------
+    report: dict
+        ``duration`` of the session, in seconds, of which ``waiting`` was
+        spent waiting for responses and ``host`` elsewhere, the estimated
+        ``link_latency``, the number of ``commands`` and ``batches``, the
+        ``pipelined`` duration estimate and the ``speedup`` it gives.
+        ``verbs`` reports the ``count`` and ``total_time`` of each verb.
+    """
+    duration = 0.0
+    waiting = 0.0
+    segment_end = 0.0
+    written = deque()
+    round_trips = []
+    # Responses that may still arrive for commands that timed out, and the
+    # response to version, which marks the end of them, see
+    # TeensyToAny._resynchronize
+    stale = 0
+    marker = None
+    for event in read_session(log):
+        if event['kind'] == 'open':
+            duration += segment_end
+            segment_end = 0.0
+            written.clear()
+            stale = 0
+            marker = None
+            continue
+        segment_end = event['t']
+        if event['kind'] == 'write':
+            for line in event['data'].splitlines(keepends=True):
+                written.append((line, event['t']))
+            continue
+        waiting += event['dt']
+        data = event['data']
+        if not data.endswith(b'\n'):
+            # Like the client, give up on the commands in flight, the rest of
+            # their responses are read and dropped later
+            stale += len(written)
+            written.clear()
+            continue
+        if stale:
+            if not (written and written[0][0] == b'version\n' and data == marker):
+                stale -= 1
+                continue
+            # The marker, the responses that did not arrive never will
+            stale = 0
+        if written:
+            command, sent_at = written.popleft()
+            round_trips.append((command, event['t'] - sent_at))
+            if command == b'version\n':
+                marker = data
+    duration += segment_end
+
+    latency = min((round_trip for _, round_trip in round_trips), default=0.0)
+    batches = 0
+    in_batch = max_bytes_in_flight
+    verbs = {}
+    for command, round_trip in round_trips:
+        if in_batch + len(command) > max_bytes_in_flight:
+            batches += 1
+            in_batch = 0
+        in_batch += len(command)
+        verb = verbs.setdefault(_verb(command), {'count': 0, 'total_time': 0.0})
+        verb['count'] += 1
+        verb['total_time'] += round_trip
+
+    device = sum(round_trip for _, round_trip in round_trips) - latency * len(round_trips)
+    host = max(duration - waiting, 0.0)
+    pipelined = host + device + latency * batches
+    return {
+        'duration': duration,
+        'waiting': waiting,
+        'host': host,
+        'link_latency': latency,
+        'commands': len(round_trips),
+        'batches': batches,
+        'pipelined': pipelined,
+        'speedup': duration / pipelined if pipelined else 1.0,
+        'verbs': verbs,
+    }
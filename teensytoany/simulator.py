@@ -0,0 +1,604 @@
+"""A simulated TeensyToAny board served over a pseudo-terminal.
+
+The simulator answers the line protocol of the firmware, as used by
+:class:`~teensytoany.TeensyToAny`, on the slave side of a pty. Every command
+is answered with ``0`` or ``0 <message>``, or with ``<errno> <description>``
+when it fails. The i2c, spi, gpio, register, eeprom and fastled commands act
+on an in-memory model of the board, lines longer than the 2048 byte input
+buffer of the firmware are rejected and each response may be delayed to
+model the USB round trip and the time taken by the board::
+
+    from teensytoany import TeensyToAny
+    from teensytoany.simulator import TeensyToAnySimulator
+
+    with TeensyToAnySimulator(latency=100E-6, jitter=50E-6) as simulator:
+        with TeensyToAny(simulator.serial_number, port=simulator.port) as teensy:
+            teensy.i2c_write_uint8(0x20, 0x10, 0xFF)
+            assert teensy.i2c_read_uint8(0x20, 0x10) == 0xFF
+
+Opening the device by port does not enumerate the serial ports, so the
+simulator only needs a system with pseudo-terminals, such as Linux or macOS.
+
+.. versionadded:: 0.15.0
+"""
+import errno
+import os
+import random
+import select
+import threading
+import time
+import tty
+from binascii import a2b_base64, b2a_base64
+from functools import partial
+
+from .teensytoany import TeensyToAny
+
+__all__ = [
+    'SimulatorError',
+    'TeensyToAnySimulator',
+]
+
+INPUT_BUFFER_SIZE = TeensyToAny.INPUT_BUFFER_SIZE
+_REGISTER_MASKS = {'uint8': 0xFF, 'uint16': 0xFFFF, 'uint32': 0xFFFFFFFF}
+
+_ENCODERS = {
+    'hex': bytes.hex,
+    'base64': lambda payload: b2a_base64(payload, newline=False).decode('ascii'),
+}
+
+
+def _decode_base64(token):
+    payload = a2b_base64(token.encode('ascii'))
+    # a2b_base64 skips invalid characters, which the firmware rejects
+    if _ENCODERS['base64'](payload) != token:
+        raise ValueError(token)
+    return payload
+
+
+_DECODERS = {'hex': bytes.fromhex, 'base64': _decode_base64}
+# The commands whose last argument, or response, is a payload in the
+# compact encodings
+_PAYLOAD_ARGUMENTS = frozenset([
+    'i2c_write_payload', 'i2c_1_write_payload', 'spi_transfer_bulk', 'fastled_set_rgb_bulk',
+])
+_PAYLOAD_RESPONSES = frozenset(
+    f'{bus}_read_payload{suffix}'
+    for bus in ('i2c', 'i2c_1')
+    for suffix in ('', '_no_register', '_uint16')
+) | {'spi_transfer_bulk'}
+
+
+class SimulatorError(Exception):
+    """Raised by a simulated command to answer with an error code."""
+
+    def __init__(self, code, message=None):
+        super().__init__(code, message)
+        self.code = code
+        self.message = message if message is not None else os.strerror(code)
+
+
+def _int(token):
+    return int(token, base=0)
+
+
+def _level(token):
+    """Parse a pin level, ``0``, ``1``, ``LOW`` or ``HIGH``."""
+    upper = token.upper()
+    if upper in ('HIGH', 'LOW'):
+        return int(upper == 'HIGH')
+    return int(bool(_int(token)))
+
+
+class _I2CBus:
+    """The devices of an i2c bus, each with 65536 byte registers."""
+
+    def __init__(self, addresses, buffer_size):
+        # None means that a device answers at every address
+        self.addresses = None if addresses is None else set(addresses)
+        self.buffer_size = buffer_size
+        self.memory = {}
+        self.transaction = None
+
+    def device(self, address):
+        if self.addresses is not None and address not in self.addresses:
+            raise SimulatorError(errno.ENXIO)
+        return self.memory.setdefault(address, {})
+
+    def read(self, address, register, size):
+        memory = self.device(address)
+        return [memory.get((register + i) & 0xFFFF, 0) for i in range(size)]
+
+    def write(self, address, register, data):
+        memory = self.device(address)
+        for i, value in enumerate(data):
+            memory[(register + i) & 0xFFFF] = value & 0xFF
+
+
+class TeensyToAnySimulator:
+    """Simulate a TeensyToAny board on a pseudo-terminal.
+
+    Parameters
+    ----------
+    version: str
+        The firmware version reported by ``version``.
+
+    mcu: str
+        The microcontroller reported by ``mcu``.
+
+    serial_number: str
+        The serial number reported by ``serialnumber``.
+
+    latency: float
+        The time, in seconds, taken to answer each command.
+
+    jitter: float
+        A random delay, between 0 and ``jitter`` seconds, added to the
+        latency of each command.
+
+    latencies: dict, optional
+        The latency of specific commands, by name, replacing ``latency``.
+
+    i2c_devices, i2c_1_devices: iterable of int, optional
+        The addresses that answer on each i2c bus. By default, a device
+        answers at every address.
+
+    i2c_buffer_size, i2c_1_buffer_size, spi_buffer_size: int
+        The buffer sizes reported by the board. ``i2c_write`` commands larger
+        than the i2c buffer are rejected, as are ``i2c_write_payload``
+        commands whose payload and register address of up to two bytes do not
+        fit in it, and ``spi_transfer_bulk`` commands larger than the spi
+        buffer.
+
+    eeprom_size: int
+        The number of bytes of the eeprom, initially erased to 0xFF.
+
+    payload_encodings: iterable of str
+        The compact payload encodings, ``'hex'`` and ``'base64'``, listed by
+        ``payload_encodings`` and accepted by the bulk commands suffixed with
+        their name, see :mod:`teensytoany.encoder`. By default the board, like
+        firmware 0.18.0, only accepts space separated numbers and
+        ``payload_encodings`` is an unknown command.
+
+    seed: int, optional
+        The seed of the random jitter.
+
+    Attributes
+    ----------
+    port: str
+        The path of the port to open.
+
+    commands: list of str
+        Every command received, in order.
+
+    registers, eeprom, pins, leds:
+        The state of the simulated board.
+    """
+
+    def __init__(
+        self,
+        *,
+        version='0.18.0',
+        mcu='TEENSY40',
+        serial_number='SIMULATED',
+        latency=0,
+        jitter=0,
+        latencies=None,
+        i2c_devices=None,
+        i2c_1_devices=None,
+        i2c_buffer_size=32,
+        i2c_1_buffer_size=32,
+        spi_buffer_size=4096,
+        eeprom_size=1080,
+        seed=None,
+        payload_encodings=(),
+    ):
+        self.version = version
+        self.mcu = mcu
+        self.serial_number = serial_number
+        self.latency = latency
+        self.jitter = jitter
+        self.latencies = dict(latencies or {})
+        self.spi_buffer_size = spi_buffer_size
+        self.payload_encodings = tuple(payload_encodings)
+        self.commands = []
+        self.registers = {}
+        self.eeprom = bytearray(b'\xff' * eeprom_size)
+        # Pin number to [mode, level]
+        self.pins = {}
+        self.leds = []
+        self.brightness = 255
+        self._i2c = {
+            'i2c': _I2CBus(i2c_devices, i2c_buffer_size),
+            'i2c_1': _I2CBus(i2c_1_devices, i2c_1_buffer_size),
+        }
+        self._random = random.Random(seed)
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._stop = False
+        self._thread = threading.Thread(
+            target=self._serve, daemon=True, name='TeensyToAnySimulator')
+        self._thread.start()
+
+    def i2c_memory(self, address, *, bus='i2c'):
+        """Return the registers of an i2c device, as a dict."""
+        return self._i2c[bus].device(address)
+
+    def _serve(self):
+        buffer = b''
+        overflow = False
+        while not self._stop:
+            try:
+                readable, _, _ = select.select([self._master], [], [], 0.05)
+                if not readable:
+                    continue
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            buffer += data
+            while True:
+                line, newline, rest = buffer.partition(b'\n')
+                if not newline:
+                    if len(buffer) >= INPUT_BUFFER_SIZE:
+                        # The firmware drops the rest of the line
+                        overflow = True
+                        buffer = b''
+                    break
+                buffer = rest
+                if overflow or len(line) + 1 > INPUT_BUFFER_SIZE:
+                    overflow = False
+                    response = f'{errno.E2BIG} {os.strerror(errno.E2BIG)}'
+                else:
+                    command = line.decode('utf-8', errors='replace').strip()
+                    self.commands.append(command)
+                    response = self.respond(command)
+                if response is not None:
+                    try:
+                        os.write(self._master, (response + '\n').encode('utf-8'))
+                    except OSError:
+                        return
+
+    def respond(self, command):
+        """Return the response line to ``command``, without its newline."""
+        name, *arguments = command.split() or ['']
+        delay = self.latencies.get(name, self.latency)
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        method = self._command(name)
+        try:
+            if method is None:
+                raise SimulatorError(errno.EINVAL, f'Unknown command {name}')
+            message = method(*arguments)
+        except SimulatorError as e:
+            return f'{e.code} {e.message}'
+        except (ValueError, TypeError, IndexError):
+            # Missing, extra or malformed arguments
+            return f'{errno.EINVAL} {os.strerror(errno.EINVAL)}'
+        if message is None:
+            return '0'
+        return f'0 {message}'
+
+    def _command(self, name):
+        """Return the method answering a command, or None if it is unknown."""
+        base, _, encoding = name.rpartition('_')
+        if encoding in self.payload_encodings and (
+                base in _PAYLOAD_ARGUMENTS or base in _PAYLOAD_RESPONSES):
+            method = self._command(base) or getattr(self, f'_{base}', None)
+            return partial(self._encoded, method, base, encoding)
+        for bus in ('i2c_1', 'i2c'):
+            if name.startswith(f'{bus}_'):
+                method = getattr(self, f'_i2c_{name[len(bus) + 1:]}', None)
+                return None if method is None else partial(method, bus)
+        operation, _, width = name.rpartition('_')
+        if operation in ('register_read', 'register_write') and width in _REGISTER_MASKS:
+            return partial(getattr(self, f'_{operation}'), mask=_REGISTER_MASKS[width])
+        return getattr(self, f'_do_{name}', None)
+
+    @staticmethod
+    def _encoded(method, name, encoding, *arguments):
+        """Answer a command whose payload is in a compact encoding."""
+        if name in _PAYLOAD_ARGUMENTS:
+            *arguments, token = arguments
+            # Invalid payloads raise ValueError, answered with EINVAL
+            payload = _DECODERS[encoding](token)
+            arguments.extend(str(value) for value in payload)
+        message = method(*arguments)
+        if name in _PAYLOAD_RESPONSES:
+            message = _ENCODERS[encoding](bytes(_int(value) for value in message.split()))
+        return message
+
+    def close(self):
+        self._stop = True
+        for fd in (self._slave, self._master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._thread.join(timeout=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Board information
+    def _do_version(self):
+        return self.version
+
+    def _do_mcu(self):
+        return self.mcu
+
+    def _do_serialnumber(self):
+        return self.serial_number
+
+    def _do_info(self):
+        return f'TeensyToAny simulator {self.version} {self.mcu}'
+
+    def _do_license(self):
+        return 'BSD-3-Clause'
+
+    def _do_nop(self):
+        pass
+
+    def _do_payload_encodings(self):
+        if not self.payload_encodings:
+            raise SimulatorError(errno.EINVAL, 'Unknown command payload_encodings')
+        return ' '.join(self.payload_encodings)
+
+    def _do_reboot(self):
+        pass
+
+    def _do_sleep(self, duration):
+        time.sleep(float(duration))
+
+    def _do_startup_commands_available(self):
+        return '0'
+
+    def _do_post_serial_startup_commands_available(self):
+        return '0'
+
+    def _do_demo_commands_available(self):
+        return '0'
+
+    def _do_demo_commands_enabled(self):
+        return '0'
+
+    def _do_enable_demo_commands(self):
+        pass
+
+    def _do_disable_demo_commands(self):
+        pass
+
+    def _do_read_startup_command(self, index):
+        raise SimulatorError(errno.EINVAL, f'No startup command {index}')
+
+    _do_read_post_serial_startup_command = _do_read_startup_command
+
+    # i2c, the same commands exist for both buses
+    def _i2c_init(self, bus, baud_rate, timeout, register_space):
+        del bus
+        for argument in (baud_rate, timeout, register_space):
+            _int(argument)
+
+    def _i2c_read_uint8(self, bus, address, register):
+        value, = self._i2c[bus].read(_int(address), _int(register), 1)
+        return f'0x{value:02x}'
+
+    def _i2c_read_uint16(self, bus, address, register):
+        high, low = self._i2c[bus].read(_int(address), _int(register), 2)
+        return f'0x{high << 8 | low:04x}'
+
+    def _i2c_write_uint8(self, bus, address, register, data):
+        self._i2c[bus].write(_int(address), _int(register), [_int(data)])
+
+    def _i2c_write_uint16(self, bus, address, register, data):
+        data = _int(data)
+        self._i2c[bus].write(_int(address), _int(register), [data >> 8, data])
+
+    def _i2c_write_payload(self, bus, address, register, *payload):
+        if not payload:
+            raise SimulatorError(errno.EINVAL)
+        if len(payload) + 2 > self._i2c[bus].buffer_size:
+            raise SimulatorError(errno.EMSGSIZE)
+        self._i2c[bus].write(_int(address), _int(register), [_int(p) for p in payload])
+
+    def _i2c_read_payload(self, bus, address, register, num_bytes):
+        num_bytes = _int(num_bytes)
+        if num_bytes < 1:
+            raise SimulatorError(errno.EINVAL)
+        values = self._i2c[bus].read(_int(address), _int(register), num_bytes)
+        return ' '.join(f'0x{value:02x}' for value in values)
+
+    _i2c_read_payload_uint16 = _i2c_read_payload
+
+    def _i2c_read_payload_no_register(self, bus, address, num_bytes):
+        return self._i2c_read_payload(bus, address, '0', num_bytes)
+
+    def _i2c_ping(self, bus, address):
+        self._i2c[bus].device(_int(address))
+
+    def _i2c_reset(self, bus):
+        self._i2c[bus].transaction = None
+
+    def _i2c_read_no_register_uint8(self, bus, address):
+        return self._i2c_read_uint8(bus, address, '0')
+
+    def _i2c_write_no_register_uint8(self, bus, address, data):
+        self._i2c_write_uint8(bus, address, '0', data)
+
+    def _i2c_begin_transaction(self, bus, address):
+        self._i2c[bus].transaction = (_int(address), [])
+
+    def _i2c_write(self, bus, *data):
+        i2c = self._i2c[bus]
+        if i2c.transaction is None:
+            raise SimulatorError(errno.EINVAL, 'No transaction in progress')
+        if len(data) > i2c.buffer_size:
+            raise SimulatorError(errno.EMSGSIZE)
+        i2c.transaction[1].extend(_int(value) & 0xFF for value in data)
+
+    def _i2c_end_transaction(self, bus, stop='true'):
+        i2c = self._i2c[bus]
+        if i2c.transaction is None:
+            raise SimulatorError(errno.EINVAL, 'No transaction in progress')
+        if stop not in ('true', 'false'):
+            raise ValueError(stop)
+        address, buffer = i2c.transaction
+        i2c.transaction = None
+        # The first byte written selects the register, like most devices
+        if buffer:
+            i2c.write(address, buffer[0], buffer[1:])
+        else:
+            i2c.device(address)
+
+    def _i2c_buffer_size(self, bus):
+        return str(self._i2c[bus].buffer_size)
+
+    # gpio and analog
+    def _pin(self, pin):
+        return self.pins.setdefault(_int(pin), ['INPUT', 0])
+
+    def _do_gpio_pin_mode(self, pin, mode, value=None):
+        modes = {'0': 'INPUT', '1': 'OUTPUT', '2': 'INPUT_PULLUP', '3': 'INPUT_PULLDOWN'}
+        mode = modes.get(mode, mode.upper())
+        if mode not in modes.values() and mode != 'OUTPUT_OPENDRAIN':
+            raise SimulatorError(errno.EINVAL)
+        state = self._pin(pin)
+        state[0] = mode
+        if value is not None:
+            state[1] = _level(value)
+
+    def _do_gpio_digital_write(self, pin, value):
+        self._pin(pin)[1] = _level(value)
+
+    def _do_gpio_digital_read(self, pin):
+        return str(self._pin(pin)[1])
+
+    def _do_gpio_digital_pulse(self, pin, value, value_end, duration):
+        state = self._pin(pin)
+        state[1] = _level(value)
+        time.sleep(float(duration))
+        state[1] = _level(value_end)
+
+    def _do_analog_write(self, pin, value):
+        self._pin(pin)[1] = _int(value)
+
+    def _do_analog_read(self, pin):
+        return str(self._pin(pin)[1])
+
+    def _do_analog_write_frequency(self, pin, frequency):
+        self._pin(pin)
+        float(frequency)
+
+    def _do_analog_write_resolution(self, resolution):
+        _int(resolution)
+
+    def _do_analog_pulse(self, pin, value, value_end, duration):
+        state = self._pin(pin)
+        state[1] = _int(value)
+        time.sleep(float(duration))
+        state[1] = _int(value_end)
+
+    # Registers
+    def _register_read(self, register_address, *, mask):
+        return f'0x{self.registers.get(_int(register_address), 0) & mask:x}'
+
+    def _register_write(self, register_address, value, *, mask):
+        self.registers[_int(register_address)] = _int(value) & mask
+
+    # eeprom
+    def _eeprom_index(self, index):
+        index = _int(index)
+        if not 0 <= index < len(self.eeprom):
+            raise SimulatorError(errno.EINVAL)
+        return index
+
+    def _do_eeprom_read_uint8(self, index):
+        return str(self.eeprom[self._eeprom_index(index)])
+
+    def _do_eeprom_write_uint8(self, index, data):
+        self.eeprom[self._eeprom_index(index)] = _int(data) & 0xFF
+
+    # spi, which reads back the bytes it writes
+    def _do_spi_begin(self):
+        pass
+
+    _do_spi_end = _do_spi_begin_transaction = _do_spi_end_transaction = _do_spi_begin
+
+    def _do_spi_set_miso(self, pin):
+        _int(pin)
+
+    _do_spi_set_mosi = _do_spi_set_sck = _do_spi_set_clock_divider = _do_spi_set_miso
+
+    def _do_spi_settings(self, frequency, bit_order, data_mode):
+        _int(frequency)
+        if bit_order not in ('MSBFIRST', 'LSBFIRST') or not data_mode.startswith('SPI_MODE'):
+            raise SimulatorError(errno.EINVAL)
+
+    def _do_spi_transfer(self, data):
+        return f'0x{_int(data) & 0xFF:02x}'
+
+    _do_spi_read_byte = _do_spi_transfer
+
+    def _do_spi_transfer16(self, data):
+        return f'0x{_int(data) & 0xFFFF:04x}'
+
+    def _do_spi_transfer_bulk(self, *data):
+        if not data or len(data) > self.spi_buffer_size:
+            raise SimulatorError(errno.EINVAL)
+        return ' '.join(f'0x{_int(value) & 0xFF:02x}' for value in data)
+
+    def _do_spi_buffer_size(self):
+        return str(self.spi_buffer_size)
+
+    # fastled
+    def _led(self, index):
+        index = _int(index)
+        if not 0 <= index < len(self.leds):
+            raise SimulatorError(errno.EINVAL)
+        return index
+
+    def _do_fastled_add_leds(self, led_class, has_white, pin, n_leds):
+        del led_class, has_white
+        _int(pin)
+        self.leds.extend([(0, 0, 0)] * _int(n_leds))
+
+    def _do_fastled_set_brightness(self, brightness):
+        self.brightness = _int(brightness) & 0xFF
+
+    def _do_fastled_get_brightness(self):
+        return str(self.brightness)
+
+    def _do_fastled_show(self, brightness=None):
+        if brightness is not None:
+            self._do_fastled_set_brightness(brightness)
+
+    def _do_fastled_set_rgb(self, index, red, green, blue):
+        self.leds[self._led(index)] = (_int(red) & 0xFF, _int(green) & 0xFF, _int(blue) & 0xFF)
+
+    def _fastled_set_rgb_bulk(self, start, *components):
+        # Only available with a compact payload
+        start = _int(start)
+        if not components or len(components) % 3:
+            raise SimulatorError(errno.EINVAL)
+        for i in range(0, len(components), 3):
+            self._do_fastled_set_rgb(str(start + i // 3), *components[i:i + 3])
+
+    def _do_fastled_set_hsv(self, index, hue, saturation, value):
+        # Stored as given, the colour conversion of FastLED is not modelled
+        self.leds[self._led(index)] = (
+            _int(hue) & 0xFF, _int(saturation) & 0xFF, _int(value) & 0xFF)
+
+    def _do_fastled_set_hue(self, index, hue):
+        self.leds[self._led(index)] = (_int(hue) & 0xFF, 255, 255)
+
+    def _do_fastled_set_max_refresh_rate(self, rate):
+        _int(rate)
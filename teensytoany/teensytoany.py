@@ -1,16 +1,57 @@
 import os
-import subprocess
-from contextlib import contextmanager
-from time import sleep
+from contextlib import contextmanager, nullcontext
+from time import monotonic, perf_counter, sleep
+from types import MappingProxyType
 from typing import Sequence
 from warnings import warn
 
-from packaging.version import Version
-from serial import LF, Serial
-from serial.tools.list_ports import comports
+from . import discovery, firmware_cache
+from ._lock import _FairLock
+from .decoder import decode_payload
+from .encoder import COMMAND_TEMPLATES as _TEMPLATES
+from .encoder import (PAYLOAD_ENCODINGS, compact_payload_length,
+                      encode_compact_payload, encode_payload)
+from .firmware_cache import _parse_version
+from .pipeline import TeensyToAnyPipeline
 
 __all__ = ['TeensyToAny']
 
+_LF = b'\n'
+# The last character of a complete response, decoded or not
+_LINE_ENDS = ('\n', _LF)
+# Stale lines discarded at most while resynchronizing
+_RESYNC_MAX_LINES = 4096
+
+
+def _encode_numbers(command, *args):
+    """Encode a command whose arguments are numbers in decimal.
+
+    The precompiled template is only used if every argument is an ``int``,
+    anything else, such as ``'0x400D8000'``, is sent as it formats.
+    """
+    if all(type(arg) is int for arg in args):  # pylint: disable=unidiomatic-typecheck
+        return _TEMPLATES[command] % args
+    return ' '.join([command, *map(str, args)])
+
+
+def _payload_bytes(data):
+    """Return ``data`` as bytes if it only holds integers from 0 to 255, otherwise None.
+
+    Other values, such as ``'0x10'``, are sent as text for the firmware to parse.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return data
+    try:
+        # Not bytes(data), which copies the memory of arrays of wider integers
+        return bytes(list(data))
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_url(port):
+    """Whether a port is a URL, such as ``socket://host:port``, for pyserial."""
+    return '://' in str(port)
+
 
 class TeensyToAny:
     # I've noticed that this is extremely slow. Simply asking the device
@@ -27,6 +68,10 @@ class TeensyToAny:
     VID_PID_s = [
         (0x16C0, 0x0483),
     ]
+    # Lines longer than this, including the newline, are rejected by the
+    # firmware. It is also the most we keep unanswered in a pipeline.
+    INPUT_BUFFER_SIZE = 2048
+    TRANSPORTS = ('serial', 'thread', 'fd')
 
     @staticmethod
     def find(serial_numbers=None):
@@ -92,17 +137,39 @@ class TeensyToAny:
 
     @staticmethod
     def get_latest_available_firmware_version(
-        *, mcu='TEENSY40', online=True, local=True, timeout=2
+        *, mcu='TEENSY40', online=True, local=True, timeout=2, max_age=None
     ):
+        """Return the latest firmware version.
+
+        Parameters
+        ----------
+        mcu: str
+            The microcontroller of the firmware, used to find local versions.
+
+        online: bool
+            If True, the latest release is looked up on GitHub. The answer is
+            cached for an hour, or ``max_age`` seconds, see
+            :mod:`teensytoany.releases`.
+
+        local: bool
+            If True, the versions that were already downloaded are used when
+            the latest release is unknown.
+
+        timeout: float
+            The timeout of the request to GitHub.
+
+        max_age: float, optional
+            How old, in seconds, the cached release may be.
+
+            .. versionadded:: 0.15.0
+        """
         latest = None
         if local:
-            local_versions = TeensyToAny._find_local_versions(mcu=mcu)
-            if len(local_versions) > 0:
-                latest = local_versions[-1]
+            latest = firmware_cache.default_cache().latest_version(mcu=mcu)
         try:
             if online:
                 latest = TeensyToAny._get_latest_available_firmware_online(
-                    timeout=timeout
+                    timeout=timeout, max_age=max_age
                 )
         except Exception:  # pylint: disable=broad-except
             pass
@@ -116,22 +183,10 @@ class TeensyToAny:
         return latest
 
     @staticmethod
-    def _get_latest_available_firmware_online(*, timeout=2):
-        import requests  # pylint: disable=import-outside-toplevel
-
-        repo_url = "https://api.github.com/repos/ramonaoptics/teensy-to-any"
-        releases_url = f"{repo_url}/releases/latest"
-
-        response = requests.get(releases_url, timeout=timeout)
-
-        if response.status_code != 200:
-            raise RuntimeError(
-                "Failed to fetch the latest release information. "
-                f"Status code: {response.status_code}")
-        release_data = response.json()
-        latest_release_version = release_data["tag_name"]
-
-        return latest_release_version
+    def _get_latest_available_firmware_online(*, timeout=2, max_age=None):
+        from . import releases  # pylint: disable=import-outside-toplevel
+        return releases.default_release_cache().latest(
+            timeout=timeout, max_age=max_age)
 
     @staticmethod
     def _device_serial_number_pairs(
@@ -158,9 +213,21 @@ class TeensyToAny:
         device_name=None,
         manufacturer="TeensyToAny",
     ):
+        """Find the ports and serial numbers of the connected devices.
+
+        When serial numbers are provided, their ports are first resolved
+        directly from ``/dev/serial/by-id`` or sysfs on Linux, falling back
+        to enumerating all the serial ports. Results are cached for a short
+        time, see :mod:`teensytoany.discovery`.
+        """
         if device_name is None:
             device_name = "TeensyToAny"
-        com = comports()
+        if serial_numbers:
+            pairs = discovery.find_serial_numbers(
+                serial_numbers, TeensyToAny.VID_PID_s)
+            if pairs is not None:
+                return pairs
+        com = discovery.comports()
         pairs = [
             (c.device, c.serial_number)
             for c in com
@@ -176,8 +243,132 @@ class TeensyToAny:
 
     @property
     def mcu(self):
+        if self._capabilities is not None and self._capabilities['mcu'] is not None:
+            return self._capabilities['mcu']
         return self._ask('mcu')
 
+    @property
+    def capabilities(self):
+        """The features of the connected firmware, determined when it is opened.
+
+        This read-only mapping lets applications, and the methods of this
+        class, branch on the firmware features without parsing the version
+        or asking the device again. It contains:
+
+        ``version``
+            The firmware version.
+        ``mcu``
+            The microcontroller, or None if the firmware does not report it.
+            Like the buffer sizes, it is not asked to firmware older than
+            0.18.0, see :attr:`mcu`.
+        ``i2c_payload``
+            Whether the ``i2c_write_payload`` and ``i2c_read_payload``
+            commands are available, from firmware 0.0.14.
+        ``spi_transfer_returns_data``
+            Whether ``spi_transfer`` returns the byte read, from firmware
+            0.18.0.
+        ``i2c_buffer_size``, ``i2c_1_buffer_size``, ``spi_buffer_size``
+            The buffer sizes reported by the firmware, or None if the firmware
+            does not report them.
+        ``payload_encodings``
+            The compact encodings of bulk payloads the firmware accepts, such
+            as ``('hex', 'base64')``, empty if it only accepts payloads of
+            space separated numbers. It is only asked when a compact encoding
+            is requested, see :attr:`payload_encoding`, and None otherwise.
+
+        It is None while the device is closed.
+        """
+        return self._capabilities
+
+    @property
+    def payload_encoding(self):
+        """The encoding of the bulk payloads sent to and read from the device.
+
+        ``'base64'`` or ``'hex'`` when a compact encoding was requested and
+        the firmware accepts it, see :mod:`teensytoany.encoder`, or None when
+        payloads are sent as space separated numbers. It is chosen when the
+        device is opened, see the ``payload_encoding`` argument of
+        :class:`TeensyToAny`.
+
+        .. versionadded:: 0.15.0
+        """
+        return self._payload_encoding
+
+    # Commands asked to the device to fill in the capability table
+    _PROBED_CAPABILITIES = (
+        'mcu', 'i2c_buffer_size', 'i2c_1_buffer_size', 'spi_buffer_size', 'payload_encodings')
+    # Older firmware is not probed, as it may not answer the commands it does
+    # not know and opening it would wait for each of them to time out
+    _PROBED_MINIMUM_VERSION = "0.18.0"
+
+    @staticmethod
+    def _capability_probes(version, payload_encoding=None):
+        """The commands of ``_PROBED_CAPABILITIES`` the firmware is asked.
+
+        No released firmware answers ``payload_encodings``, so it is only
+        asked when a compact ``payload_encoding`` is requested.
+        """
+        if _parse_version(version) < _parse_version(TeensyToAny._PROBED_MINIMUM_VERSION):
+            return ()
+        if payload_encoding in (None, 'text'):
+            return tuple(
+                command for command in TeensyToAny._PROBED_CAPABILITIES
+                if command != 'payload_encodings')
+        return TeensyToAny._PROBED_CAPABILITIES
+
+    @staticmethod
+    def _build_capabilities(version, probed):
+        """Build the capability table from the version and probed responses.
+
+        ``probed`` maps the commands of ``_PROBED_CAPABILITIES`` that were
+        asked to the message the device returned, or None if it reported an
+        error.
+        """
+        parsed_version = _parse_version(version)
+        capabilities = {
+            'version': version,
+            'i2c_payload': parsed_version >= _parse_version("0.0.14"),
+            'spi_transfer_returns_data': parsed_version >= _parse_version("0.18.0"),
+        }
+        for command in TeensyToAny._PROBED_CAPABILITIES:
+            value = probed.get(command)
+            if value is not None and command.endswith('_buffer_size'):
+                try:
+                    value = int(value, base=0)
+                except ValueError:
+                    value = None
+            elif command == 'payload_encodings' and command in probed:
+                value = tuple(value.split()) if value else ()
+            capabilities[command] = value
+        return MappingProxyType(capabilities)
+
+    @staticmethod
+    def _negotiate_payload_encoding(capabilities, requested=None):
+        """Choose the encoding of bulk payloads, None for space separated numbers."""
+        if requested in (None, 'text'):
+            return None
+        supported = capabilities['payload_encodings'] or ()
+        if requested == 'auto':
+            return next((encoding for encoding in PAYLOAD_ENCODINGS
+                         if encoding in supported), None)
+        if requested not in supported:
+            raise RuntimeError(
+                f"The firmware does not support the '{requested}' payload encoding.")
+        return requested
+
+    def _probe_capabilities(self):
+        with self.pipeline(raise_on_error=False) as p:
+            responses = {
+                command: p.ask(command)
+                for command in self._capability_probes(
+                    self._version, self._requested_payload_encoding)
+            }
+        probed = {
+            command: response.result() if response.exception() is None else None
+            for command, response in responses.items()
+        }
+        return self._build_capabilities(self._version, probed)
+
     def _update_firmware(self, *, mcu=None, variant: str=None, force=False, timeout=2):
         current_version = self.version
         serial_number = self.serial_number
@@ -191,7 +382,7 @@ class TeensyToAny:
 
         latest_version = self.get_latest_available_firmware_version(mcu=mcu, timeout=timeout)
         if not force:
-            if Version(current_version) >= Version(latest_version):
+            if _parse_version(current_version) >= _parse_version(latest_version):
                 return
 
         self.close()
@@ -210,67 +401,38 @@ class TeensyToAny:
 
     @staticmethod
     def _find_local_versions(*, mcu=None):
-        firmware_dir = TeensyToAny._generate_firmware_directory(mcu=mcu)
-        if not firmware_dir.is_dir():
-            return []
-
-        versions = [
-            d.name
-            for d in firmware_dir.iterdir()
-            if d.is_dir() and (d / 'firmware.hex').is_file()
-        ]
-
-        versions.sort(key=Version)
-        return versions
+        return firmware_cache.default_cache().versions(mcu=mcu)
 
     @staticmethod
     def _generate_firmware_filename(*, mcu, version, variant: str=None):
-        firmware_dir = TeensyToAny._generate_firmware_directory(mcu=mcu)
-        if variant is None:
-            firmware_filename = firmware_dir / f"{version}" / "firmware.hex"
-        else:
-            firmware_filename = firmware_dir / f"{version}" / f"firmware_{variant}.hex"
-        return firmware_filename
+        return firmware_cache.default_cache().path(
+            mcu=mcu, version=version, variant=variant)
 
     @staticmethod
     def _generate_firmware_directory(*, mcu):
-        from pathlib import Path  # pylint: disable=import-outside-toplevel
-
-        from appdirs import AppDirs  # pylint: disable=import-outside-toplevel
-        app = AppDirs('teensytoany', 'ramonaoptics')
-        cache_dir = Path(app.user_cache_dir)
-        cache_dir.mkdir(parents=True, exist_ok=True)
-        firmware_dir = cache_dir / f"{mcu.lower()}"
+        firmware_dir = firmware_cache.default_cache().directory / f"{mcu.lower()}"
         firmware_dir.mkdir(parents=True, exist_ok=True)
         return firmware_dir
 
     @staticmethod
-    def download_firmware(*, mcu, version, variant: str=None, timeout=2):
-        firmware_filename = TeensyToAny._generate_firmware_filename(
+    def download_firmware(*, mcu, version, variant: str=None, timeout=2, base_url=None):
+        """Download a firmware file into the cache and return its path.
+
+        The download is streamed and resumed if the connection drops, see
+        :func:`teensytoany.downloads.download_firmware`.
+
+        .. versionadded:: 0.15.0
+            The ``base_url`` parameter, to download from a mirror.
+        """
+        from . import downloads  # pylint: disable=import-outside-toplevel
+        return downloads.download_firmware(
             mcu=mcu,
             version=version,
-            variant=variant
+            variant=variant,
+            timeout=timeout,
+            base_url=base_url,
         )
 
-        import requests  # pylint: disable=import-outside-toplevel
-        release_url = f"https://github.com/ramonaoptics/teensy-to-any/releases/download/{version}/"
-        if variant is None:
-            file_url = release_url + f"firmware_{mcu.lower()}.hex"
-        else:
-            file_url = release_url + f"firmware_{mcu.lower()}_{variant}.hex"
-        response = requests.get(file_url, timeout=timeout)
-        if response.status_code != 200:
-            raise RuntimeError("Failed to download firmware")
-
-        firmware_filename.parent.mkdir(parents=True, exist_ok=True)
-        # Open the file for binary writing
-        with open(firmware_filename, 'wb') as file:
-            # Write the content to the file in chunks
-            for chunk in response.iter_content(chunk_size=4096):
-                file.write(chunk)
-
-        return firmware_filename
-
     @staticmethod
     def program_firmware(
         serial_number=None,
@@ -281,7 +443,19 @@ class TeensyToAny:
         verbose=False,
         wait=False,
         timeout=2,
+        reboot_timeout=10,
     ):
+        """Program the firmware of a device with ``teensy_loader_cli``.
+
+        After the device is programmed, this waits for it to reboot and
+        answer ``version``, for at most ``reboot_timeout`` seconds. See
+        :func:`teensytoany.programming.program_firmware_parallel` to program
+        many devices at once.
+
+        .. versionchanged:: 0.15.0
+            Raises a ``RuntimeError`` if the device does not answer within
+            ``reboot_timeout`` seconds, instead of sleeping for one second.
+        """
         if serial_number is None:
             available_serial_numbers = TeensyToAny.list_all_serial_numbers()
             if len(available_serial_numbers) == 0:
@@ -293,6 +467,24 @@ class TeensyToAny:
                 )
             serial_number = available_serial_numbers[0]
 
+        firmware_filename = TeensyToAny._prepare_firmware(
+            mcu=mcu, version=version, variant=variant, timeout=timeout)
+        cmd_list = TeensyToAny._loader_command(
+            serial_number,
+            mcu=mcu,
+            firmware_filename=firmware_filename,
+            verbose=verbose,
+            wait=wait,
+        )
+
+        import subprocess  # pylint: disable=import-outside-toplevel
+        subprocess.check_call(cmd_list)
+        # Wait for the device to reboot
+        TeensyToAny.wait_for_device(serial_number, timeout=reboot_timeout)
+
+    @staticmethod
+    def _prepare_firmware(*, mcu, version=None, variant: str=None, timeout=2):
+        """Return the firmware file to program, downloading it if needed."""
         if mcu is None:
             raise RuntimeError("mcu must be provided and cannot be left as None.")
 
@@ -304,20 +496,22 @@ class TeensyToAny:
             # there is no serial number specificity
             raise RuntimeError("We do not supporting programing TeensyToAny devices on Windows")
 
-        firmware_filename = TeensyToAny._generate_firmware_filename(
-            mcu=mcu,
-            version=version,
-            variant=variant
-        )
+        # The file is verified against its recorded digest, a file that was
+        # truncated or modified is downloaded again
+        firmware_filename = firmware_cache.default_cache().lookup(
+            mcu=mcu, version=version, variant=variant, verify=True)
 
-        if not firmware_filename.is_file():
-            TeensyToAny.download_firmware(
+        if firmware_filename is None:
+            firmware_filename = TeensyToAny.download_firmware(
                 mcu=mcu,
                 version=version,
                 variant=variant,
                 timeout=timeout
             )
+        return firmware_filename
 
+    @staticmethod
+    def _loader_command(serial_number, *, mcu, firmware_filename, verbose=False, wait=False):
         if verbose:
             verbose = ['-v',]
         else:
@@ -327,7 +521,7 @@ class TeensyToAny:
             wait = ['-w',]
         else:
             wait = []
-        cmd_list = [
+        return [
             'teensy_loader_cli',
             '-s',
         ] + verbose + wait + [
@@ -336,9 +530,79 @@ class TeensyToAny:
             str(firmware_filename),
         ]
 
-        subprocess.check_call(cmd_list)
-        # Wait for the device to reboot
-        sleep(1)
+    @staticmethod
+    def _find_rebooted_device(serial_numbers):
+        # The device re-enumerates, possibly on a different port
+        discovery.invalidate_cache()
+        return TeensyToAny.device_serial_number_pairs(serial_numbers=serial_numbers)
+
+    @staticmethod
+    def _query_version(port, serial_number):
+        with TeensyToAny(serial_number, port=port) as teensy:
+            return teensy.version
+
+    @staticmethod
+    def wait_for_device(
+        serial_number,
+        *,
+        timeout=10,
+        poll_interval=0.1,
+        find_devices=None,
+        query_version=None,
+    ):
+        """Wait for a device to enumerate and answer ``version``.
+
+        This is used after a device is programmed, as it reboots.
+
+        .. versionadded:: 0.15.0
+
+        Parameters
+        ----------
+        serial_number: str
+            The serial number of the device.
+
+        timeout: float
+            How long to wait, in seconds.
+
+        poll_interval: float
+            How long to wait, in seconds, between attempts.
+
+        find_devices: callable, optional
+            Returns the ``(port, serial_number)`` pairs of the given list of
+            serial numbers, like :meth:`device_serial_number_pairs`. It may be
+            replaced for testing.
+
+        query_version: callable, optional
+            Returns the version of the device given its port and serial
+            number. It may be replaced for testing.
+
+        Returns
+        -------
+        version: str
+            The firmware version reported by the device.
+        """
+        if find_devices is None:
+            find_devices = TeensyToAny._find_rebooted_device
+        if query_version is None:
+            query_version = TeensyToAny._query_version
+
+        deadline = monotonic() + timeout
+        while True:
+            try:
+                for port, found_serial_number in find_devices([serial_number]):
+                    if found_serial_number == serial_number:
+                        return query_version(port, serial_number)
+                error = None
+            except Exception as e:  # pylint: disable=broad-except
+                # The port may disappear, or not be ready, while it reboots
+                error = e
+            if monotonic() >= deadline:
+                message = f": {error}" if error is not None else "."
+                raise RuntimeError(
+                    f"Device {serial_number} did not answer within {timeout} s "
+                    f"of being programmed{message}"
+                )
+            sleep(poll_interval)
 
     def __init__(
         self,
@@ -347,13 +611,22 @@ class TeensyToAny:
         timeout=0.205,
         open=True,  # pylint: disable=redefined-builtin
         device_name='TeensyToAny',
+        thread_safe=False,
+        transport='serial',
+        port=None,
+        instrument=False,
+        record=None,
+        timeout_policy=None,
+        pool=None,
+        payload_encoding=None,
     ):
         """A class to control the TeensyToAny Debugger.
 
         Parameters
         ----------
         serial_number: optional
-            If provided, will attempt to open the specified serial number
+            If provided, will attempt to open the specified serial number.
+            A URL, such as ``socket://host:port``, is opened as the ``port``.
 
         baudrate: int
             Baudrate to use for the serial connection.
@@ -371,15 +644,135 @@ class TeensyToAny:
             The name of the device returned during certain error messages.
 
             .. versionadded:: 0.11.1
+
+        thread_safe: bool
+            If True, commands may be sent to the device from multiple threads.
+            Each command holds a lock while waiting for its response. Threads
+            waiting for the lock are served by priority, see :meth:`priority`,
+            then in the order in which they started waiting. Use
+            :meth:`locked` to send several commands without interruption and
+            :meth:`lock_statistics` to monitor contention.
+
+            .. versionadded:: 0.15.0
+
+        transport: 'serial', 'thread', 'fd' or callable
+            With ``'serial'``, responses are read directly with pyserial. With
+            ``'thread'``, a background thread drains the port in large chunks
+            and splits the responses into lines, see
+            :class:`~teensytoany.transport.ThreadedReaderTransport`. On Linux,
+            ``'fd'`` reads and writes the tty with system calls and locks it
+            for exclusive use, see :class:`~teensytoany.transport.FdTransport`.
+            A callable
+            is called as ``transport(port, baudrate=, timeout=)`` and returns
+            an object with the interface of ``serial.Serial``, for instance a
+            :class:`~teensytoany.replay.ReplayTransport`.
+
+            .. versionadded:: 0.15.0
+
+        port: str, optional
+            The serial port of the device. If provided, the device is opened
+            directly instead of searching for it, and ``serial_number`` is
+            only used to report which device was opened.
+
+            The port may also be a URL handled by ``serial.serial_for_url``,
+            such as ``rfc2217://host:port`` for a device exposed on the
+            network. ``socket://host:port`` ports, as served by ``ser2net``,
+            are opened with a :class:`~teensytoany.transport.SocketTransport`,
+            which sets ``TCP_NODELAY``, unless the transport is ``'thread'``
+            or a callable. The ``'fd'`` transport only opens local ttys.
+
+            .. versionadded:: 0.15.0
+
+        instrument: bool or Instrumentation
+            If True, count the commands sent to the device and measure their
+            round trips, see :meth:`stats`. An existing
+            :class:`~teensytoany.instrumentation.Instrumentation` may be given
+            to aggregate the statistics of several devices.
+
+            .. versionadded:: 0.15.0
+
+        record: str, path or file, optional
+            Append the writes and reads of the port, with their timestamps, to
+            this session log, see :mod:`teensytoany.replay`.
+
+            .. versionadded:: 0.15.0
+
+        timeout_policy: TimeoutPolicy, optional
+            Choose the read timeout of each command, for instance from the
+            latency learned by an
+            :class:`~teensytoany.timeouts.AdaptiveTimeoutPolicy`. By default
+            every command waits for ``timeout``.
+
+            .. versionadded:: 0.15.0
+
+        pool: bool or ConnectionPool, optional
+            Reuse the connections to URL ports. Closing the device returns its
+            connection to the pool, if every response was read, and the next
+            device opened on the same URL skips the connection and the
+            ``version`` handshake. True uses the pool shared by the process,
+            see :mod:`teensytoany.pool`. Serial servers usually accept a
+            single connection per port, which an idle connection keeps.
+
+            .. versionadded:: 0.15.0
+
+        payload_encoding: 'auto', 'base64', 'hex' or 'text', optional
+            How bulk payloads are sent to and read from the device. By
+            default, they are sent as space separated numbers, ``'text'``,
+            which every firmware accepts. Otherwise, the device is asked the
+            ``payload_encodings`` it accepts when it is opened. ``'auto'``
+            uses the most compact of them, or text if it lists none, and
+            opening the device fails if the firmware does not support the
+            encoding requested.
+
+            .. versionadded:: 0.15.0
         """
+        if port is None and serial_number is not None and _is_url(serial_number):
+            port = serial_number
 
         self._requested_serial_number = serial_number
+        self._port = port
         self._baudrate = baudrate
         self._timeout = timeout
         self._serial = None
+        # The connection, before it is wrapped to record the session
+        self._connection = None
+        self._pool = None
         self.serial_number = None
         self._version = None
+        self._capabilities = None
+        self._payload_encoding = None
         self._device_name = device_name
+        self._lock = _FairLock() if thread_safe else None
+        # Commands written whose response was not read, so the next line read
+        # may not belong to the next command, see _resynchronize
+        self._unanswered = 0
+        self._resync_statistics = {'resyncs': 0, 'failures': 0, 'discarded_lines': 0}
+        if instrument is True:
+            from .instrumentation import \
+                Instrumentation  # pylint: disable=import-outside-toplevel
+            instrument = Instrumentation()
+        self._instrumentation = instrument or None
+        self._timeout_policy = timeout_policy
+        if not callable(transport) and transport not in self.TRANSPORTS:
+            raise ValueError(
+                f"Unknown transport '{transport}'. "
+                f"Must be one of {', '.join(self.TRANSPORTS)}."
+            )
+        self._transport = transport
+        self._record = record
+        if payload_encoding not in (None, 'auto', 'text') + PAYLOAD_ENCODINGS:
+            raise ValueError(
+                f"Unknown payload encoding '{payload_encoding}'. "
+                f"Must be one of auto, text, {', '.join(PAYLOAD_ENCODINGS)}."
+            )
+        self._requested_payload_encoding = payload_encoding
+        if pool is True:
+            from .pool import \
+                default_pool  # pylint: disable=import-outside-toplevel
+            pool = default_pool()
+        if pool and record is not None:
+            raise ValueError("A recorded session cannot reuse pooled connections.")
+        self._pool = pool or None
         if open:
             self.open()
 
@@ -401,30 +794,99 @@ class TeensyToAny:
             raise exc_value.with_traceback(traceback)
         return False
 
+    def _pool_key(self):
+        if self._pool is None or self._port is None or not _is_url(self._port):
+            return None
+        return (str(self._port), self._transport, self._baudrate)
+
     def _open(self):
-        if self._requested_serial_number is None:
-            serial_numbers = None
+        key = self._pool_key()
+        if key is not None:
+            pooled = self._pool.acquire(key)
+            if pooled is not None:
+                self._serial = self._connection = pooled.transport
+                self._serial.timeout = self._timeout
+                self.serial_number = self._requested_serial_number
+                self._version = pooled.version
+                self._capabilities = pooled.capabilities
+                if (self._capabilities['payload_encodings'] is None and
+                        'payload_encodings' in self._capability_probes(
+                            self._version, self._requested_payload_encoding)):
+                    # The connection was opened without asking for them
+                    self._capabilities = self._probe_capabilities()
+                self._payload_encoding = self._negotiate_payload_encoding(
+                    self._capabilities, self._requested_payload_encoding)
+                return
+
+        self._connect()
+
+        # Cache the version number so we don't keep asking it for speed
+        response_version = self._ask("version")
+        self._validate_version(response_version)
+        self._version = response_version
+        self._capabilities = self._probe_capabilities()
+        self._payload_encoding = self._negotiate_payload_encoding(
+            self._capabilities, self._requested_payload_encoding)
+
+    def _connect(self):
+        """Find the device, open its port and set ``_serial``."""
+        if self._port is not None:
+            port, found_serial_number = self._port, self._requested_serial_number
         else:
-            serial_numbers = [self._requested_serial_number]
+            if self._requested_serial_number is None:
+                serial_numbers = None
+            else:
+                serial_numbers = [self._requested_serial_number]
 
-        port, found_serial_number = self.device_serial_number_pairs(
-            serial_numbers=serial_numbers, device_name=self._device_name)[0]
+            port, found_serial_number = self.device_serial_number_pairs(
+                serial_numbers=serial_numbers, device_name=self._device_name)[0]
 
-        self._serial = Serial(
-            port=port, baudrate=self._baudrate, timeout=self._timeout)
+        self._serial = self._open_port(port)
         self.serial_number = found_serial_number
 
         # Ignore other commands that might be pending?
         self._serial.reset_output_buffer()
         self._serial.reset_input_buffer()
         self._serial.flush()
+        # pylint: disable=import-outside-toplevel
+        if self._transport == 'thread':
+            from .transport import ThreadedReaderTransport
+            self._serial = ThreadedReaderTransport(self._serial)
+        self._connection = self._serial
+        if self._record is not None:
+            from .replay import SessionRecorder
+            self._serial = SessionRecorder(self._serial, self._record)
+
+    def _open_port(self, port):
+        """Open the port, or URL, with the transport."""
+        # pylint: disable=import-outside-toplevel
+        from serial import Serial, serial_for_url
+
+        from .transport import FdTransport, SocketTransport
+
+        if callable(self._transport):
+            return self._transport(
+                port, baudrate=self._baudrate, timeout=self._timeout)
+        if _is_url(port):
+            if self._transport == 'fd':
+                raise ValueError(
+                    f"The 'fd' transport cannot open the URL '{port}'.")
+            if self._transport == 'serial' and str(port).startswith('socket://'):
+                return SocketTransport(
+                    port, baudrate=self._baudrate, timeout=self._timeout)
+            return serial_for_url(
+                str(port), baudrate=self._baudrate, timeout=self._timeout)
+        if self._transport == 'fd':
+            return FdTransport(
+                port, baudrate=self._baudrate, timeout=self._timeout)
+        return Serial(
+            port=port, baudrate=self._baudrate, timeout=self._timeout)
 
-        # Cache the version number so we don't keep asking it for speed
-        response_version = self._ask("version")
-        self._version = response_version
+    @staticmethod
+    def _validate_version(response_version):
         good_version = False
         try:
-            good_version = Version(self.version) > Version("0.0.0")
+            good_version = _parse_version(response_version) > _parse_version("0.0.0")
         except Exception:  # pylint: disable=broad-exception-caught
             pass
 
@@ -435,12 +897,23 @@ class TeensyToAny:
             )
 
     def close(self):
-        if self._serial is not None:
+        key = self._pool_key()
+        if (key is not None and self._connection is not None and
+                self._version is not None and not self._unanswered):
+            from .pool import \
+                PooledConnection  # pylint: disable=import-outside-toplevel
+            self._pool.release(key, PooledConnection(
+                self._connection, self._version, self._capabilities))
+        elif self._serial is not None:
             self._serial.close()
 
         self._serial = None
+        self._connection = None
         self.serial_number = None
         self._version = None
+        self._capabilities = None
+        self._payload_encoding = None
+        self._unanswered = 0
 
     def __del__(self):
         # Do we want to call close on this delete instance????
@@ -459,7 +932,7 @@ class TeensyToAny:
             data = (data + '\n').encode('utf-8')
         self._serial.write(data)
 
-    def _read(self, *, size=1024, decode=True) -> str:
+    def _read(self, *, size=None, decode=True) -> str:
         """Read data from the serial port.
 
         Returns
@@ -471,17 +944,336 @@ class TeensyToAny:
         if self._serial is None:
             raise RuntimeError("Device must be opened first")
 
-        data = self._serial.read_until(LF, size=size)
+        data = self._serial.read_until(_LF, size=size)
 
         if decode:
             data = data.decode()
 
         return data
 
-    def _ask(self, data, *, size=1024, decode=True) -> str:
+    def _ask(self, data, *, size=None, decode=True) -> str:
+        if self._instrumentation is not None or self._timeout_policy is not None:
+            return self._observed_ask(data, size=size, decode=decode)
+        if self._lock is None:
+            returned = self._exchange(data, size, decode)
+        else:
+            with self._lock:
+                returned = self._exchange(data, size, decode)
+        return self._parse_response(data, returned)
+
+    def _ask_many(self, commands):
+        """Send commands back to back and return the message of each.
+
+        This is how the chunks of large payloads are sent, without waiting
+        for the response of a chunk before writing the next one.
+        """
+        if len(commands) == 1:
+            return [self._ask(commands[0])]
+        with self.pipeline() as p:
+            responses = [p.ask(command) for command in commands]
+        return [response.result() for response in responses]
+
+    def _chunk_length(self, command_length, value_length, buffer_size=None):
+        """The number of payload values sent per command.
+
+        ``command_length`` is the length of the command with an empty payload,
+        including its newline, and ``value_length`` the length of each encoded
+        value with its separator. Each chunk fits in the input buffer of the
+        firmware and in ``buffer_size`` if it is known.
+        """
+        length = (self.INPUT_BUFFER_SIZE + 1 - command_length) // value_length
+        if buffer_size:
+            length = min(length, buffer_size)
+        return max(length, 1)
+
+    def _compact_chunk_length(self, command_length, buffer_size=None, multiple=1):
+        """The number of payload bytes sent per command in the compact encoding.
+
+        ``command_length`` is the length of the command with an empty payload,
+        including its newline. Chunks are a multiple of ``multiple`` bytes,
+        and of 3 bytes in base64 so that only the last chunk is padded.
+        """
+        encoding = self._payload_encoding
+        length = compact_payload_length(encoding, self.INPUT_BUFFER_SIZE - command_length)
+        if buffer_size:
+            length = min(length, buffer_size)
+        if encoding == 'base64':
+            multiple *= 3
+        return max(length - length % multiple, multiple)
+
+    def _read_payload(self, command, arguments, output):
+        """Ask for a payload, in the compact encoding if the firmware accepts one."""
+        encoding = self._payload_encoding
+        if encoding is not None:
+            command = f'{command}_{encoding}'
+        returned = self._ask(_TEMPLATES[command] % arguments)
+        return decode_payload(returned, output=output, encoding=encoding)
+
+    def _exchange(self, data, size, decode):
+        """Write a command and read its response, with the lock held."""
+        if self._unanswered and not self._resynchronize():
+            if not isinstance(data, str):
+                data = bytes(data).decode('utf-8', errors='replace').strip()
+            raise RuntimeError(
+                f"Failed to resynchronize after a timeout, before command: {data}")
         self._write(data)
         returned = self._read(size=size, decode=decode)
+        if returned[-1:] not in _LINE_ENDS:
+            # The response may still arrive and be taken for the response of
+            # the next command, which resynchronizes first
+            self._unanswered += 1
+        return returned
+
+    def _observed_ask(self, data, *, size, decode) -> str:
+        """Ask with the timeout policy and record the command."""
+        policy = self._timeout_policy
+        timeout = self._timeout
+        if policy is not None:
+            command = data if isinstance(data, str) else bytes(data).decode(
+                'utf-8', errors='replace')
+            verb, *arguments = command.split() or ['']
+            timeout = policy.timeout(verb, arguments, self._timeout)
+        with self.locked():
+            if timeout != self._timeout and self._serial is not None:
+                self._serial.timeout = timeout
+            try:
+                start = perf_counter()
+                returned = self._exchange(data, size, decode)
+                duration = perf_counter() - start
+            finally:
+                if timeout != self._timeout and self._serial is not None:
+                    self._serial.timeout = self._timeout
+        if policy is not None:
+            policy.observe(verb, arguments, duration, returned[-1:] not in _LINE_ENDS)
+        if self._instrumentation is not None:
+            self._instrumentation.record(data, returned, duration)
+        return self._parse_response(data, returned)
+
+    def _resynchronize(self):
+        """Read stale responses until the device answers a marker command.
+
+        The firmware answers commands in order, so once the response to a
+        ``version`` command written now arrives, every earlier response has
+        been read. Responses are counted rather than flushed from the input
+        buffer, so the marker of an earlier attempt that failed is not taken
+        for the current one. Returns True if the device answered.
+        """
+        if self._serial is None or self._version is None:
+            # Still opening, the version handshake fails on its own
+            return False
+        statistics = self._resync_statistics
+        statistics['resyncs'] += 1
+        if self._serial.timeout != self._timeout:
+            self._serial.timeout = self._timeout
+        marker = f"0 {self._version}".encode()
+        self._serial.write(b'version\n')
+        self._unanswered += 1
+        synchronized = False
+        for _ in range(_RESYNC_MAX_LINES):
+            line = self._serial.read_until(_LF)
+            if not line.endswith(_LF):
+                break
+            synchronized = self._count_resync_line(line, marker)
+            if synchronized and self._unanswered <= 0:
+                break
+            # Otherwise this is the marker of an earlier attempt, or some
+            # commands were never answered and nothing else will arrive
+        return self._end_resync(synchronized)
+
+    def _count_resync_line(self, line, marker):
+        """Count a line read while resynchronizing, return True if it is the marker."""
+        self._unanswered -= 1
+        if line.strip() == marker:
+            return True
+        self._resync_statistics['discarded_lines'] += 1
+        return False
+
+    def _end_resync(self, synchronized):
+        if synchronized:
+            self._unanswered = 0
+        else:
+            # Try again before the next command
+            self._resync_statistics['failures'] += 1
+        return synchronized
+
+    def resynchronize(self):
+        """Discard responses that arrived after their command timed out.
+
+        When a command times out, its response may still arrive and would
+        then be read as the response of the next command. The next command
+        after a timeout resynchronizes the device automatically, in a single
+        round trip instead of closing and opening it again.
+
+        Returns
+        -------
+        synchronized: bool
+            True if the device answered.
+
+        .. versionadded:: 0.15.0
+        """
+        with self.locked():
+            return self._resynchronize()
+
+    def resync_statistics(self, *, reset=False):
+        """Report how often the device was resynchronized after timeouts.
+
+        Parameters
+        ----------
+        reset: bool
+            If True, the statistics are reset after they are reported.
+
+        Returns
+        -------
+        statistics: dict
+            The number of ``resyncs``, of ``failures`` where the device did
+            not answer the marker command, and of stale ``discarded_lines``.
+
+        .. versionadded:: 0.15.0
+        """
+        statistics = dict(self._resync_statistics)
+        if reset:
+            for key in self._resync_statistics:
+                self._resync_statistics[key] = 0
+        return statistics
+
+    def _ask_blocking(self, data, duration):
+        """Ask a command that keeps the firmware busy for ``duration`` seconds."""
+        # We want to ensure that the command won't timeout
+        # For this, we check that the duration is less than
+        # 80% of the time, or provide a 50 ms buffer. Whichever is bigger.
+        # Other threads must not change the timeout until the response is read.
+        with self.locked():
+            maximum_duration = max(self._timeout * 0.8, self._timeout - 50E-3)
+            if duration > maximum_duration:
+                with self.increased_timeout(duration + 0.1):
+                    return self._ask(data)
+            return self._ask(data)
+
+    def send_raw(self, data) -> str:
+        """Send a command that is already encoded and return its response.
+
+        This skips the formatting done by the other methods, which is useful
+        to repeatedly send the same command from a tight loop.
+
+        Parameters
+        ----------
+        data: bytes
+            The encoded command, terminated by a newline. See
+            :mod:`teensytoany.encoder` to encode commands.
+
+        Returns
+        -------
+        message: str or None
+            The message returned by the device, if any.
+
+        """
+        if data[-1:] != b'\n':
+            raise ValueError("Encoded commands must end with a newline.")
+        return self._ask(data)
+
+    def locked(self):
+        """Prevent other threads from sending commands within the context.
+
+        This only has an effect on devices opened with ``thread_safe=True``.
+        """
+        if self._lock is None:
+            return nullcontext()
+        return self._lock
+
+    def priority(self, value):
+        """Set the priority of the commands sent from the current thread.
+
+        Threads waiting for a device opened with ``thread_safe=True`` are
+        served from the highest priority to the lowest. The default priority
+        is 0::
+
+            with teensy.priority(10):
+                teensy.nop()
+
+        """
+        if self._lock is None:
+            return nullcontext()
+        return self._lock.priority(value)
+
+    def lock_statistics(self, *, reset=False):
+        """Report the contention on a device opened with ``thread_safe=True``.
+
+        Parameters
+        ----------
+        reset: bool
+            If True, the statistics are reset after they are reported.
+
+        Returns
+        -------
+        statistics: dict
+            ``queue_depth`` is the number of threads currently waiting,
+            ``max_queue_depth`` the most that have waited at once.
+            ``acquisitions`` counts every command or :meth:`locked` block,
+            of which ``contended_acquisitions`` had to wait. The wait times are
+            reported in seconds as ``total_wait_time``, ``max_wait_time`` and
+            ``mean_wait_time``.
+
+        """
+        if self._lock is None:
+            raise RuntimeError(
+                "Lock statistics are only available for devices opened with "
+                "thread_safe=True."
+            )
+        return self._lock.statistics(reset=reset)
+
+    @property
+    def instrumentation(self):
+        """The :class:`~teensytoany.instrumentation.Instrumentation` of the device.
+
+        None unless the device was opened with ``instrument=True``. Exporters
+        may be added with its ``add_callback`` method.
+
+        .. versionadded:: 0.15.0
+        """
+        return self._instrumentation
+
+    @property
+    def timeout_policy(self):
+        """The :class:`~teensytoany.timeouts.TimeoutPolicy` of the device, if any.
+
+        .. versionadded:: 0.15.0
+        """
+        return self._timeout_policy
+
+    def stats(self, *, reset=False):
+        """Report the commands sent to a device opened with ``instrument=True``.
+
+        Parameters
+        ----------
+        reset: bool
+            If True, the statistics are reset after they are reported.
+
+        Returns
+        -------
+        stats: dict
+            ``elapsed`` is the time, in seconds, since the statistics were
+            reset. ``commands`` holds, for each verb, the ``count`` of
+            commands sent, the ``bytes_sent`` and ``bytes_received``, the
+            ``total_time``, ``mean_time``, ``min_time``, ``max_time`` and the
+            ``p50``, ``p90`` and ``p99`` percentiles of their round trips in
+            seconds, a ``histogram`` of the round trips, the number of
+            ``timeouts`` and a count of the ``errors`` codes answered by the
+            device. ``totals`` sums the commands of every verb.
+
+        .. versionadded:: 0.15.0
+        """
+        if self._instrumentation is None:
+            raise RuntimeError(
+                "Command statistics are only available for devices opened with "
+                "instrument=True."
+            )
+        return self._instrumentation.stats(reset=reset)
+
+    @staticmethod
+    def _parse_response(data, returned) -> str:
         if len(returned) == 0:
+            if not isinstance(data, str):
+                data = bytes(data).decode('utf-8', errors='replace').strip()
             raise RuntimeError(f"Failed to read a response for command: {data}")
 
         returned_list = returned.split(' ', 1)
@@ -497,29 +1289,60 @@ class TeensyToAny:
             message = message.strip()
         return message
 
+    def pipeline(self, *, max_bytes_in_flight=None, raise_on_error=True):
+        """Queue commands and send them without waiting for each response.
+
+        Each command sent through :meth:`_ask` waits a full USB round trip
+        for its response. Within a pipeline, commands are written back to back
+        and the responses are collected in order when the pipeline is flushed,
+        which happens automatically at the end of a ``with`` block::
+
+            with teensy.pipeline() as p:
+                p.gpio_digital_write(13, 1)
+                value = p.i2c_read_uint8(0x20, 0x0F)
+            value.result()
+
+        Parameters
+        ----------
+        max_bytes_in_flight: int or None
+            Maximum number of bytes that may be written to the device before
+            its responses are read back. Defaults to ``INPUT_BUFFER_SIZE``.
+
+        raise_on_error: bool
+            If True, the first error reported by the device is raised when the
+            pipeline is flushed. Regardless of this setting, each command's
+            error is raised by the ``result`` method of its response.
+
+        Returns
+        -------
+        pipeline: TeensyToAnyPipeline
+            The pipeline on which to queue commands.
+
+        """
+        return TeensyToAnyPipeline(
+            self,
+            max_bytes_in_flight=max_bytes_in_flight,
+            raise_on_error=raise_on_error,
+        )
+
     def i2c_init(self, baud_rate: int=100_100, timeout=200_000, register_space=1):
-        cmd = f"i2c_init {baud_rate:d} {timeout:d} {register_space:d}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_init'] % (baud_rate, timeout, register_space))
 
     def i2c_read_uint8(self, address: int, register_address: int):
-        cmd = f"i2c_read_uint8 0x{address:02x} 0x{register_address:x}"
-        returned = self._ask(cmd)
+        returned = self._ask(_TEMPLATES['i2c_read_uint8'] % (address, register_address))
         return int(returned, base=0)
 
     def i2c_read_uint16(self, address: int, register_address: int):
-        cmd = f"i2c_read_uint16 0x{address:02x} 0x{register_address:x}"
-        returned = self._ask(cmd)
+        returned = self._ask(_TEMPLATES['i2c_read_uint16'] % (address, register_address))
         return int(returned, base=0)
 
     def i2c_write_uint8(self, address: int, register_address: int, data: int):
         data = data & 0xFF
-        cmd = f"i2c_write_uint8 0x{address:02x} 0x{register_address:x} 0x{data:x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_write_uint8'] % (address, register_address, data))
 
     def i2c_write_uint16(self, address: int, register_address: int, data: int):
         data = data & 0xFFFF
-        cmd = f"i2c_write_uint16 0x{address:02x} 0x{register_address:x} 0x{data:x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_write_uint16'] % (address, register_address, data))
 
     def i2c_write_read(self,
                        address: int,
@@ -545,11 +1368,23 @@ class TeensyToAny:
             length=num_bytes, byteorder='big',
             signed=False)
 
-    def i2c_write_payload(self, address: int, register_address: int, payload: Sequence) -> None:
-        if Version(self.version) >= Version("0.0.14"):
-            data = ' '.join([f"0x{val:02x}" for val in payload])
-            cmd = f"i2c_write_payload 0x{address:02x} 0x{register_address:02x} {data}"
-            self._ask(cmd)
+    def i2c_write_payload(self, address: int, register_address: int, payload: Sequence,
+                          *, auto_increment: bool = False) -> None:
+        """Write a payload to the I2C bus starting at a register address.
+
+        A payload larger than the I2C buffer of the board, or than a
+        command, can only be written to a device whose register address
+        increments on every byte written. With ``auto_increment=True``, it
+        is split into commands sent back to back, each written at
+        ``register_address`` plus the offset of its first byte. Otherwise,
+        such a payload raises a ``ValueError``.
+
+        .. versionchanged:: 0.15.0
+            Added ``auto_increment``.
+        """
+        if self._capabilities['i2c_payload']:
+            self._write_payload_chunks(
+                'i2c', address, register_address, payload, auto_increment)
 
         else:
             if len(payload) == 1:
@@ -577,72 +1412,132 @@ class TeensyToAny:
             else:
                 raise NotImplementedError()
 
-    def i2c_read_payload(self, address: int, register_address: int, num_bytes: int) -> Sequence:
-        if Version(self.version) < Version("0.0.14"):
+    def _write_payload_chunks(self, bus, address, register_address, payload, auto_increment):
+        """Write a payload in as many commands as the buffers require.
+
+        With ``auto_increment``, each chunk is written at the register
+        following the previous chunk. The i2c buffer of the board also holds
+        the register address, of up to two bytes.
+        """
+        encoding = self._payload_encoding
+        buffer_size = self._capabilities[f'{bus}_buffer_size']
+        buffer_size = buffer_size and max(buffer_size - 2, 1)
+        if encoding is None:
+            template = _TEMPLATES[f'{bus}_write_payload']
+            length = self._chunk_length(
+                len(template % (address, register_address + len(payload), b'')),
+                len(b'0x00 '),
+                buffer_size,
+            )
+        else:
+            template = _TEMPLATES[f'{bus}_write_payload_{encoding}']
+            length = self._compact_chunk_length(
+                len(template % (address, register_address + len(payload), b'')),
+                buffer_size,
+            )
+        if len(payload) > length and not auto_increment:
+            raise ValueError(
+                f"A payload of {len(payload)} bytes does not fit in a single "
+                f"{bus}_write_payload command, of up to {length} bytes. Use "
+                f"auto_increment=True to write it in several commands if the "
+                f"register address of the device increments on every byte.")
+        self._ask_many([
+            template % (address, register_address + i, self._encode_payload(payload[i:i + length]))
+            for i in range(0, len(payload), length)
+        ])
+
+    def _encode_payload(self, payload):
+        if self._payload_encoding is None:
+            return encode_payload(payload)
+        return encode_compact_payload(payload, self._payload_encoding)
+
+    def i2c_read_payload(self, address: int, register_address: int, num_bytes: int,
+                         *, output='list') -> Sequence:
+        """Read ``num_bytes`` from the I2C bus starting at a register address.
+
+        The ``output`` argument selects the type of the returned payload,
+        ``'list'``, ``'bytes'``, ``'array'`` or ``'numpy'``, see
+        :func:`teensytoany.decoder.decode_payload`.
+        """
+        if not self._capabilities['i2c_payload']:
             if num_bytes != 1:
                 raise NotImplementedError()
             returned = self._ask(f"i2c_read_no_register_uint8 0x{address:02x}")
             register_data = int(returned, base=0)
-            return int.to_bytes(
+            register_data = int.to_bytes(
                 int(register_data),
                 length=num_bytes, byteorder='big',
                 signed=False)
+            if output == 'list':
+                return register_data
+            return decode_payload(f"0x{register_data[0]:02x}", output=output)
 
-        cmd = f"i2c_read_payload 0x{address:02x} 0x{register_address:02x} {num_bytes}"
-        returned = self._ask(cmd)
-        register_data = [int(val, base=0) for val in returned.split()]  # returns big endian
-        return register_data
+        # returns big endian
+        return self._read_payload(
+            'i2c_read_payload', (address, register_address, num_bytes), output)
 
-    def i2c_read_payload_no_register(self, address: int, num_bytes: int):
-        cmd = f"i2c_read_payload_no_register 0x{address:02x} {num_bytes}"
-        returned = self._ask(cmd)
-        register_data = [int(val, base=0) for val in returned.split()]  # returns big endian
-        return register_data
+    def i2c_read_payload_no_register(self, address: int, num_bytes: int, *, output='list'):
+        """Read ``num_bytes`` from the I2C bus without specifying a register address.
+
+        The ``output`` argument selects the type of the returned payload,
+        ``'list'``, ``'bytes'``, ``'array'`` or ``'numpy'``, see
+        :func:`teensytoany.decoder.decode_payload`.
+        """
+        return self._read_payload(
+            'i2c_read_payload_no_register', (address, num_bytes), output)  # returns big endian
 
     def i2c_ping(self, address: int):
         """Return None if device found. Raises error if no device found."""
-        cmd = f"i2c_ping 0x{address:02x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_ping'] % (address,))
 
     def i2c_reset(self):
         """Reset the I2C PORT in case of lockup."""
-        self._ask("i2c_reset")
+        self._ask(_TEMPLATES['i2c_reset'])
 
     def i2c_read_no_register_uint8(self, address: int):
         """Read a uint8_t from the I2C bus without specifying a register address."""
-        cmd = f"i2c_read_no_register_uint8 0x{address:02x}"
-        returned = self._ask(cmd)
+        returned = self._ask(_TEMPLATES['i2c_read_no_register_uint8'] % (address,))
         return int(returned, base=0)
 
     def i2c_write_no_register_uint8(self, address: int, data: int):
         """Write a uint8_t to the I2C bus without specifying a register address."""
         data = data & 0xFF
-        cmd = f"i2c_write_no_register_uint8 0x{address:02x} 0x{data:02x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_write_no_register_uint8'] % (address, data))
 
     def i2c_read_payload_uint16(self, address: int, register_address: int,
-                                num_bytes: int) -> Sequence:
-        """Read up to 256 bytes from the I2C bus starting at a specified 16 bit register address."""
-        cmd = f"i2c_read_payload_uint16 0x{address:02x} 0x{register_address:04x} {num_bytes}"
-        returned = self._ask(cmd)
-        register_data = [int(val, base=0) for val in returned.split()]
-        return register_data
+                                num_bytes: int, *, output='list') -> Sequence:
+        """Read up to 256 bytes from the I2C bus starting at a specified 16 bit register address.
+
+        The ``output`` argument selects the type of the returned payload,
+        ``'list'``, ``'bytes'``, ``'array'`` or ``'numpy'``, see
+        :func:`teensytoany.decoder.decode_payload`.
+        """
+        return self._read_payload(
+            'i2c_read_payload_uint16', (address, register_address, num_bytes), output)
 
     def i2c_begin_transaction(self, address: int):
         """Begin a transaction with the I2C device."""
-        cmd = f"i2c_begin_transaction 0x{address:02x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_begin_transaction'] % (address,))
 
     def i2c_write(self, data: Sequence):
-        """Write data to the I2C device."""
-        data_str = ' '.join([f"{val}" for val in data])
-        cmd = f"i2c_write {data_str}"
-        self._ask(cmd)
+        """Write data to the I2C device.
+
+        Data larger than the I2C buffer of the board, or than a command,
+        is sent in several writes within the transaction.
+        """
+        self._write_chunks('i2c', data, self._capabilities['i2c_buffer_size'])
+
+    def _write_chunks(self, bus, data, buffer_size):
+        template = _TEMPLATES[f'{bus}_write']
+        length = self._chunk_length(len(template % (b'',)), len(b'255 '), buffer_size)
+        self._ask_many([
+            template % (encode_payload(data[i:i + length], base=10),)
+            for i in range(0, len(data), length)
+        ])
 
     def i2c_end_transaction(self, stop: bool = True):
         """End a transaction with the I2C device."""
-        cmd = f"i2c_end_transaction {str(stop).lower()}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_end_transaction'] % (b'true' if stop else b'false',))
 
     def i2c_write_bulk(self, address: int, data: Sequence):
         """Write large amounts of data to the I2C device in chunks.
@@ -660,44 +1555,38 @@ class TeensyToAny:
         if len(data) > 8192:
             raise ValueError("Data size exceeds maximum of 8192 bytes")
 
-        buffer_size = self.i2c_buffer_size()
-        self.i2c_begin_transaction(address)
+        with self.locked():
+            buffer_size = self._capabilities['i2c_buffer_size'] or self.i2c_buffer_size()
+            self.i2c_begin_transaction(address)
 
-        try:
-            for i in range(0, len(data), buffer_size):
-                chunk = data[i:i + buffer_size]
-                self.i2c_write(chunk)
-        finally:
-            self.i2c_end_transaction()
+            try:
+                self._write_chunks('i2c', data, buffer_size)
+            finally:
+                self.i2c_end_transaction()
 
     def i2c_buffer_size(self):
         """Get the maximum I2C buffer size for this board."""
-        returned = self._ask("i2c_buffer_size")
+        returned = self._ask(_TEMPLATES['i2c_buffer_size'])
         return int(returned, base=0)
 
     def i2c_1_init(self, baud_rate: int=100_100, timeout=200_000, register_space=1):
-        cmd = f"i2c_1_init {baud_rate:d} {timeout:d} {register_space:d}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_1_init'] % (baud_rate, timeout, register_space))
 
     def i2c_1_read_uint8(self, address: int, register_address: int):
-        cmd = f"i2c_1_read_uint8 0x{address:02x} 0x{register_address:x}"
-        returned = self._ask(cmd)
+        returned = self._ask(_TEMPLATES['i2c_1_read_uint8'] % (address, register_address))
         return int(returned, base=0)
 
     def i2c_1_read_uint16(self, address: int, register_address: int):
-        cmd = f"i2c_1_read_uint16 0x{address:02x} 0x{register_address:x}"
-        returned = self._ask(cmd)
+        returned = self._ask(_TEMPLATES['i2c_1_read_uint16'] % (address, register_address))
         return int(returned, base=0)
 
     def i2c_1_write_uint8(self, address: int, register_address: int, data: int):
         data = data & 0xFF
-        cmd = f"i2c_1_write_uint8 0x{address:02x} 0x{register_address:x} 0x{data:x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_1_write_uint8'] % (address, register_address, data))
 
     def i2c_1_write_uint16(self, address: int, register_address: int, data: int):
         data = data & 0xFFFF
-        cmd = f"i2c_1_write_uint16 0x{address:02x} 0x{register_address:x} 0x{data:x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_1_write_uint16'] % (address, register_address, data))
 
     def i2c_1_write_read(self,
                          address: int,
@@ -723,11 +1612,23 @@ class TeensyToAny:
             length=num_bytes, byteorder='big',
             signed=False)
 
-    def i2c_1_write_payload(self, address: int, register_address: int, payload: Sequence) -> None:
-        if Version(self.version) >= Version("0.0.14"):
-            data = ' '.join([f"0x{val:02x}" for val in payload])
-            cmd = f"i2c_1_write_payload 0x{address:02x} 0x{register_address:02x} {data}"
-            self._ask(cmd)
+    def i2c_1_write_payload(self, address: int, register_address: int, payload: Sequence,
+                            *, auto_increment: bool = False) -> None:
+        """Write a payload to the I2C_1 bus starting at a register address.
+
+        A payload larger than the I2C_1 buffer of the board, or than a
+        command, can only be written to a device whose register address
+        increments on every byte written. With ``auto_increment=True``, it
+        is split into commands sent back to back, each written at
+        ``register_address`` plus the offset of its first byte. Otherwise,
+        such a payload raises a ``ValueError``.
+
+        .. versionchanged:: 0.15.0
+            Added ``auto_increment``.
+        """
+        if self._capabilities['i2c_payload']:
+            self._write_payload_chunks(
+                'i2c_1', address, register_address, payload, auto_increment)
 
         else:
             if len(payload) == 1:
@@ -755,62 +1656,72 @@ class TeensyToAny:
             else:
                 raise NotImplementedError()
 
-    def i2c_1_read_payload(self, address: int, register_address: int, num_bytes: int) -> Sequence:
-        cmd = f"i2c_1_read_payload 0x{address:02x} 0x{register_address:02x} {num_bytes}"
-        returned = self._ask(cmd)
-        register_data = [int(val, base=0) for val in returned.split()]  # returns big endian
-        return register_data
+    def i2c_1_read_payload(self, address: int, register_address: int, num_bytes: int,
+                           *, output='list') -> Sequence:
+        """Read ``num_bytes`` from the I2C_1 bus starting at a register address.
 
-    def i2c_1_read_payload_no_register(self, address: int, num_bytes: int):
-        cmd = f"i2c_1_read_payload_no_register 0x{address:02x} {num_bytes}"
-        returned = self._ask(cmd)
-        register_data = [int(val, base=0) for val in returned.split()]  # returns big endian
-        return register_data
+        The ``output`` argument selects the type of the returned payload,
+        ``'list'``, ``'bytes'``, ``'array'`` or ``'numpy'``, see
+        :func:`teensytoany.decoder.decode_payload`.
+        """
+        # returns big endian
+        return self._read_payload(
+            'i2c_1_read_payload', (address, register_address, num_bytes), output)
+
+    def i2c_1_read_payload_no_register(self, address: int, num_bytes: int, *, output='list'):
+        """Read ``num_bytes`` from the I2C_1 bus without specifying a register address.
+
+        The ``output`` argument selects the type of the returned payload,
+        ``'list'``, ``'bytes'``, ``'array'`` or ``'numpy'``, see
+        :func:`teensytoany.decoder.decode_payload`.
+        """
+        return self._read_payload(
+            'i2c_1_read_payload_no_register', (address, num_bytes), output)  # returns big endian
 
     def i2c_1_ping(self, address: int):
         """Return None if device found. Raises error if no device found."""
-        cmd = f"i2c_1_ping 0x{address:02x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_1_ping'] % (address,))
 
     def i2c_1_reset(self):
         """Reset the I2C_1 PORT in case of lockup."""
-        self._ask("i2c_1_reset")
+        self._ask(_TEMPLATES['i2c_1_reset'])
 
     def i2c_1_read_no_register_uint8(self, address: int):
         """Read a uint8_t from the I2C_1 bus without specifying a register address."""
-        cmd = f"i2c_1_read_no_register_uint8 0x{address:02x}"
-        returned = self._ask(cmd)
+        returned = self._ask(_TEMPLATES['i2c_1_read_no_register_uint8'] % (address,))
         return int(returned, base=0)
 
     def i2c_1_write_no_register_uint8(self, address: int, data: int):
         """Write a uint8_t to the I2C_1 bus without specifying a register address."""
         data = data & 0xFF
-        cmd = f"i2c_1_write_no_register_uint8 0x{address:02x} 0x{data:02x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_1_write_no_register_uint8'] % (address, data))
 
     def i2c_1_read_payload_uint16(self, address: int, register_address: int,
-                                  num_bytes: int) -> Sequence:
-        """Read up to 256 bytes from the I2C_1 bus at a specified 16 bit register address."""
-        cmd = f"i2c_1_read_payload_uint16 0x{address:02x} 0x{register_address:04x} {num_bytes}"
-        returned = self._ask(cmd)
-        register_data = [int(val, base=0) for val in returned.split()]
-        return register_data
+                                  num_bytes: int, *, output='list') -> Sequence:
+        """Read up to 256 bytes from the I2C_1 bus at a specified 16 bit register address.
+
+        The ``output`` argument selects the type of the returned payload,
+        ``'list'``, ``'bytes'``, ``'array'`` or ``'numpy'``, see
+        :func:`teensytoany.decoder.decode_payload`.
+        """
+        return self._read_payload(
+            'i2c_1_read_payload_uint16', (address, register_address, num_bytes), output)
 
     def i2c_1_begin_transaction(self, address: int):
         """Begin a transaction with the I2C_1 device."""
-        cmd = f"i2c_1_begin_transaction 0x{address:02x}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_1_begin_transaction'] % (address,))
 
     def i2c_1_write(self, data: Sequence):
-        """Write data to the I2C_1 device."""
-        data_str = ' '.join([f"{val}" for val in data])
-        cmd = f"i2c_1_write {data_str}"
-        self._ask(cmd)
+        """Write data to the I2C_1 device.
+
+        Data larger than the I2C_1 buffer of the board, or than a command,
+        is sent in several writes within the transaction.
+        """
+        self._write_chunks('i2c_1', data, self._capabilities['i2c_1_buffer_size'])
 
     def i2c_1_end_transaction(self, stop: bool = True):
         """End a transaction with the I2C_1 device."""
-        cmd = f"i2c_1_end_transaction {str(stop).lower()}"
-        self._ask(cmd)
+        self._ask(_TEMPLATES['i2c_1_end_transaction'] % (b'true' if stop else b'false',))
 
     def i2c_1_write_bulk(self, address: int, data: Sequence):
         """Write large amounts of data to the I2C_1 device in chunks.
@@ -828,19 +1739,18 @@ class TeensyToAny:
         if len(data) > 8192:
             raise ValueError("Data size exceeds maximum of 8192 bytes")
 
-        buffer_size = self.i2c_1_buffer_size()
-        self.i2c_1_begin_transaction(address)
+        with self.locked():
+            buffer_size = self._capabilities['i2c_1_buffer_size'] or self.i2c_1_buffer_size()
+            self.i2c_1_begin_transaction(address)
 
-        try:
-            for i in range(0, len(data), buffer_size):
-                chunk = data[i:i + buffer_size]
-                self.i2c_1_write(chunk)
-        finally:
-            self.i2c_1_end_transaction()
+            try:
+                self._write_chunks('i2c_1', data, buffer_size)
+            finally:
+                self.i2c_1_end_transaction()
 
     def i2c_1_buffer_size(self):
         """Get the maximum I2C_1 buffer size for this board."""
-        returned = self._ask("i2c_1_buffer_size")
+        returned = self._ask(_TEMPLATES['i2c_1_buffer_size'])
         return int(returned, base=0)
 
     def gpio_digital_write(self, pin, value):
@@ -854,7 +1764,7 @@ class TeensyToAny:
             Value to assign to the pin
 
         """
-        self._ask(f"gpio_digital_write {pin} {value}")
+        self._ask(_encode_numbers('gpio_digital_write', pin, value))
 
     def gpio_pin_mode(self, pin, mode, value=None):
         """Call the arduino PinMode function.
@@ -870,7 +1780,7 @@ class TeensyToAny:
 
         """
         if value is None:
-            cmd = f"gpio_pin_mode {pin} {mode}"
+            cmd = _encode_numbers('gpio_pin_mode', pin, mode)
         else:
             cmd = f"gpio_pin_mode {pin} {mode} {value}"
 
@@ -907,15 +1817,7 @@ class TeensyToAny:
 
         cmd = f"gpio_digital_pulse {pin} {value} {value_end} {duration}"
 
-        # We want to ensure that the command won't timeout
-        # For this, we check that the pulse duration is less than
-        # 80% of the time, or provide a 50 ms buffer. Whichever is bigger.
-        maximum_duration = max(self._timeout * 0.8, self._timeout - 50E-3)
-        if duration > maximum_duration:
-            with self.increased_timeout(duration + 0.1):
-                self._ask(cmd)
-        else:
-            self._ask(cmd)
+        self._ask_blocking(cmd, duration)
 
     def gpio_digital_read(self, pin):
         """Call the arduino DigitalRead function.
@@ -931,7 +1833,7 @@ class TeensyToAny:
             Read value.
 
         """
-        returned = self._ask(f"gpio_digital_read {pin}")
+        returned = self._ask(_encode_numbers('gpio_digital_read', pin))
         return bool(int(returned, base=0))
 
     def register_write_uint16(self, register_address, value):
@@ -944,7 +1846,7 @@ class TeensyToAny:
         value: int
             Value to write to address. Should be between 0 and 65535.
         """
-        self._ask(f"register_write_uint16 {register_address} {value}")
+        self._ask(_encode_numbers('register_write_uint16', register_address, value))
 
     def register_read_uint16(self, register_address):
         """Read value directly from a teensy register.
@@ -960,7 +1862,7 @@ class TeensyToAny:
             Read value. Will be from 0 to 65535.
 
         """
-        returned = self._ask(f"register_read_uint16 {register_address}")
+        returned = self._ask(_encode_numbers('register_read_uint16', register_address))
         return int(returned, base=0)
 
     def register_read_uint8(self, register_address):
@@ -977,7 +1879,7 @@ class TeensyToAny:
             Read value. Will be from 0 to 255.
 
         """
-        returned = self._ask(f"register_read_uint8 {register_address}")
+        returned = self._ask(_encode_numbers('register_read_uint8', register_address))
         return int(returned, base=0)
 
     def register_write_uint8(self, register_address, value):
@@ -990,7 +1892,7 @@ class TeensyToAny:
         value: int
             Value to write to address. Should be between 0 and 255.
         """
-        self._ask(f"register_write_uint8 {register_address} {value}")
+        self._ask(_encode_numbers('register_write_uint8', register_address, value))
 
     def register_read_uint32(self, register_address):
         """Read value directly from a teensy register.
@@ -1006,7 +1908,7 @@ class TeensyToAny:
             Read value. Will be from 0 to 4294967295.
 
         """
-        returned = self._ask(f"register_read_uint32 {register_address}")
+        returned = self._ask(_encode_numbers('register_read_uint32', register_address))
         return int(returned, base=0)
 
     def register_write_uint32(self, register_address, value):
@@ -1019,7 +1921,7 @@ class TeensyToAny:
         value: int
             Value to write to address. Should be between 0 and 4294967295.
         """
-        self._ask(f"register_write_uint32 {register_address} {value}")
+        self._ask(_encode_numbers('register_write_uint32', register_address, value))
 
     @property
     def version(self):
@@ -1037,12 +1939,18 @@ class TeensyToAny:
 
     @contextmanager
     def increased_timeout(self, value):
-        old_timeout = self.timeout
-        try:
-            self.timeout = value
-            yield
-        finally:
-            self.timeout = old_timeout
+        """Use another timeout for the commands sent within the context.
+
+        On a device opened with ``thread_safe=True``, other threads wait for
+        the context to exit, so that they neither use nor restore the timeout.
+        """
+        with self.locked():
+            old_timeout = self.timeout
+            try:
+                self.timeout = value
+                yield
+            finally:
+                self.timeout = old_timeout
 
     def spi_begin(self):
         self._ask("spi_begin")
@@ -1086,13 +1994,12 @@ class TeensyToAny:
 
     def spi_transfer(self, data):
         returned = self._ask(f"spi_transfer {data}")
-        if returned is not None and len(returned) > 0:
+        if not self._capabilities['spi_transfer_returns_data']:
             # Before teensytoany firmware version 0.18.0
             # This function would not return any data
-            # We write this code in a compatible way
             # https://github.com/ramonaoptics/teensy-to-any/pull/47/files
-            return int(returned, base=0)
-        return None
+            return None
+        return int(returned, base=0)
 
     def spi_transfer16(self, data):
         returned = self._ask(f"spi_transfer16 {data}")
@@ -1100,16 +2007,41 @@ class TeensyToAny:
         # We convert it back to an integer for the user.
         return int(returned, base=0)
 
-    def spi_transfer_bulk(self, data):
-        returned = self._ask(
+    def spi_transfer_bulk(self, data, *, output='list'):
+        """Transfer ``data`` over SPI and return the bytes read back.
+
+        Data larger than the SPI buffer of the board, or than a command, is
+        sent in consecutive transfers, without waiting for the bytes read by
+        each transfer before sending the next one.
+
+        Data holding integers from 0 to 255 is sent in the compact
+        encoding, if one was negotiated, see :attr:`payload_encoding`.
+
+        The ``output`` argument selects the type of the returned payload,
+        ``'list'``, ``'bytes'``, ``'array'`` or ``'numpy'``, see
+        :func:`teensytoany.decoder.decode_payload`.
+        """
+        buffer_size = self._capabilities['spi_buffer_size']
+        encoding = self._payload_encoding
+        payload = None if encoding is None else _payload_bytes(data)
+        if payload is not None:
+            template = _TEMPLATES[f'spi_transfer_bulk_{encoding}']
+            length = self._compact_chunk_length(len(template % (b'',)), buffer_size)
+            returned = self._ask_many([
+                template % (encode_compact_payload(payload[i:i + length], encoding),)
+                for i in range(0, len(data), length)
+            ])
+            # Only the last base64 chunk is padded, the chunks decode as one
+            return decode_payload("".join(returned), output=output, encoding=encoding)
+
+        length = self._chunk_length(len('spi_transfer_bulk \n'), len('255 '), buffer_size)
+        returned = self._ask_many([
             "spi_transfer_bulk " + " ".join(
-                str(d) for d in data
+                str(d) for d in data[i:i + length]
             )
-        ).split(' ')
-        return [
-            int(i, base=0)
-            for i in returned
-        ]
+            for i in range(0, len(data), length)
+        ])
+        return decode_payload(" ".join(returned), output=output)
 
     def spi_read_byte(self, data):
         """Read a byte of data over SPI.
@@ -1169,15 +2101,7 @@ class TeensyToAny:
         """
 
         cmd = f"analog_pulse {pin} {value} {value_end} {duration}"
-        # We want to ensure that the command won't timeout
-        # For this, we check that the pulse duration is less than
-        # 80% of the time, or provide a 50 ms buffer. Whichever is bigger.
-        maximum_duration = max(self._timeout * 0.8, self._timeout - 50E-3)
-        if duration > maximum_duration:
-            with self.increased_timeout(duration + 0.1):
-                self._ask(cmd)
-        else:
-            self._ask(cmd)
+        self._ask_blocking(cmd, duration)
 
     def analog_read(self, pin: int):
         """Call the arduino analogRead function.
@@ -1285,7 +2209,7 @@ class TeensyToAny:
 
     def sleep_seconds(self, duration: float):
         """Sleep (and block) for the desired duration in seconds."""
-        self._ask(f"sleep {duration}")
+        self._ask_blocking(f"sleep {duration}", duration)
 
     def fastled_add_leds(self, led_class, has_white, pin, n_leds):
         has_white = int(bool(has_white))
@@ -1324,6 +2248,44 @@ class TeensyToAny:
         """
         self._ask(f"fastled_set_max_refresh_rate {rate}")
 
+    def fastled_set_rgb_bulk(self, colors, *, start=0):
+        """Set the color of consecutive LEDs, for instance a whole frame.
+
+        With firmware that accepts a compact payload encoding, see
+        :attr:`payload_encoding`, the colors are sent in as few commands as
+        the input buffer of the firmware allows. Otherwise each LED is set
+        with ``fastled_set_rgb``, the commands being sent back to back.
+
+        .. versionadded:: 0.15.0
+
+        Parameters
+        ----------
+        colors: sequence of (r, g, b)
+            The color of each LED, each component between 0 and 255.
+
+        start: int
+            The index of the first LED to set.
+        """
+        data = bytes(component for color in colors for component in color)
+        if len(data) % 3:
+            raise ValueError("Each color must have a red, green and blue component.")
+        encoding = self._payload_encoding
+        if encoding is None:
+            commands = [
+                f"fastled_set_rgb {start + i // 3} {data[i]} {data[i + 1]} {data[i + 2]}"
+                for i in range(0, len(data), 3)
+            ]
+        else:
+            template = _TEMPLATES[f'fastled_set_rgb_bulk_{encoding}']
+            length = self._compact_chunk_length(
+                len(template % (start + len(data) // 3, b'')), multiple=3)
+            commands = [
+                template % (start + i // 3, encode_compact_payload(data[i:i + length], encoding))
+                for i in range(0, len(data), length)
+            ]
+        if commands:
+            self._ask_many(commands)
+
     def info(self):
         """Displays information about this TeensyToAny device."""
         return self._ask("info")
@@ -1342,4 +2304,4 @@ class TeensyToAny:
 
     def nop(self):
         """No operation (does nothing)."""
-        self._ask("nop")
+        self._ask(_TEMPLATES['nop'])
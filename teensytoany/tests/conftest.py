@@ -0,0 +1,106 @@
+import time
+from contextlib import ExitStack
+
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany.simulator import TeensyToAnySimulator
+from teensytoany.tests.fake_device import (FLEET_LATENCY, FLEET_SIZE,
+                                           FakeTeensy, use_fake_device)
+from teensytoany.tests.fake_http import (FIRMWARE, FakeFirmwareMirror,
+                                         FakeReleaseAPI)
+from teensytoany.tests.fake_ser2net import FakeSer2Net
+
+
+def _handler(command):
+    if command == 'version':
+        return '0 0.18.0'
+    if command == 'mcu':
+        return '0 TEENSY40'
+    if command.endswith('buffer_size'):
+        return '0 32'
+    if command.startswith('i2c_read_uint8'):
+        return '0 0x2a'
+    if command.startswith('i2c_ping'):
+        return '6 No such device or address'
+    return '0'
+
+
+@pytest.fixture
+def fake_teensy(monkeypatch):
+    """Make ``TeensyToAny()`` open a fake device served over a pty."""
+    with FakeTeensy(_handler) as device:
+        use_fake_device(monkeypatch, device)
+        yield device
+
+
+def _slow_handler(command):
+    time.sleep(FLEET_LATENCY)
+    if command == 'version':
+        return '0 0.18.0'
+    if command.startswith('gpio_digital_read 2'):
+        return '22 Invalid argument'
+    if command.startswith('gpio_digital_read'):
+        return '0 1'
+    return '0'
+
+
+@pytest.fixture
+def fake_devices(monkeypatch):
+    """Serve several slow fake devices, return them and the discovery calls."""
+    with ExitStack() as stack:
+        devices = {
+            f'FAKE{i}': stack.enter_context(FakeTeensy(_slow_handler))
+            for i in range(FLEET_SIZE)
+        }
+        calls = []
+
+        def device_serial_number_pairs(serial_numbers=None, **_):
+            calls.append(serial_numbers)
+            return [
+                (device.port, serial_number)
+                for serial_number, device in devices.items()
+                if serial_numbers is None or serial_number in serial_numbers
+            ]
+
+        monkeypatch.setattr(
+            TeensyToAny, 'device_serial_number_pairs',
+            staticmethod(device_serial_number_pairs),
+        )
+        yield devices, calls
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    """A path for the Unix domain socket of a broker."""
+    return str(tmp_path / 'broker.sock')
+
+
+@pytest.fixture
+def release_api():
+    """A local stand-in for the GitHub API of the latest release."""
+    with FakeReleaseAPI() as api:
+        yield api
+
+
+@pytest.fixture
+def firmware_mirror():
+    """A local stand-in for the GitHub releases, serving ``FIRMWARE``."""
+    with FakeFirmwareMirror(dict(FIRMWARE)) as mirror:
+        yield mirror
+
+
+@pytest.fixture
+def simulator():
+    """A simulated board and a ``TeensyToAny`` opened on it."""
+    with TeensyToAnySimulator(mcu='TEENSY32', i2c_devices=[0x20, 0x21]) as board:
+        with TeensyToAny(board.serial_number, port=board.port) as teensy:
+            yield board, teensy
+
+
+@pytest.fixture
+def ser2net():
+    """A simulated board exposed on a local TCP port, as by ser2net."""
+    with TeensyToAnySimulator(mcu='TEENSY32', i2c_devices=[0x20]) as board:
+        with FakeSer2Net(board.port) as server:
+            yield board, server
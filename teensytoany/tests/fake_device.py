@@ -0,0 +1,41 @@
+"""A minimal TeensyToAny stand-in served over a pseudo-terminal."""
+from teensytoany import TeensyToAny
+from teensytoany.simulator import TeensyToAnySimulator
+
+# Commands sent when a device is opened, before any user command
+OPEN_COMMANDS = ['version', 'mcu', 'i2c_buffer_size', 'i2c_1_buffer_size', 'spi_buffer_size']
+
+# The number of devices served by the fake_devices fixture
+FLEET_SIZE = 6
+# Seconds taken by the fleet devices to answer each command
+FLEET_LATENCY = 0.05
+
+
+def use_fake_device(monkeypatch, device, serial_number='FAKE'):
+    """Make ``TeensyToAny()`` open ``device``."""
+    monkeypatch.setattr(
+        TeensyToAny, 'device_serial_number_pairs',
+        staticmethod(lambda *args, **kwargs: [(device.port, serial_number)]),
+    )
+
+
+class FakeTeensy(TeensyToAnySimulator):
+    """Answer TeensyToAny commands with a handler, on the slave side of a pty.
+
+    Every received line is passed to ``handler`` which must return the full
+    response line (without the trailing newline), or None to not answer.
+    The default handler answers ``version`` and acknowledges every other
+    command.
+    """
+
+    def __init__(self, handler=None, *, version='0.18.0'):
+        self._handler = handler if handler is not None else self.default_handler
+        super().__init__(version=version)
+
+    def default_handler(self, command):
+        if command == 'version':
+            return f'0 {self.version}'
+        return '0'
+
+    def respond(self, command):
+        return self._handler(command)
@@ -0,0 +1,139 @@
+"""Local HTTP stand-ins for GitHub, served from a background thread."""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIRMWARE = {
+    f'/0.18.0/firmware_{mcu}{suffix}.hex': f':{mcu}{suffix}\n'.encode() * 20000
+    for mcu in ('teensy40', 'teensy32')
+    for suffix in ('', '_spi')
+}
+
+
+class FakeHTTPServer:
+    """Serve GET requests on a local port with :meth:`handle`.
+
+    The ``If-None-Match``, ``Range`` and ``If-Range`` headers of every
+    request are recorded in ``requests``. A body shorter than its
+    ``Content-Length`` header is sent and the connection closed, as when a
+    download is interrupted.
+    """
+
+    def __init__(self):
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                fake.requests.append({
+                    'path': self.path,
+                    'If-None-Match': self.headers.get('If-None-Match'),
+                    'Range': self.headers.get('Range'),
+                    'If-Range': self.headers.get('If-Range'),
+                })
+                status, headers, body = fake.handle(self.path, self.headers)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if 'Content-Length' not in headers:
+                    self.send_header('Content-Length', str(len(body)))
+                elif int(headers['Content-Length']) > len(body):
+                    # A truncated response, the client sees the connection drop
+                    self.close_connection = True
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self._server.server_port}'
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def handle(self, path, headers):
+        """Return the status, headers and body of the response."""
+        raise NotImplementedError
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class FakeReleaseAPI(FakeHTTPServer):
+    """Answer requests for the latest release like the GitHub API.
+
+    The ``ETag`` of the release is its quoted tag. ``status`` replaces
+    every response by an error and ``delay`` slows every response down.
+    """
+
+    def __init__(self, tag='0.18.0', *, delay=0):
+        super().__init__()
+        self.tag = tag
+        self.delay = delay
+        self.status = None
+        self.url += '/repos/ramonaoptics/teensy-to-any/releases/latest'
+
+    def handle(self, path, headers):
+        time.sleep(self.delay)
+        etag = f'"{self.tag}"'
+        if self.status is not None:
+            return self.status, {}, b''
+        if headers.get('If-None-Match') == etag:
+            return 304, {'ETag': etag, 'Content-Length': '0'}, b''
+        return 200, {'ETag': etag}, json.dumps({'tag_name': self.tag}).encode()
+
+
+class FakeFirmwareMirror(FakeHTTPServer):
+    """Serve firmware files like the GitHub releases, with ``Range`` support.
+
+    ``files`` maps paths such as ``/0.18.0/firmware_teensy40.hex`` to their
+    content, whose ``ETag`` is given by :meth:`etag`. The first ``truncate``
+    responses only send half of their body.
+    """
+
+    def __init__(self, files, *, truncate=0):
+        super().__init__()
+        self.files = files
+        self.truncate = truncate
+
+    def etag(self, path):
+        return f'"{hashlib.sha256(self.files[path]).hexdigest()[:16]}"'
+
+    def handle(self, path, headers):
+        if path not in self.files:
+            return 404, {}, b''
+        content = self.files[path]
+        start = 0
+        status = 200
+        etag = self.etag(path)
+        response_headers = {'Accept-Ranges': 'bytes', 'ETag': etag}
+        requested = headers.get('Range')
+        if headers.get('If-Range', etag) != etag:
+            # The file changed, the whole file is sent
+            requested = None
+        if requested is not None:
+            start = int(requested[len('bytes='):].rstrip('-'))
+            if start >= len(content):
+                return 416, {'Content-Range': f'bytes */{len(content)}', 'ETag': etag}, b''
+            status = 206
+            response_headers['Content-Range'] = (
+                f'bytes {start}-{len(content) - 1}/{len(content)}')
+        body = content[start:]
+        response_headers['Content-Length'] = str(len(body))
+        if self.truncate:
+            self.truncate -= 1
+            body = body[:len(body) // 2]
+        return status, response_headers, body
@@ -0,0 +1,64 @@
+"""A local stand-in for ser2net, forwarding a TCP port to a tty."""
+import os
+import select
+import socket
+import threading
+
+
+class FakeSer2Net:
+    """Forward the connections to a local TCP port to the tty at ``port``.
+
+    Like ser2net, a single client is served at a time, and the number of
+    clients that connected is counted in ``connections``.
+    """
+
+    def __init__(self, port):
+        self.connections = 0
+        self._fd = os.open(port, os.O_RDWR | os.O_NOCTTY)
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(('127.0.0.1', 0))
+        self._server.listen(1)
+        host, tcp_port = self._server.getsockname()
+        self.url = f'socket://{host}:{tcp_port}'
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._server], [], [], 0.05)
+            if not readable:
+                continue
+            client, _ = self._server.accept()
+            self.connections += 1
+            with client:
+                try:
+                    self._forward(client)
+                except ConnectionError:
+                    # Closing a socket with unread data resets the connection
+                    pass
+
+    def _forward(self, client):
+        while not self._stop.is_set():
+            readable, _, _ = select.select([client, self._fd], [], [], 0.05)
+            if client in readable:
+                data = client.recv(4096)
+                if not data:
+                    return
+                os.write(self._fd, data)
+            if self._fd in readable:
+                client.sendall(os.read(self._fd, 4096))
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+        self._server.close()
+        os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
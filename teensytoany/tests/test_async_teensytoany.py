@@ -0,0 +1,156 @@
+# pylint: disable=no-member
+import asyncio
+import threading
+from types import CodeType
+
+import pytest
+
+from teensytoany import AsyncTeensyToAny, TeensyToAny
+from teensytoany import teensytoany as teensytoany_module
+from teensytoany._recorder import _CommandRecorder
+from teensytoany.simulator import TeensyToAnySimulator
+from teensytoany.tests.fake_device import (OPEN_COMMANDS, FakeTeensy,
+                                           use_fake_device)
+
+
+def test_async_commands(fake_teensy):
+    async def main():
+        async with AsyncTeensyToAny() as teensy:
+            assert teensy.version == '0.18.0'
+            assert teensy.serial_number == 'FAKE'
+            await teensy.gpio_digital_write(13, 1)
+            assert await teensy.i2c_read_uint8(0x20, 0x0F) == 0x2a
+            with pytest.raises(RuntimeError, match="Responded with Error Code 6"):
+                await teensy.i2c_ping(0x20)
+
+    asyncio.run(main())
+    assert fake_teensy.commands[len(OPEN_COMMANDS):] == [
+        'gpio_digital_write 13 1', 'i2c_read_uint8 0x20 0xf', 'i2c_ping 0x20',
+    ]
+
+
+def test_async_concurrent_commands(fake_teensy):
+    async def main():
+        async with AsyncTeensyToAny() as teensy:
+            return await asyncio.gather(*[
+                teensy.i2c_read_uint8(0x20, register) for register in range(50)
+            ])
+
+    assert asyncio.run(main()) == [0x2a] * 50
+    assert len(fake_teensy.commands) == len(OPEN_COMMANDS) + 50
+
+
+@pytest.mark.usefixtures('fake_teensy')
+def test_async_closed_device():
+    async def main():
+        teensy = AsyncTeensyToAny()
+        with pytest.raises(RuntimeError, match="must be opened"):
+            await teensy.nop()
+
+    asyncio.run(main())
+
+
+def _attribute_names(code):
+    yield from code.co_names
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            yield from _attribute_names(constant)
+
+
+def test_async_wrappers():
+    # The wrapped TeensyToAny methods run with the async client standing in
+    # for the device, they must only use what it, or the recorder, provides
+    teensy = AsyncTeensyToAny()
+    for name, value in vars(AsyncTeensyToAny).items():
+        function = getattr(value, '__wrapped__', None)
+        if function is None:
+            continue
+        missing = {
+            attribute for attribute in _attribute_names(function.__code__)
+            if attribute.startswith('_') and not attribute.startswith('__') and
+            attribute not in vars(teensytoany_module) and
+            not hasattr(_CommandRecorder, attribute) and
+            not hasattr(TeensyToAny, attribute) and
+            not hasattr(teensy, attribute)
+        }
+        assert not missing, f"{name} uses {missing}"
+    for name in ('locked', 'priority', 'lock_statistics', 'stats'):
+        assert not hasattr(AsyncTeensyToAny, name)
+
+
+def test_async_discovery_off_the_event_loop(fake_teensy, monkeypatch):
+    threads = []
+
+    def device_serial_number_pairs(**_):
+        threads.append(threading.current_thread())
+        return [(fake_teensy.port, 'FAKE')]
+
+    monkeypatch.setattr(
+        TeensyToAny, 'device_serial_number_pairs',
+        staticmethod(device_serial_number_pairs),
+    )
+
+    async def main():
+        async with AsyncTeensyToAny() as teensy:
+            await teensy.nop()
+
+    asyncio.run(main())
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_async_tasks(monkeypatch):
+    with TeensyToAnySimulator(latency=0.001) as board:
+        use_fake_device(monkeypatch, board, board.serial_number)
+
+        async def work(teensy, address):
+            for value in range(20):
+                await teensy.register_write_uint32(address, value)
+                assert await teensy.register_read_uint32(address) == value
+
+        async def main():
+            async with AsyncTeensyToAny() as teensy:
+                await asyncio.gather(*[
+                    asyncio.create_task(work(teensy, 0x400D8000 + 4 * i)) for i in range(8)
+                ])
+
+        asyncio.run(main())
+
+
+def test_async_write_bulk(monkeypatch):
+    with TeensyToAnySimulator(mcu='TEENSY32', i2c_devices=[0x20]) as board:
+        use_fake_device(monkeypatch, board, board.serial_number)
+        payload = bytes(range(100))
+
+        async def main():
+            async with AsyncTeensyToAny() as teensy:
+                await teensy.i2c_write_bulk(0x20, bytes([0x00]) + payload)
+                await teensy.i2c_1_write_bulk(0x20, bytes([0x10]) + payload[:3])
+                return (
+                    await teensy.i2c_read_payload(0x20, 0x00, len(payload), output='bytes'),
+                    await teensy.i2c_1_read_payload(0x20, 0x10, 3, output='bytes'),
+                )
+
+        assert asyncio.run(main()) == (payload, payload[:3])
+        # The 32 byte buffer of the board holds the address and 31 bytes
+        assert board.commands.count('i2c_begin_transaction 0x20') == 1
+        assert sum(c.startswith('i2c_write ') for c in board.commands) == 4
+
+
+def test_async_close_fails_pending_commands(monkeypatch):
+    def handler(command):
+        # Never answer sleep
+        return {'version': '0 0.18.0', 'sleep 0': None}.get(command, '0')
+
+    with FakeTeensy(handler) as device:
+        use_fake_device(monkeypatch, device)
+
+        async def main():
+            async with AsyncTeensyToAny(timeout=5) as teensy:
+                pending = asyncio.ensure_future(teensy.sleep_seconds(0))
+                await asyncio.sleep(0.05)
+                assert not pending.done()
+                teensy.close()
+                with pytest.raises(RuntimeError, match='The device was closed'):
+                    await pending
+
+        asyncio.run(main())
@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.bench_suite import (LATENCY_COMMANDS, THROUGHPUT_SIZES,
+                                    hardware_device, run_suite,
+                                    simulated_device)
+
+SIZES = {name: sizes[:2] for name, sizes in THROUGHPUT_SIZES.items()}
+
+
+def _check(results, sizes=SIZES):
+    assert set(results) == {'metadata', 'latency', 'throughput', 'open', 'host'}
+    assert set(results['latency']) == set(LATENCY_COMMANDS)
+    for stats in results['latency'].values():
+        assert stats['min'] <= stats['p50'] <= stats['p90'] <= stats['p99'] <= stats['max']
+    for name, payload_sizes in sizes.items():
+        assert set(results['throughput'][name]) == {str(size) for size in payload_sizes}
+    assert results['open']['count'] >= 1
+    assert all(cost > 0 for cost in results['host'].values())
+    # The results can be saved and compared between releases
+    return json.loads(json.dumps(results))
+
+
+def test_simulated_suite():
+    with simulated_device() as open_device:
+        results = run_suite(
+            open_device, mode='simulated', repeat=20, host_number=100, sizes=SIZES)
+    results = _check(results)
+    assert results['metadata']['mode'] == 'simulated'
+    assert results['metadata']['capabilities']['mcu'] == 'TEENSY40'
+    assert all(stats['errors'] == 0 for stats in results['latency'].values())
+
+
+@pytest.mark.hardware
+def test_hardware_suite(tmp_path):
+    with hardware_device() as open_device:
+        results = _check(run_suite(open_device, mode='hardware'), THROUGHPUT_SIZES)
+    output = os.environ.get('TEENSYTOANY_BENCHMARK_OUTPUT', tmp_path / 'hardware.json')
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=1)
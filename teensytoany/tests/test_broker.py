@@ -0,0 +1,184 @@
+import socket
+import threading
+import time
+
+import pytest
+from serial import SerialException
+
+from teensytoany import TeensyToAny, TeensyToAnyBroker, TeensyToAnyClient
+from teensytoany.tests.fake_device import (OPEN_COMMANDS, FakeTeensy,
+                                           use_fake_device)
+
+
+def test_client(fake_teensy, socket_path):
+    with TeensyToAnyBroker(socket_path) as broker:
+        # Devices are opened when a client first asks for them
+        assert not broker.serial_numbers
+        with TeensyToAnyClient(socket_path=socket_path) as teensy:
+            assert broker.serial_numbers == ['FAKE']
+            assert teensy.serial_number == 'FAKE'
+            assert teensy.version == '0.18.0'
+            assert teensy.mcu == 'TEENSY40'
+            assert teensy.i2c_read_uint8(0x20, 0x0F) == 0x2a
+            with pytest.raises(RuntimeError, match="Responded with Error Code 6"):
+                teensy.i2c_ping(0x20)
+            with teensy.pipeline() as p:
+                values = [p.i2c_read_uint8(0x20, register) for register in range(50)]
+            assert [value.result() for value in values] == [0x2a] * 50
+
+        # The handshake of the clients is answered by the broker
+        with TeensyToAnyClient('FAKE', socket_path=socket_path) as teensy:
+            teensy.nop()
+    assert fake_teensy.commands == OPEN_COMMANDS + [
+        'i2c_read_uint8 0x20 0xf', 'i2c_ping 0x20'] + [
+        f'i2c_read_uint8 0x20 {register:#x}' for register in range(50)] + ['nop']
+
+
+def test_concurrent_clients(fake_teensy, socket_path):
+    errors = []
+
+    def work(register):
+        try:
+            with TeensyToAnyClient(socket_path=socket_path) as teensy:
+                for _ in range(50):
+                    assert teensy.i2c_read_uint8(0x20, register) == 0x2a
+        except Exception as e:  # pylint: disable=broad-except
+            errors.append(e)
+
+    with TeensyToAnyBroker(socket_path):
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert not errors
+    assert len(fake_teensy.commands) == len(OPEN_COMMANDS) + 8 * 50
+
+
+def test_client_timeout(monkeypatch, socket_path):
+    def handler(command):
+        if command == 'version':
+            return '0 0.18.0'
+        # Never answer sleep
+        if command.startswith('sleep'):
+            return None
+        return '0'
+
+    with FakeTeensy(handler) as device:
+        use_fake_device(monkeypatch, device)
+        with TeensyToAnyBroker(socket_path, timeout=0.05):
+            with TeensyToAnyClient(socket_path=socket_path, timeout=0.05) as teensy:
+                with pytest.raises(RuntimeError, match="Failed to read a response"):
+                    teensy.sleep_seconds(0)
+                teensy.nop()
+                with teensy.increased_timeout(0.1):
+                    with pytest.raises(RuntimeError, match="Failed to read a response"):
+                        teensy.sleep_seconds(0)
+                teensy.nop()
+
+
+def test_unknown_device(fake_teensy, socket_path, monkeypatch):
+    def device_serial_number_pairs(serial_numbers=None, **_):
+        if serial_numbers == ['OTHER']:
+            raise RuntimeError("Could not find any TeensyToAny device.")
+        return [(fake_teensy.port, 'FAKE')]
+
+    monkeypatch.setattr(
+        TeensyToAny, 'device_serial_number_pairs',
+        staticmethod(device_serial_number_pairs),
+    )
+    with TeensyToAnyBroker(socket_path, ['FAKE']):
+        with pytest.raises(RuntimeError, match="Could not find any TeensyToAny"):
+            TeensyToAnyClient('OTHER', socket_path=socket_path)
+        with TeensyToAnyClient(socket_path=socket_path) as teensy:
+            assert teensy.serial_number == 'FAKE'
+
+
+def test_no_broker(socket_path):
+    with pytest.raises(RuntimeError, match="Could not connect"):
+        TeensyToAnyClient(socket_path=socket_path)
+
+
+@pytest.mark.usefixtures('fake_teensy')
+def test_one_broker_per_socket(socket_path):
+    with TeensyToAnyBroker(socket_path):
+        with pytest.raises(RuntimeError, match="Another broker"):
+            TeensyToAnyBroker(socket_path).open()
+    # A socket left behind is replaced
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+        stale.bind(socket_path)
+    with TeensyToAnyBroker(socket_path):
+        with TeensyToAnyClient(socket_path=socket_path) as teensy:
+            teensy.nop()
+
+
+def test_socket_path_is_a_file(socket_path):
+    with open(socket_path, 'w', encoding='utf-8') as f:
+        f.write('data')
+    with pytest.raises(RuntimeError, match="is not a socket"):
+        TeensyToAnyBroker(socket_path).open()
+    with open(socket_path, encoding='utf-8') as f:
+        assert f.read() == 'data'
+
+
+@pytest.mark.usefixtures('fake_teensy')
+def test_device_failure(socket_path):
+    def fail(*args, **kwargs):
+        raise SerialException("The device was disconnected.")
+
+    with TeensyToAnyBroker(socket_path) as broker:
+        with TeensyToAnyClient(socket_path=socket_path) as teensy:
+            worker = broker._workers['FAKE']  # pylint: disable=protected-access
+            worker.teensy._serial.read_until = fail  # pylint: disable=protected-access
+            # The commands in flight when the device fails are answered too
+            with teensy.pipeline(raise_on_error=False) as p:
+                responses = [p.nop() for _ in range(5)]
+            for response in responses:
+                with pytest.raises(RuntimeError):
+                    response.result()
+            with pytest.raises(RuntimeError, match="Failed to read a response"):
+                teensy.nop()
+
+
+def test_broker_not_answering(socket_path, monkeypatch):
+    monkeypatch.setattr('teensytoany.broker._BROKER_GRACE_PERIOD', 0.1)
+    done = threading.Event()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen()
+
+        def serve():
+            connection, _ = server.accept()
+            with connection:
+                # Open the device, then never answer
+                connection.recv(1024)
+                connection.sendall(b'0 FAKE\n')
+                done.wait()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        with pytest.raises(RuntimeError, match="did not answer in time"):
+            TeensyToAnyClient(socket_path=socket_path, timeout=0.05)
+        done.set()
+        thread.join()
+
+
+def test_device_still_busy(monkeypatch, socket_path):
+    def handler(command):
+        if command.startswith('sleep'):
+            # Longer than the timeout of the command and of the resynchronization
+            time.sleep(0.4)
+        return {'version': '0 0.18.0'}.get(command, '0')
+
+    with FakeTeensy(handler) as device:
+        use_fake_device(monkeypatch, device)
+        with TeensyToAnyBroker(socket_path, timeout=0.05):
+            with TeensyToAnyClient(socket_path=socket_path, timeout=0.05) as teensy:
+                with pytest.raises(RuntimeError, match="Failed to read a response"):
+                    teensy.sleep_seconds(0)
+                # Not sent to the device, which has not answered sleep yet
+                with pytest.raises(RuntimeError, match="Failed to read a response"):
+                    teensy.nop()
+                time.sleep(0.4)
+                teensy.nop()
+    assert device.commands.count('nop') == 1
@@ -0,0 +1,37 @@
+from array import array
+
+import pytest
+
+from teensytoany.decoder import decode_payload
+
+
+@pytest.mark.parametrize('returned, expected', [
+    ('0x3f 0x00 0xff', [0x3F, 0x00, 0xFF]),
+    ('0x3F 0x0A', [0x3F, 0x0A]),
+    ('0x3 0xf', [0x3, 0xF]),
+    ('63 0 255', [63, 0, 255]),
+    ('0x3f 10', [0x3F, 10]),
+    ('0x1234', [0x1234]),
+    ('', []),
+    (None, []),
+])
+def test_decode_payload_list(returned, expected):
+    assert decode_payload(returned) == expected
+
+
+def test_decode_payload_outputs():
+    returned = '0x3f 0x00 0xff'
+    assert decode_payload(returned, output='bytes') == b'\x3f\x00\xff'
+    assert decode_payload(returned, output='array') == array('B', [0x3F, 0x00, 0xFF])
+    assert decode_payload('63 0 255', output='bytes') == b'\x3f\x00\xff'
+    with pytest.raises(ValueError, match="Unknown output"):
+        decode_payload(returned, output='tuple')
+
+
+def test_decode_payload_numpy():
+    np = pytest.importorskip('numpy')
+    decoded = decode_payload('0x3f 0x00 0xff', output='numpy')
+    assert decoded.dtype == np.uint8
+    np.testing.assert_array_equal(decoded, [0x3F, 0x00, 0xFF])
+    # The array is not a view into an immutable bytes object
+    decoded[0] = 1
@@ -0,0 +1,103 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+from serial.tools import list_ports
+
+from teensytoany import TeensyToAny, discovery
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    discovery.invalidate_cache()
+    yield
+    discovery.invalidate_cache()
+
+
+def make_device(root, name, serial_number, *, vid='16c0', pid='0483', by_id=True):
+    interface = root / 'sys' / 'devices' / 'usb1' / f'1-{name}' / f'1-{name}:1.0'
+    interface.mkdir(parents=True)
+    usb_device = interface.parent
+    (usb_device / 'idVendor').write_text(vid + '\n')
+    (usb_device / 'idProduct').write_text(pid + '\n')
+    (usb_device / 'serial').write_text(serial_number + '\n')
+
+    tty = root / 'sys' / 'class' / 'tty' / name
+    tty.mkdir(parents=True)
+    (tty / 'device').symlink_to(interface)
+
+    by_id_directory = root / 'dev' / 'serial' / 'by-id'
+    by_id_directory.mkdir(parents=True, exist_ok=True)
+    (root / 'dev' / name).touch()
+    if by_id:
+        link = by_id_directory / f'usb-TeensyToAny_TeensyToAny_{serial_number}-if00'
+        link.symlink_to(os.path.join('..', '..', name))
+
+
+def find(root, serial_numbers):
+    return discovery.find_serial_numbers(
+        serial_numbers,
+        TeensyToAny.VID_PID_s,
+        by_id_directory=str(root / 'dev' / 'serial' / 'by-id'),
+        sysfs_directory=str(root / 'sys' / 'class' / 'tty'),
+    )
+
+
+def test_find_by_id(tmp_path):
+    make_device(tmp_path, 'ttyACM0', '12345')
+    make_device(tmp_path, 'ttyACM1', '67890')
+    pairs = find(tmp_path, ['67890', '12345'])
+    assert pairs == [
+        (str(tmp_path / 'dev' / 'ttyACM1'), '67890'),
+        (str(tmp_path / 'dev' / 'ttyACM0'), '12345'),
+    ]
+
+
+def test_find_by_sysfs(tmp_path):
+    make_device(tmp_path, 'ttyACM3', '12345', by_id=False)
+    assert find(tmp_path, ['12345']) == [('/dev/ttyACM3', '12345')]
+
+
+def test_find_ignores_other_devices(tmp_path):
+    make_device(tmp_path, 'ttyACM0', '12345', vid='0403', pid='6001')
+    assert find(tmp_path, ['12345']) is None
+    assert find(tmp_path, ['unknown']) is None
+
+
+def test_find_missing_directories(tmp_path):
+    assert find(tmp_path, ['12345']) is None
+
+
+def test_find_is_cached(tmp_path):
+    make_device(tmp_path, 'ttyACM0', '12345')
+    expected = [(str(tmp_path / 'dev' / 'ttyACM0'), '12345')]
+    assert find(tmp_path, ['12345']) == expected
+
+    for path in (tmp_path / 'dev' / 'serial' / 'by-id').iterdir():
+        path.unlink()
+    assert find(tmp_path, ['12345']) == expected
+
+    discovery.invalidate_cache()
+    assert find(tmp_path, ['12345']) == [('/dev/ttyACM0', '12345')]
+
+
+def test_comports_is_cached(monkeypatch):
+    calls = []
+
+    def comports():
+        calls.append(None)
+        return [SimpleNamespace(
+            device='/dev/ttyACM0', serial_number='12345', vid=0x16C0,
+            pid=0x0483, manufacturer='TeensyToAny')]
+
+    monkeypatch.setattr(list_ports, 'comports', comports)
+    monkeypatch.setattr(
+        discovery, 'find_serial_numbers', lambda *args, **kwargs: None)
+    assert TeensyToAny.list_all_serial_numbers() == ('12345',)
+    assert TeensyToAny.list_all_serial_numbers(['12345']) == ('12345',)
+    assert len(calls) == 1
+
+    discovery.invalidate_cache()
+    with pytest.raises(RuntimeError, match="Could not find"):
+        TeensyToAny.list_all_serial_numbers(['67890'])
+    assert len(calls) == 2
@@ -0,0 +1,173 @@
+import threading
+import time
+
+import pytest
+
+from teensytoany import TeensyToAny, downloads, firmware_cache
+from teensytoany.downloads import (download_firmware, firmware_url,
+                                   prefetch_firmware)
+from teensytoany.firmware_cache import FirmwareCache
+from teensytoany.tests.fake_http import FIRMWARE, FakeFirmwareMirror
+
+
+def test_firmware_url(monkeypatch):
+    monkeypatch.delenv('TEENSYTOANY_FIRMWARE_MIRROR', raising=False)
+    assert firmware_url(mcu='TEENSY40', version='0.18.0') == (
+        'https://github.com/ramonaoptics/teensy-to-any/releases/download/'
+        '0.18.0/firmware_teensy40.hex')
+    assert firmware_url(
+        mcu='TEENSY32', version='0.18.0', variant='spi', base_url='http://mirror/'
+    ) == 'http://mirror/0.18.0/firmware_teensy32_spi.hex'
+
+    monkeypatch.setenv('TEENSYTOANY_FIRMWARE_MIRROR', 'http://lab-mirror')
+    assert firmware_url(mcu='TEENSY40', version='0.18.0') == (
+        'http://lab-mirror/0.18.0/firmware_teensy40.hex')
+
+
+def test_download(firmware_mirror, tmp_path):
+    cache = FirmwareCache(tmp_path)
+    path = download_firmware(
+        mcu='TEENSY40', version='0.18.0', base_url=firmware_mirror.url, cache=cache)
+    assert path.read_bytes() == FIRMWARE['/0.18.0/firmware_teensy40.hex']
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0', verify=True) == path
+    assert not cache.partial_path(mcu='TEENSY40', version='0.18.0').exists()
+    assert [r['Range'] for r in firmware_mirror.requests] == [None]
+
+
+def test_download_resumes_after_interruption(firmware_mirror, tmp_path):
+    cache = FirmwareCache(tmp_path)
+    content = FIRMWARE['/0.18.0/firmware_teensy40.hex']
+    firmware_mirror.truncate = 2
+    path = download_firmware(
+        mcu='TEENSY40', version='0.18.0', base_url=firmware_mirror.url, cache=cache)
+    assert path.read_bytes() == content
+    # Each attempt continues from the bytes already received
+    ranges = [r['Range'] for r in firmware_mirror.requests]
+    assert len(ranges) == 3
+    assert ranges[0] is None
+    offsets = [int(r[len('bytes='):-1]) for r in ranges[1:]]
+    assert 0 < offsets[0] < offsets[1] < len(content)
+
+
+def test_download_gives_up(firmware_mirror, tmp_path):
+    cache = FirmwareCache(tmp_path)
+    firmware_mirror.truncate = 10
+    with pytest.raises(RuntimeError, match='Failed to download'):
+        download_firmware(
+            mcu='TEENSY40', version='0.18.0', base_url=firmware_mirror.url, cache=cache,
+            retries=1)
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0') is None
+    # The partial file is kept for the next call
+    received = cache.partial_path(mcu='TEENSY40', version='0.18.0').stat().st_size
+    assert received > 0
+
+    firmware_mirror.truncate = 0
+    path = download_firmware(
+        mcu='TEENSY40', version='0.18.0', base_url=firmware_mirror.url, cache=cache)
+    assert path.read_bytes() == FIRMWARE['/0.18.0/firmware_teensy40.hex']
+    assert firmware_mirror.requests[-1]['Range'] == f'bytes={received}-'
+
+
+def test_download_completed_partial(firmware_mirror, tmp_path):
+    cache = FirmwareCache(tmp_path)
+    content = FIRMWARE['/0.18.0/firmware_teensy32.hex']
+    partial = cache.partial_path(mcu='TEENSY32', version='0.18.0')
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(content)
+    etag = firmware_mirror.etag('/0.18.0/firmware_teensy32.hex')
+    partial.with_name(f'{partial.name}.etag').write_text(etag)
+    path = download_firmware(
+        mcu='TEENSY32', version='0.18.0', base_url=firmware_mirror.url, cache=cache)
+    assert path.read_bytes() == content
+    assert [(r['Range'], r['If-Range']) for r in firmware_mirror.requests] == [
+        (f'bytes={len(content)}-', etag)]
+    assert not list(partial.parent.glob('.*'))
+
+
+def test_download_restarts_when_the_file_changed(firmware_mirror, tmp_path):
+    cache = FirmwareCache(tmp_path)
+    firmware_mirror.truncate = 1
+    with pytest.raises(RuntimeError, match='Failed to download'):
+        download_firmware(
+            mcu='TEENSY40', version='0.18.0', base_url=firmware_mirror.url, cache=cache,
+            retries=0)
+    etag = firmware_mirror.etag('/0.18.0/firmware_teensy40.hex')
+    # The mirror is updated before the download is resumed
+    content = b':replaced\n' * 30000
+    firmware_mirror.files = {'/0.18.0/firmware_teensy40.hex': content}
+    path = download_firmware(
+        mcu='TEENSY40', version='0.18.0', base_url=firmware_mirror.url, cache=cache)
+    assert path.read_bytes() == content
+    assert firmware_mirror.requests[-1]['If-Range'] == etag
+
+    # A partial file without ETag is not resumed
+    partial = cache.partial_path(mcu='TEENSY40', version='0.18.0')
+    partial.write_bytes(content[:100])
+    cache.remove(mcu='TEENSY40', version='0.18.0')
+    path = download_firmware(
+        mcu='TEENSY40', version='0.18.0', base_url=firmware_mirror.url, cache=cache)
+    assert path.read_bytes() == content
+    assert firmware_mirror.requests[-1]['Range'] is None
+
+
+def test_download_missing(firmware_mirror, tmp_path):
+    with pytest.raises(RuntimeError, match='Status code: 404'):
+        download_firmware(
+            mcu='TEENSY40', version='9.9.9', base_url=firmware_mirror.url,
+            cache=FirmwareCache(tmp_path))
+
+
+def test_download_firmware_uses_mirror(firmware_mirror, tmp_path, monkeypatch):
+    cache = FirmwareCache(tmp_path)
+    monkeypatch.setattr(firmware_cache, 'default_cache', lambda: cache)
+    monkeypatch.setenv('TEENSYTOANY_FIRMWARE_MIRROR', firmware_mirror.url)
+    path = TeensyToAny.download_firmware(mcu='TEENSY32', version='0.18.0', variant='spi')
+    assert path == cache.path(mcu='TEENSY32', version='0.18.0', variant='spi')
+    assert path.read_bytes() == FIRMWARE['/0.18.0/firmware_teensy32_spi.hex']
+
+
+def test_prefetch(firmware_mirror, tmp_path):
+    cache = FirmwareCache(tmp_path)
+    results = prefetch_firmware(
+        version='0.18.0', variants=[None, 'spi'], base_url=firmware_mirror.url, cache=cache)
+    assert set(results) == {
+        ('TEENSY40', None), ('TEENSY40', 'spi'), ('TEENSY32', None), ('TEENSY32', 'spi')}
+    for (mcu, variant), path in results.items():
+        assert path == cache.lookup(mcu=mcu, version='0.18.0', variant=variant, verify=True)
+    assert len(firmware_mirror.requests) == 4
+
+    # Cached files are not downloaded again, failures are reported
+    results = prefetch_firmware(
+        version='0.18.0', mcus=['TEENSY40', 'TEENSY41'], base_url=firmware_mirror.url, cache=cache)
+    assert results[('TEENSY40', None)] == cache.path(mcu='TEENSY40', version='0.18.0')
+    assert isinstance(results[('TEENSY41', None)], RuntimeError)
+    assert [r['path'] for r in firmware_mirror.requests[4:]] == ['/0.18.0/firmware_teensy41.hex']
+
+
+def test_prefetch_is_concurrent(tmp_path):
+    class SlowMirror(FakeFirmwareMirror):
+        def handle(self, path, headers):
+            time.sleep(0.2)
+            return super().handle(path, headers)
+
+    with SlowMirror(dict(FIRMWARE)) as mirror:
+        start = time.perf_counter()
+        results = prefetch_firmware(
+            version='0.18.0', variants=[None, 'spi'], base_url=mirror.url,
+            cache=FirmwareCache(tmp_path))
+        duration = time.perf_counter() - start
+    assert all(not isinstance(result, Exception) for result in results.values())
+    assert duration < 0.6
+
+
+def test_shared_session():
+    sessions = []
+    threads = [
+        threading.Thread(target=lambda: sessions.append(downloads.session()))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, sessions))) == 1
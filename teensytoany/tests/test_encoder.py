@@ -0,0 +1,87 @@
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany.decoder import decode_payload
+from teensytoany.encoder import (compact_payload_length, encode,
+                                 encode_compact_payload, encode_payload)
+from teensytoany.tests.fake_device import (OPEN_COMMANDS, FakeTeensy,
+                                           use_fake_device)
+
+
+@pytest.mark.parametrize('address, register_address, data', [
+    (0x20, 0x0F, 0x3), (0xFE, 0x1234, 0xFFFF), (0, 0, 0),
+])
+def test_encode_matches_formatted_commands(address, register_address, data):
+    assert encode('i2c_write_uint8', address, register_address, data) == (
+        f"i2c_write_uint8 0x{address:02x} 0x{register_address:x} 0x{data:x}\n"
+    ).encode()
+    assert encode('i2c_1_read_payload_uint16', address, register_address, 12) == (
+        f"i2c_1_read_payload_uint16 0x{address:02x} 0x{register_address:04x} 12\n"
+    ).encode()
+    assert encode('register_write_uint32', register_address, data) == (
+        f"register_write_uint32 {register_address} {data}\n"
+    ).encode()
+
+
+def test_encode_payload():
+    payload = [0, 1, 0x3F, 0xFF]
+    assert encode_payload(payload) == b'0x00 0x01 0x3f 0xff'
+    assert encode_payload(bytes(payload), base=10) == b'0 1 63 255'
+    assert encode_payload(['0x10', 3], base=10) == b'0x10 3'
+    with pytest.raises(ValueError):
+        encode_payload([256])
+
+
+@pytest.mark.parametrize('encoding, encoded', [
+    ('hex', b'00013fff'), ('base64', b'AAE//w=='),
+])
+def test_compact_payloads(encoding, encoded):
+    payload = [0, 1, 0x3F, 0xFF]
+    assert encode_compact_payload(payload, encoding) == encoded
+    assert decode_payload(encoded.decode(), encoding=encoding) == payload
+    data = bytes(range(256))
+    length = compact_payload_length(encoding, 100)
+    assert len(encode_compact_payload(data[:length], encoding)) <= 100
+    assert len(encode_compact_payload(data[:length + 3], encoding)) > 100
+    with pytest.raises(ValueError):
+        decode_payload('0x00 0x01', encoding=encoding)
+
+
+def test_send_raw(fake_teensy):
+    with TeensyToAny() as teensy:
+        command = encode('i2c_read_uint8', 0x20, 0x0F)
+        assert teensy.send_raw(command) == '0x2a'
+        with pytest.raises(ValueError, match="newline"):
+            teensy.send_raw(b'nop')
+        teensy.gpio_digital_write(13, 'HIGH')
+        teensy.gpio_digital_write(13, 0)
+        teensy.i2c_end_transaction(stop=False)
+    assert fake_teensy.commands[len(OPEN_COMMANDS):] == [
+        'i2c_read_uint8 0x20 0xf',
+        'gpio_digital_write 13 HIGH',
+        'gpio_digital_write 13 0',
+        'i2c_end_transaction false',
+    ]
+
+
+def test_non_int_arguments_are_sent_as_formatted(monkeypatch):
+    def handler(command):
+        if command == 'version':
+            return '0 0.18.0'
+        return '0 1'
+
+    with FakeTeensy(handler) as device:
+        use_fake_device(monkeypatch, device)
+        with TeensyToAny() as teensy:
+            assert teensy.register_read_uint32('0x400D8000') == 1
+            teensy.register_write_uint32(0x400D8000, 1.5)
+            assert teensy.gpio_digital_read('13')
+            teensy.gpio_pin_mode(13.0, 'OUTPUT')
+            teensy.register_write_uint8(16, 255)
+    assert device.commands[len(OPEN_COMMANDS):] == [
+        'register_read_uint32 0x400D8000',
+        'register_write_uint32 1074626560 1.5',
+        'gpio_digital_read 13',
+        'gpio_pin_mode 13.0 OUTPUT',
+        'register_write_uint8 16 255',
+    ]
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import threading
+
+import pytest
+
+from teensytoany import TeensyToAny, firmware_cache
+from teensytoany.firmware_cache import FirmwareCache
+
+FIRMWARE = b':100000000000000000000000000000000000000000F0\n' * 10
+
+
+def test_add_and_lookup(tmp_path):
+    cache = FirmwareCache(tmp_path)
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0') is None
+    assert cache.latest_version(mcu='TEENSY40') is None
+
+    path = cache.add([FIRMWARE[:100], FIRMWARE[100:]], mcu='TEENSY40', version='0.18.0')
+    cache.add([FIRMWARE], mcu='TEENSY40', version='0.9.0')
+    cache.add([FIRMWARE], mcu='TEENSY40', version='0.20.0', variant='spi')
+    cache.add([FIRMWARE], mcu='TEENSY32', version='0.19.0')
+
+    assert path == tmp_path / 'teensy40' / '0.18.0' / 'firmware.hex'
+    assert path.read_bytes() == FIRMWARE
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0', verify=True) == path
+    assert cache.versions(mcu='TEENSY40') == ['0.9.0', '0.18.0']
+    assert cache.versions(mcu='TEENSY40', variant='spi') == ['0.20.0']
+    assert cache.latest_version(mcu='TEENSY40') == '0.18.0'
+    assert cache.latest_version(mcu='TEENSY32') == '0.19.0'
+
+    index = json.loads((tmp_path / 'index.json').read_text())
+    entry = index['entries']['teensy40/0.18.0/']
+    assert entry['size'] == len(FIRMWARE)
+    assert entry['sha256'] == hashlib.sha256(FIRMWARE).hexdigest()
+    assert not list(tmp_path.rglob('*.part'))
+
+
+def test_lookup_detects_modified_files(tmp_path):
+    cache = FirmwareCache(tmp_path)
+    path = cache.add([FIRMWARE], mcu='TEENSY40', version='0.18.0')
+    # Same size, different content
+    path.write_bytes(FIRMWARE.replace(b'F0', b'00'))
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0') == path
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0', verify=True) is None
+    assert not path.exists()
+    assert cache.latest_version(mcu='TEENSY40') is None
+
+    path = cache.add([FIRMWARE], mcu='TEENSY40', version='0.18.0')
+    path.write_bytes(FIRMWARE[:-10])
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0') is None
+    # Files are only removed once they are verified
+    assert path.exists()
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0', verify=True) is None
+    assert not path.exists()
+
+
+def test_lookup_indexes_copied_files(tmp_path):
+    cache = FirmwareCache(tmp_path)
+    cache.add([FIRMWARE], mcu='TEENSY40', version='0.17.0')
+    path = cache.path(mcu='TEENSY40', version='0.18.0')
+    path.parent.mkdir()
+    path.write_bytes(FIRMWARE)
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0', verify=True) == path
+    assert cache.versions(mcu='TEENSY40') == ['0.17.0', '0.18.0']
+    assert cache.latest_version(mcu='TEENSY40') == '0.18.0'
+
+
+def test_concurrent_caches(tmp_path):
+    # Instances that share a directory behave as different processes
+    def add(version):
+        FirmwareCache(tmp_path).add([FIRMWARE], mcu='TEENSY40', version=version)
+
+    versions = [f'0.{i}.0' for i in range(1, 17)]
+    threads = [threading.Thread(target=add, args=(version,)) for version in versions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert FirmwareCache(tmp_path).versions(mcu='TEENSY40') == versions
+
+
+def test_truncated_download(tmp_path):
+    cache = FirmwareCache(tmp_path)
+    with pytest.raises(RuntimeError, match="received 10 of 20 bytes"):
+        cache.add([b'0' * 10], mcu='TEENSY40', version='0.18.0', expected_size=20)
+    assert cache.lookup(mcu='TEENSY40', version='0.18.0') is None
+    assert not list((tmp_path / 'teensy40' / '0.18.0').iterdir())
+
+
+def test_eviction(tmp_path):
+    cache = FirmwareCache(tmp_path, max_entries=2)
+    first = cache.add([FIRMWARE], mcu='TEENSY40', version='0.1.0')
+    second = cache.add([FIRMWARE], mcu='TEENSY40', version='0.2.0')
+    # Programming the first version makes the second the least recently used
+    assert cache.lookup(mcu='TEENSY40', version='0.1.0', verify=True) == first
+    cache.add([FIRMWARE], mcu='TEENSY40', version='0.3.0')
+    assert cache.versions(mcu='TEENSY40') == ['0.1.0', '0.3.0']
+    assert not second.exists()
+    assert not second.parent.exists()
+
+
+def test_index_existing_cache(tmp_path):
+    for version in ['0.17.0', '0.18.0']:
+        directory = tmp_path / 'teensy40' / version
+        directory.mkdir(parents=True)
+        (directory / 'firmware.hex').write_bytes(FIRMWARE)
+    (tmp_path / 'teensy40' / '0.18.0' / 'firmware_spi.hex').write_bytes(FIRMWARE)
+    (tmp_path / 'teensy40' / 'not_a_version').mkdir()
+
+    cache = FirmwareCache(tmp_path)
+    assert cache.versions(mcu='TEENSY40') == ['0.17.0', '0.18.0']
+    assert cache.versions(mcu='TEENSY40', variant='spi') == ['0.18.0']
+    assert (tmp_path / 'index.json').is_file()
+
+    # Other instances, such as other processes, see the changes
+    other = FirmwareCache(tmp_path)
+    other.remove(mcu='TEENSY40', version='0.18.0')
+    assert cache.latest_version(mcu='TEENSY40') == '0.17.0'
+
+
+def test_prepare_firmware_downloads_corrupted_files(tmp_path, monkeypatch):
+    cache = FirmwareCache(tmp_path)
+    monkeypatch.setattr(firmware_cache, 'default_cache', lambda: cache)
+    downloads = []
+
+    def download_firmware(*, mcu, version, variant=None, **_):
+        downloads.append(version)
+        return cache.add([FIRMWARE], mcu=mcu, version=version, variant=variant)
+
+    monkeypatch.setattr(TeensyToAny, 'download_firmware', staticmethod(download_firmware))
+    # pylint: disable=protected-access
+    path = TeensyToAny._prepare_firmware(mcu='TEENSY40', version='0.18.0')
+    assert TeensyToAny._prepare_firmware(mcu='TEENSY40', version='0.18.0') == path
+    assert downloads == ['0.18.0']
+
+    path.write_bytes(FIRMWARE.replace(b'F0', b'00'))
+    assert TeensyToAny._prepare_firmware(mcu='TEENSY40', version='0.18.0') == path
+    assert downloads == ['0.18.0', '0.18.0']
+    assert path.read_bytes() == FIRMWARE
+
+    assert TeensyToAny._find_local_versions(mcu='TEENSY40') == ['0.18.0']
+    assert TeensyToAny.get_latest_available_firmware_version(online=False) == '0.18.0'
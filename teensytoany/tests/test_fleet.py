@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from teensytoany import TeensyFleet
+from teensytoany.fleet import FleetError
+from teensytoany.tests.fake_device import FLEET_SIZE, OPEN_COMMANDS
+
+
+def test_fleet_opens_concurrently(fake_devices):
+    devices, calls = fake_devices
+    lock = threading.Lock()
+    busy = set()
+    peak = []
+
+    def tracked(serial_number, handler):
+        def handle(command):
+            with lock:
+                busy.add(serial_number)
+                peak.append(len(busy))
+            try:
+                return handler(command)
+            finally:
+                with lock:
+                    busy.discard(serial_number)
+        return handle
+
+    for serial_number, device in devices.items():
+        # pylint: disable=protected-access
+        device._handler = tracked(serial_number, device._handler)
+
+    with TeensyFleet() as fleet:
+        assert sorted(fleet.serial_numbers) == [f'FAKE{i}' for i in range(FLEET_SIZE)]
+        assert fleet['FAKE3'].serial_number == 'FAKE3'
+        assert len(fleet) == FLEET_SIZE
+    # Discovered once, and the devices answered the handshake at the same time
+    assert calls == [None]
+    assert max(peak) > 1
+    for device in devices.values():
+        assert device.commands[:len(OPEN_COMMANDS)] == OPEN_COMMANDS
+
+
+def test_fleet_map(fake_devices):
+    devices, _ = fake_devices
+    with TeensyFleet(['FAKE0', 'FAKE1', 'FAKE2']) as fleet:
+        results = fleet.map('gpio_digital_write', 13, 1)
+        assert results.ok
+        assert results == {'FAKE0': None, 'FAKE1': None, 'FAKE2': None}
+        assert set(results.durations) == {'FAKE0', 'FAKE1', 'FAKE2'}
+
+        versions = fleet.map(lambda teensy: teensy.version)
+        assert set(versions.values()) == {'0.18.0'}
+    for serial_number in ['FAKE0', 'FAKE1', 'FAKE2']:
+        assert devices[serial_number].commands[-1] == 'gpio_digital_write 13 1'
+    assert devices['FAKE3'].commands == []
+
+
+@pytest.mark.usefixtures('fake_devices')
+def test_fleet_errors():
+    with TeensyFleet() as fleet:
+        results = fleet.scatter('gpio_digital_read', {
+            'FAKE0': (1,),
+            'FAKE1': {'pin': 2},
+            'FAKE2': (3,),
+        })
+        assert results == {'FAKE0': True, 'FAKE2': True}
+        assert list(results.errors) == ['FAKE1']
+        assert not results.ok
+        with pytest.raises(FleetError, match="failed on 1 of 3 devices") as e:
+            results.raise_on_error()
+        assert list(e.value.errors) == ['FAKE1']
+
+        with pytest.raises(KeyError, match="UNKNOWN"):
+            fleet.scatter('nop', {'UNKNOWN': ()})
+        with pytest.raises(AttributeError):
+            fleet.map('not_a_method')
+
+
+def test_fleet_open_errors(fake_devices):
+    devices, _ = fake_devices
+    devices['FAKE4'].close()
+    with pytest.warns(UserWarning, match="Could not open 1 of 6"):
+        fleet = TeensyFleet()
+    with fleet:
+        assert list(fleet.open_errors) == ['FAKE4']
+        assert 'FAKE4' not in fleet.serial_numbers
+        assert fleet.map('nop').ok
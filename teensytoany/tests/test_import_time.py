@@ -0,0 +1,40 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+import teensytoany
+from teensytoany.async_teensytoany import AsyncTeensyToAny
+from teensytoany.teensytoany import TeensyToAny
+
+# Modules that only the commands using them should load
+DEFERRED = ('serial', 'packaging', 'asyncio', 'requests', 'concurrent.futures')
+
+
+def _loaded_modules(statement):
+    code = (
+        f"import json, sys\n{statement}\n"
+        f"print(json.dumps(sorted(m for m in {DEFERRED!r} if m in sys.modules)))"
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output)
+
+
+@pytest.mark.parametrize('statement', [
+    'import teensytoany',
+    'import teensytoany.cli',
+    'from teensytoany import discovery, firmware_cache',
+])
+def test_imports_are_deferred(statement):
+    assert not _loaded_modules(statement)
+
+
+def test_lazy_attributes():
+    assert teensytoany.TeensyToAny is TeensyToAny
+    assert teensytoany.AsyncTeensyToAny is AsyncTeensyToAny
+    assert set(teensytoany.__all__) <= set(dir(teensytoany))
+    with pytest.raises(AttributeError, match='NotAThing'):
+        teensytoany.NotAThing  # pylint: disable=pointless-statement,no-member
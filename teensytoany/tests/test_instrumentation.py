@@ -0,0 +1,73 @@
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany.instrumentation import BUCKET_BOUNDS, Instrumentation
+from teensytoany.simulator import TeensyToAnySimulator
+
+
+def test_stats_by_verb():
+    with TeensyToAnySimulator(mcu='TEENSY32', i2c_devices=[0x20], latency=0.002) as board:
+        with TeensyToAny(board.serial_number, port=board.port, instrument=True) as teensy:
+            records = []
+            teensy.instrumentation.add_callback(records.append)
+            teensy.stats(reset=True)
+
+            for _ in range(10):
+                teensy.nop()
+            teensy.i2c_init()
+            teensy.i2c_write_uint8(0x20, 0x10, 0xAB)
+            assert teensy.i2c_read_uint8(0x20, 0x10) == 0xAB
+            with pytest.raises(RuntimeError, match='Error Code 6'):
+                teensy.i2c_ping(0x50)
+            stats = teensy.stats(reset=True)
+
+            assert stats['elapsed'] > 0
+            nop = stats['commands']['nop']
+            assert nop['count'] == 10
+            assert nop['bytes_sent'] == 10 * len('nop\n')
+            assert nop['bytes_received'] == 10 * len('0\n')
+            assert 0.002 <= nop['min_time'] <= nop['p50'] <= nop['p99']
+            assert nop['max_time'] <= nop['total_time'] < stats['elapsed']
+            assert sum(nop['histogram']) == 10
+            assert len(nop['histogram']) == len(BUCKET_BOUNDS) + 1
+            assert nop['errors'] == {} and nop['timeouts'] == 0
+            assert stats['commands']['i2c_ping']['errors'] == {6: 1}
+            assert stats['totals']['count'] == 14
+            assert stats['totals']['errors'] == 1
+
+            assert [record.verb for record in records[-3:]] == [
+                'i2c_write_uint8', 'i2c_read_uint8', 'i2c_ping']
+            assert records[-1].error_code == 6
+
+            with teensy.pipeline() as pipeline:
+                for _ in range(5):
+                    pipeline.nop()
+            assert teensy.stats(reset=True)['commands']['nop']['count'] == 5
+            assert teensy.stats()['totals']['count'] == 0
+
+
+def test_timeouts_and_shared_instrumentation():
+    instrumentation = Instrumentation()
+    with TeensyToAnySimulator(mcu='TEENSY32') as board:
+        with TeensyToAny(board.serial_number, port=board.port,
+                         instrument=instrumentation) as teensy, \
+                TeensyToAny(board.serial_number, port=board.port,
+                            instrument=instrumentation) as other:
+            assert teensy.instrumentation is other.instrumentation
+            instrumentation.stats(reset=True)
+            teensy.nop()
+            other.nop()
+            board.latency = 0.3
+            with pytest.raises(RuntimeError, match='Failed to read a response'):
+                teensy.nop()
+        stats = instrumentation.stats()
+    assert stats['commands']['nop']['count'] == 3
+    assert stats['commands']['nop']['timeouts'] == 1
+
+
+def test_disabled():
+    with TeensyToAnySimulator() as board:
+        with TeensyToAny(board.serial_number, port=board.port) as teensy:
+            assert teensy.instrumentation is None
+            with pytest.raises(RuntimeError, match='instrument=True'):
+                teensy.stats()
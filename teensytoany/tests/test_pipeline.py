@@ -0,0 +1,73 @@
+from collections import deque
+
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany.tests.fake_device import OPEN_COMMANDS
+
+
+def test_pipeline_results_in_order(fake_teensy):
+    with TeensyToAny() as teensy:
+        with teensy.pipeline() as p:
+            writes = [p.i2c_write_uint8(0x20, register, register) for register in range(10)]
+            value = p.i2c_read_uint8(0x20, 0x0F)
+            raw = p.ask('nop')
+        assert value.result() == 0x2a
+        assert raw.result() is None
+        assert all(write.result() is None for write in writes)
+    assert fake_teensy.commands[len(OPEN_COMMANDS):] == [
+        f'i2c_write_uint8 0x20 0x{register:x} 0x{register:x}' for register in range(10)
+    ] + ['i2c_read_uint8 0x20 0xf', 'nop']
+
+
+@pytest.mark.usefixtures('fake_teensy')
+def test_pipeline_deferred_error():
+    with TeensyToAny() as teensy:
+        with teensy.pipeline(raise_on_error=False) as p:
+            ping = p.i2c_ping(0x20)
+            after = p.nop()
+        with pytest.raises(RuntimeError, match="Responded with Error Code 6"):
+            ping.result()
+        assert after.result() is None
+
+        with pytest.raises(RuntimeError, match="Responded with Error Code 6"):
+            with teensy.pipeline() as p:
+                p.i2c_ping(0x20)
+
+
+def test_pipeline_respects_buffer_limit(fake_teensy):
+    # pylint: disable=protected-access
+    with TeensyToAny() as teensy:
+        # Follow the bytes written whose response was not read yet
+        unanswered = deque()
+        peaks = []
+        write, read = teensy._write, teensy._read
+
+        def spy_write(data):
+            unanswered.extend(len(line) + 1 for line in data.split(b'\n')[:-1])
+            peaks.append(sum(unanswered))
+            write(data)
+
+        def spy_read(*args, **kwargs):
+            unanswered.popleft()
+            return read(*args, **kwargs)
+
+        teensy._write, teensy._read = spy_write, spy_read
+        command = 'nop' + ' ' * 1000
+        with teensy.pipeline() as p:
+            responses = [p.ask(command) for _ in range(10)]
+        assert all(response.result() is None for response in responses)
+    assert len(fake_teensy.commands) == len(OPEN_COMMANDS) + 10
+    assert len(peaks) > 1
+    assert max(peaks) <= TeensyToAny.INPUT_BUFFER_SIZE
+
+
+@pytest.mark.usefixtures('fake_teensy')
+def test_pipeline_result_before_flush():
+    with TeensyToAny() as teensy:
+        p = teensy.pipeline()
+        response = p.nop()
+        with pytest.raises(RuntimeError, match="must be flushed"):
+            response.result()
+        p.flush()
+        assert response.done()
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany.pool import ConnectionPool, PooledConnection
+
+
+def test_pooled_connections(ser2net):
+    board, server = ser2net
+    pool = ConnectionPool()
+    for value in (1, 0, 1):
+        with TeensyToAny(port=server.url, pool=pool) as teensy:
+            assert teensy.capabilities['mcu'] == 'TEENSY32'
+            teensy.gpio_digital_write(13, value)
+            assert teensy.gpio_digital_read(13) == value
+    assert server.connections == 1
+    assert board.commands.count('version') == 1
+    assert pool.statistics() == {'hits': 2, 'misses': 1, 'idle': 1}
+
+    # A connection whose response is still due is not reused
+    board.latency = 0.2
+    with TeensyToAny(port=server.url, pool=pool, timeout=0.05) as teensy:
+        with pytest.raises(RuntimeError, match='Failed to read a response'):
+            teensy.nop()
+        board.latency = 0
+        # Let the late response arrive, the next connection must not read it
+        time.sleep(0.3)
+    assert pool.statistics()['idle'] == 0
+    with TeensyToAny(port=server.url, pool=pool) as teensy:
+        teensy.nop()
+    assert pool.statistics() == {'hits': 3, 'misses': 2, 'idle': 1}
+
+    pool.clear()
+    assert pool.statistics()['idle'] == 0
+
+
+def test_expired_connections(ser2net):
+    board, server = ser2net
+    pool = ConnectionPool(idle_timeout=0)
+    for _ in range(2):
+        with TeensyToAny(port=server.url, pool=pool) as teensy:
+            teensy.nop()
+    assert board.commands.count('version') == 2
+    assert pool.statistics() == {'hits': 0, 'misses': 2, 'idle': 1}
+
+
+class _Transport:
+    is_open = True
+
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.resets = 0
+
+    def reset_input_buffer(self):
+        if self.broken:
+            raise OSError("Connection reset by peer")
+        self.resets += 1
+
+    def close(self):
+        self.is_open = False
+
+
+def test_acquire_resets_input_buffer():
+    pool = ConnectionPool()
+    transport = _Transport()
+    pool.release('socket://rack3:4001', PooledConnection(transport, '0.18.0', {}))
+    assert pool.acquire('socket://rack3:4001').transport is transport
+    assert transport.resets == 1
+
+    # A connection that cannot be reset is closed rather than reused
+    transport = _Transport(broken=True)
+    pool.release('socket://rack3:4001', PooledConnection(transport, '0.18.0', {}))
+    assert pool.acquire('socket://rack3:4001') is None
+    assert not transport.is_open
+    assert pool.statistics() == {'hits': 1, 'misses': 1, 'idle': 0}
+
+
+def test_pooled_connection_probes_encodings(ser2net):
+    board, server = ser2net
+    pool = ConnectionPool()
+    with TeensyToAny(port=server.url, pool=pool) as teensy:
+        assert teensy.capabilities['payload_encodings'] is None
+    # The encodings were not asked when the connection was opened
+    with TeensyToAny(port=server.url, pool=pool, payload_encoding='auto') as teensy:
+        assert teensy.capabilities['payload_encodings'] == ()
+        assert teensy.payload_encoding is None
+    with TeensyToAny(port=server.url, pool=pool, payload_encoding='auto') as teensy:
+        teensy.nop()
+    assert board.commands.count('payload_encodings') == 1
+    assert pool.statistics()['hits'] == 2
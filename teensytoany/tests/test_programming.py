@@ -0,0 +1,170 @@
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+
+from teensytoany import TeensyToAny, programmer
+from teensytoany.cli import teensytoany_cli
+from teensytoany.programming import (ProgrammingResult,
+                                     program_firmware_parallel)
+
+
+@pytest.fixture(autouse=True)
+def firmware(monkeypatch):
+    monkeypatch.setattr(
+        TeensyToAny, '_prepare_firmware',
+        staticmethod(lambda **kwargs: Path('firmware.hex')),
+    )
+
+
+class StandIns:
+    """Loader and enumeration stand-ins for boards that reboot after a delay."""
+
+    def __init__(self, *, duration=0.05, failing=(), never_return=()):
+        self.duration = duration
+        self.failing = failing
+        self.never_return = never_return
+        self.active = 0
+        self.max_active = 0
+        self.commands = []
+        self.rebooted = set()
+        self.version_queries = []
+        self._lock = threading.Lock()
+
+    def run(self, command):
+        serial_number = command[-2].split('=')[1]
+        with self._lock:
+            self.commands.append(command)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.duration)
+        with self._lock:
+            self.active -= 1
+        if serial_number in self.failing:
+            raise subprocess.CalledProcessError(1, command)
+        threading.Timer(self.duration, self.rebooted.add, [serial_number]).start()
+
+    def find_devices(self, serial_numbers):
+        return [
+            (f'/dev/tty{serial_number}', serial_number)
+            for serial_number in serial_numbers
+            if serial_number in self.rebooted and serial_number not in self.never_return
+        ]
+
+    def query_version(self, port, serial_number):
+        self.version_queries.append((port, serial_number))
+        return '0.18.0'
+
+    def kwargs(self):
+        return {
+            'run': self.run,
+            'find_devices': self.find_devices,
+            'query_version': self.query_version,
+            'poll_interval': 0.01,
+        }
+
+
+def test_program_firmware_parallel():
+    stand_ins = StandIns()
+    serial_numbers = [f'{i}' for i in range(6)]
+    start = time.perf_counter()
+    results = program_firmware_parallel(
+        serial_numbers, mcu='TEENSY40', max_concurrency=3, **stand_ins.kwargs())
+    elapsed = time.perf_counter() - start
+
+    assert [result.serial_number for result in results] == serial_numbers
+    assert all(result.ok for result in results)
+    assert {result.version for result in results} == {'0.18.0'}
+    assert all(result.duration >= 2 * stand_ins.duration for result in results)
+    assert stand_ins.max_active == 3
+    # Two rounds of 3 boards, each programming then rebooting
+    assert elapsed < 6 * 2 * stand_ins.duration
+    assert stand_ins.commands[0][0] == 'teensy_loader_cli'
+    assert '--mcu=TEENSY40' in stand_ins.commands[0]
+    assert sorted(stand_ins.version_queries) == [
+        (f'/dev/tty{i}', f'{i}') for i in range(6)]
+
+
+def test_program_firmware_parallel_failures():
+    stand_ins = StandIns(failing=['1'], never_return=['2'])
+    results = program_firmware_parallel(
+        ['0', '1', '2'], mcu='TEENSY40', reboot_timeout=0.2, **stand_ins.kwargs())
+    assert [result.ok for result in results] == [True, False, False]
+    assert isinstance(results[1].error, subprocess.CalledProcessError)
+    assert 'did not answer within 0.2 s' in str(results[2].error)
+    assert results[2].duration >= 0.2
+
+
+def test_program_firmware_parallel_arguments():
+    with pytest.raises(ValueError, match="only be programmed once"):
+        program_firmware_parallel(['0', '0'], mcu='TEENSY40')
+    with pytest.raises(ValueError, match="max_concurrency"):
+        program_firmware_parallel(['0'], mcu='TEENSY40', max_concurrency=0)
+    assert not program_firmware_parallel([], mcu='TEENSY40')
+
+
+def test_wait_for_device_retries():
+    attempts = []
+
+    def query_version(port, _):
+        attempts.append(port)
+        if len(attempts) < 3:
+            raise RuntimeError("Not ready yet")
+        return '0.18.0'
+
+    version = TeensyToAny.wait_for_device(
+        '12345',
+        poll_interval=0.01,
+        find_devices=lambda serial_numbers: [('/dev/ttyACM0', '12345')],
+        query_version=query_version,
+    )
+    assert version == '0.18.0'
+    assert len(attempts) == 3
+
+
+def test_wait_for_device_timeout():
+    def query_version(port, serial_number):
+        raise RuntimeError(f"{serial_number} on {port} is not ready yet")
+
+    with pytest.raises(RuntimeError, match="did not answer.*is not ready yet"):
+        TeensyToAny.wait_for_device(
+            '12345',
+            timeout=0.05,
+            poll_interval=0.01,
+            find_devices=lambda serial_numbers: [('/dev/ttyACM0', '12345')],
+            query_version=query_version,
+        )
+
+
+def test_programmer_cli(monkeypatch):
+    calls = []
+
+    def program(serial_numbers, **kwargs):
+        calls.append((serial_numbers, kwargs['max_concurrency']))
+        return [
+            ProgrammingResult('A', '0.18.0', 1.0, None),
+            ProgrammingResult('B', None, 2.0, RuntimeError('unplugged')),
+        ]
+
+    monkeypatch.setattr(programmer, 'program_firmware_parallel', program)
+    runner = CliRunner()
+    result = runner.invoke(teensytoany_cli, [
+        'programmer', '--serial-number', 'A', '--serial-number', 'B', '-j', '2',
+        '--firmware-version', '0.18.0',
+    ])
+    assert result.exit_code == 1
+    assert 'A: programmed version 0.18.0 in 1.0 s' in result.output
+    assert 'B: FAILED after 2.0 s: unplugged' in result.output
+
+    result = runner.invoke(teensytoany_cli, [
+        'programmer', '--all', '--firmware-version', '0.18.0'])
+    assert calls == [(('A', 'B'), 2), (None, 4)]
+
+    for serial_numbers in [['--serial-number', 'A'], ['--serial-number', 'A'] * 2]:
+        result = runner.invoke(teensytoany_cli, ['programmer', '--all', *serial_numbers])
+        assert result.exit_code == 2
+        assert '--all cannot be combined with --serial-number' in result.output
+    assert len(calls) == 2
@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+
+import pytest
+
+from teensytoany import TeensyToAny, releases
+from teensytoany.releases import ReleaseCache
+from teensytoany.tests.fake_http import FakeReleaseAPI
+
+
+@pytest.fixture(autouse=True)
+def online(monkeypatch):
+    monkeypatch.delenv('TEENSYTOANY_OFFLINE', raising=False)
+
+
+def test_ttl_and_conditional_requests(release_api, tmp_path):
+    cache = ReleaseCache(tmp_path / 'release.json', url=release_api.url, ttl=60)
+    assert cache.latest() == '0.18.0'
+    assert cache.latest() == '0.18.0'
+    # Another process reads the same file
+    assert ReleaseCache(tmp_path / 'release.json', url=release_api.url).latest() == '0.18.0'
+    assert [r['If-None-Match'] for r in release_api.requests] == [None]
+
+    # Revalidated with the ETag, unchanged
+    assert cache.latest(max_age=0) == '0.18.0'
+    assert [r['If-None-Match'] for r in release_api.requests] == [None, '"0.18.0"']
+
+    release_api.tag = '0.19.0'
+    assert cache.latest(max_age=0) == '0.19.0'
+    assert cache.latest() == '0.19.0'
+    assert [r['If-None-Match'] for r in release_api.requests] == [
+        None, '"0.18.0"', '"0.18.0"']
+    record = json.loads((tmp_path / 'release.json').read_text())
+    assert record['tag'] == '0.19.0'
+    assert record['etag'] == '"0.19.0"'
+
+
+@pytest.mark.parametrize('record', [
+    {'tag': '0.17.0', 'etag': '"0.17.0"'},
+    {'tag': '0.17.0', 'etag': '"0.17.0"', 'fetched': 'yesterday'},
+    {'tag': '0.17.0', 'etag': '"0.17.0"', 'fetched': None},
+    {'tag': '0.17.0', 'etag': 17, 'fetched': 0},
+])
+def test_invalid_cache_record(release_api, tmp_path, record):
+    path = tmp_path / 'release.json'
+    path.write_text(json.dumps({'url': release_api.url, **record}))
+    # Read as a cache miss, not a cached release to revalidate
+    assert ReleaseCache(path, url=release_api.url).latest() == '0.18.0'
+    assert [r['If-None-Match'] for r in release_api.requests] == [None]
+
+
+def test_single_request_in_flight(tmp_path):
+    with FakeReleaseAPI(delay=0.2) as release_api:
+        cache = ReleaseCache(tmp_path / 'release.json', url=release_api.url)
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(cache.latest()))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ['0.18.0'] * 10
+        assert len(release_api.requests) == 1
+
+
+def test_offline(release_api, tmp_path, monkeypatch):
+    cache = ReleaseCache(tmp_path / 'release.json', url=release_api.url, ttl=0)
+    with pytest.raises(RuntimeError, match="offline mode"):
+        cache.latest(offline=True)
+    assert cache.latest() == '0.18.0'
+
+    monkeypatch.setenv('TEENSYTOANY_OFFLINE', '1')
+    start = time.perf_counter()
+    assert cache.latest() == '0.18.0'
+    assert time.perf_counter() - start < 0.1
+    assert len(release_api.requests) == 1
+
+
+def test_failures(release_api, tmp_path):
+    cache = ReleaseCache(tmp_path / 'release.json', url=release_api.url, retry_interval=60)
+    release_api.status = 403
+    with pytest.raises(RuntimeError, match="Status code: 403"):
+        cache.latest()
+    # Not retried immediately
+    with pytest.raises(RuntimeError, match="Status code: 403"):
+        cache.latest()
+    assert len(release_api.requests) == 1
+
+    cache.retry_interval = 0
+    release_api.status = None
+    assert cache.latest() == '0.18.0'
+
+    # The last known release is used while GitHub cannot be reached
+    release_api.close()
+    assert cache.latest(max_age=0, timeout=0.5) == '0.18.0'
+
+
+def test_get_latest_available_firmware_version(release_api, tmp_path, monkeypatch):
+    cache = ReleaseCache(tmp_path / 'release.json', url=release_api.url)
+    monkeypatch.setattr(releases, 'default_release_cache', lambda: cache)
+    for _ in range(3):
+        assert TeensyToAny.get_latest_available_firmware_version(local=False) == '0.18.0'
+    assert len(release_api.requests) == 1
@@ -0,0 +1,123 @@
+import time
+from functools import partial
+
+import pytest
+from click.testing import CliRunner
+
+from teensytoany import TeensyToAny
+from teensytoany.cli import teensytoany_cli
+from teensytoany.replay import (ReplayMismatch, ReplayTransport,
+                                analyze_session, read_session)
+from teensytoany.simulator import TeensyToAnySimulator
+from teensytoany.tests.fake_device import FakeTeensy, use_fake_device
+
+LATENCY = 0.005
+
+
+def _run(teensy):
+    teensy.i2c_init()
+    teensy.i2c_write_uint8(0x20, 0x10, 0xAB)
+    for _ in range(10):
+        teensy.nop()
+    value = teensy.i2c_read_uint8(0x20, 0x10)
+    with pytest.raises(RuntimeError, match='Error Code 6'):
+        teensy.i2c_ping(0x50)
+    return value
+
+
+def _record(path):
+    with TeensyToAnySimulator(mcu='TEENSY32', i2c_devices=[0x20], latency=LATENCY) as board:
+        with TeensyToAny(board.serial_number, port=board.port, record=path) as teensy:
+            assert _run(teensy) == 0xAB
+
+
+def test_record_and_replay(tmp_path):
+    log = tmp_path / 'session.jsonl'
+    _record(log)
+    events = list(read_session(log))
+    assert events[0]['kind'] == 'open'
+    assert events[1] == {'kind': 'write', 't': events[1]['t'], 'data': b'version\n'}
+    assert events[2]['kind'] == 'read' and events[2]['dt'] >= LATENCY
+
+    start = time.perf_counter()
+    with TeensyToAny('SIMULATED', port=log, transport=ReplayTransport) as teensy:
+        assert teensy.capabilities['mcu'] == 'TEENSY32'
+        assert _run(teensy) == 0xAB
+    original = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with TeensyToAny('SIMULATED', port=log,
+                     transport=partial(ReplayTransport, time_scale=0)) as teensy:
+        assert _run(teensy) == 0xAB
+        with pytest.raises(ReplayMismatch, match='session ended'):
+            teensy.nop()
+    assert time.perf_counter() - start < original
+
+    with TeensyToAny('SIMULATED', port=log,
+                     transport=partial(ReplayTransport, time_scale=0)) as teensy:
+        with pytest.raises(ReplayMismatch, match='i2c_init'):
+            teensy.i2c_1_init()
+
+
+def test_analyze_session(tmp_path):
+    log = tmp_path / 'session.jsonl'
+    _record(log)
+    _record(log)
+
+    report = analyze_session(log)
+    # Each connection asks the version and probes the capabilities
+    assert report['verbs']['nop']['count'] == 20
+    assert report['commands'] == sum(verb['count'] for verb in report['verbs'].values())
+    assert report['link_latency'] >= LATENCY
+    assert report['waiting'] <= report['duration']
+    assert report['batches'] < report['commands']
+    assert report['pipelined'] < report['duration']
+    assert report['speedup'] > 1
+
+    result = CliRunner().invoke(teensytoany_cli, ['session-report', str(log)])
+    assert result.exit_code == 0, result.output
+    assert 'pipelined' in result.output
+    assert 'nop' in result.output
+
+
+@pytest.mark.parametrize('late', [True, False])
+def test_analyze_session_with_timeout(tmp_path, monkeypatch, late):
+    def handler(command):
+        if command.startswith('gpio_digital_read'):
+            if not late:
+                return None
+            time.sleep(0.2)
+        return device.default_handler(command)
+
+    log = tmp_path / 'session.jsonl'
+    with FakeTeensy(handler) as device:
+        use_fake_device(monkeypatch, device)
+        with TeensyToAny(timeout=0.1, record=log) as teensy:
+            teensy.nop()
+            with pytest.raises(RuntimeError, match='Failed to read'):
+                teensy.gpio_digital_read(13)
+            for _ in range(5):
+                teensy.gpio_digital_write(13, 0)
+
+    report = analyze_session(log)
+    verbs = report['verbs']
+    # The timed out command and the response that arrived late are dropped,
+    # the resynchronization is counted as a version command
+    assert 'gpio_digital_read' not in verbs
+    assert verbs['version']['count'] == 2
+    assert verbs['nop']['count'] == 1
+    assert verbs['gpio_digital_write']['count'] == 5
+    assert verbs['gpio_digital_write']['total_time'] < 5 * 0.1
+
+
+def test_events_are_flushed(tmp_path):
+    log = tmp_path / 'session.jsonl'
+    with TeensyToAnySimulator() as board:
+        with TeensyToAny(board.serial_number, port=board.port, record=log) as teensy:
+            teensy.nop()
+            # Readable before the recorder is closed, as after a crash
+            events = list(read_session(log))
+    assert events[-2:] == [
+        {'kind': 'write', 't': events[-2]['t'], 'data': b'nop\n'},
+        {'kind': 'read', 't': events[-1]['t'], 'dt': events[-1]['dt'], 'data': b'0\n'},
+    ]
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from teensytoany import AsyncTeensyToAny, TeensyToAny
+from teensytoany.simulator import TeensyToAnySimulator
+from teensytoany.tests.fake_device import FakeTeensy, use_fake_device
+
+
+def test_late_response_is_discarded(simulator):
+    board, teensy = simulator
+    teensy.gpio_pin_mode(13, 'OUTPUT')
+    teensy.gpio_digital_write(13, 1)
+    teensy.resync_statistics(reset=True)
+
+    board.latencies['gpio_digital_read'] = teensy.timeout + 0.1
+    with pytest.raises(RuntimeError, match='Failed to read a response'):
+        teensy.gpio_digital_read(13)
+    del board.latencies['gpio_digital_read']
+    assert teensy.resync_statistics()['resyncs'] == 0
+
+    # The late '0 1' is read and dropped, the port does not need reopening
+    teensy.gpio_digital_write(13, 0)
+    assert teensy.resync_statistics() == {'resyncs': 1, 'failures': 0, 'discarded_lines': 1}
+    assert teensy.gpio_digital_read(13) == 0
+    assert teensy.resynchronize()
+    assert teensy.gpio_digital_read(13) == 0
+
+
+def test_device_still_busy(simulator):
+    board, teensy = simulator
+    teensy.resync_statistics(reset=True)
+
+    # Longer than the timeout of the command and of the resynchronization
+    teensy.timeout = 0.05
+    board.latencies['gpio_digital_read'] = 0.4
+    with pytest.raises(RuntimeError, match='Failed to read a response'):
+        teensy.gpio_digital_read(13)
+    del board.latencies['gpio_digital_read']
+    with pytest.raises(RuntimeError, match='Failed to resynchronize'):
+        teensy.gpio_digital_write(13, 1)
+    assert teensy.resync_statistics()['failures'] == 1
+
+    teensy.timeout = 0.5
+    teensy.gpio_digital_write(13, 1)
+    assert teensy.gpio_digital_read(13) == 1
+    assert teensy.resync_statistics() == {'resyncs': 2, 'failures': 1, 'discarded_lines': 1}
+
+
+def test_pipeline_timeout(simulator):
+    board, teensy = simulator
+    teensy.gpio_pin_mode(13, 'OUTPUT')
+    board.latencies['gpio_digital_read'] = teensy.timeout + 0.1
+    with pytest.raises(RuntimeError, match='Failed to read a response'):
+        with teensy.pipeline() as pipeline:
+            pipeline.gpio_digital_write(13, 1)
+            pipeline.gpio_digital_read(13)
+            for _ in range(5):
+                pipeline.nop()
+    del board.latencies['gpio_digital_read']
+
+    assert teensy.gpio_digital_read(13) == 1
+    teensy.gpio_digital_write(13, 0)
+    assert teensy.gpio_digital_read(13) == 0
+
+
+def test_async_late_response_is_discarded(monkeypatch):
+    with TeensyToAnySimulator(mcu='TEENSY32') as board:
+        use_fake_device(monkeypatch, board, board.serial_number)
+
+        async def main():
+            async with AsyncTeensyToAny(timeout=0.1) as teensy:
+                await teensy.gpio_pin_mode(13, 'OUTPUT')
+                await teensy.gpio_digital_write(13, 1)
+
+                board.latencies['gpio_digital_read'] = teensy.timeout + 0.1
+                # The command sent with it cannot be matched to its response
+                results = await asyncio.gather(
+                    teensy.gpio_digital_read(13), teensy.nop(), return_exceptions=True)
+                del board.latencies['gpio_digital_read']
+                for result in results:
+                    assert 'Failed to read a response' in str(result)
+
+                # The late '0 1' and '0' are read and dropped
+                await teensy.gpio_digital_write(13, 0)
+                assert teensy.resync_statistics() == {
+                    'resyncs': 1, 'failures': 0, 'discarded_lines': 2}
+                assert await teensy.gpio_digital_read(13) == 0
+                assert await teensy.resynchronize()
+                assert await teensy.gpio_digital_read(13) == 0
+
+        asyncio.run(main())
+
+
+def test_async_dropped_response(monkeypatch):
+    def handler(command):
+        # The response of sleep is lost
+        return {'version': '0 0.18.0', 'sleep 0': None}.get(command, '0')
+
+    with FakeTeensy(handler) as device:
+        use_fake_device(monkeypatch, device)
+
+        async def main():
+            async with AsyncTeensyToAny(timeout=0.05) as teensy:
+                with pytest.raises(RuntimeError, match='Failed to read a response'):
+                    await teensy.sleep_seconds(0)
+                # Its bytes are no longer counted as in flight
+                await asyncio.wait_for(asyncio.gather(*[
+                    teensy.nop() for _ in range(2 * teensy.INPUT_BUFFER_SIZE // 4)
+                ]), 5)
+                assert teensy.resync_statistics() == {
+                    'resyncs': 1, 'failures': 0, 'discarded_lines': 0}
+
+        asyncio.run(main())
+
+
+def test_async_device_still_busy(monkeypatch):
+    with TeensyToAnySimulator(mcu='TEENSY32') as board:
+        use_fake_device(monkeypatch, board, board.serial_number)
+
+        async def main():
+            async with AsyncTeensyToAny(timeout=0.05) as teensy:
+                board.latencies['gpio_digital_read'] = 0.4
+                with pytest.raises(RuntimeError, match='Failed to read a response'):
+                    await teensy.gpio_digital_read(13)
+                del board.latencies['gpio_digital_read']
+                with pytest.raises(RuntimeError, match='Failed to resynchronize'):
+                    await teensy.gpio_digital_write(13, 1)
+                assert teensy.resync_statistics()['failures'] == 1
+
+                teensy.timeout = 0.5
+                await teensy.gpio_digital_write(13, 1)
+                assert await teensy.gpio_digital_read(13) == 1
+                assert teensy.resync_statistics() == {
+                    'resyncs': 2, 'failures': 1, 'discarded_lines': 1}
+
+        asyncio.run(main())
+
+
+def test_pipeline_truncated_response(monkeypatch):
+    def handler(command):
+        if command == 'gpio_digital_read 13':
+            # Half of the response, then the rest after the timeout
+            os.write(device._master, b'0 ')  # pylint: disable=protected-access
+            time.sleep(0.15)
+            return '1'
+        return {'version': '0 0.18.0'}.get(command, '0')
+
+    with FakeTeensy(handler) as device:
+        use_fake_device(monkeypatch, device)
+        with TeensyToAny(timeout=0.1) as teensy:
+            with pytest.raises(RuntimeError, match='Failed to read a response'):
+                with teensy.pipeline() as pipeline:
+                    pipeline.gpio_digital_read(13)
+                    pipeline.nop()
+            # Let the rest of the line arrive
+            time.sleep(0.2)
+            teensy.nop()
+            assert teensy.resync_statistics() == {
+                'resyncs': 1, 'failures': 0, 'discarded_lines': 2}
@@ -0,0 +1,199 @@
+import time
+
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany.encoder import encode, encode_payload
+from teensytoany.simulator import INPUT_BUFFER_SIZE, TeensyToAnySimulator
+
+
+def test_open_by_port(simulator):
+    board, teensy = simulator
+    assert teensy.serial_number == 'SIMULATED'
+    assert teensy.capabilities['mcu'] == 'TEENSY32'
+    assert teensy.capabilities['i2c_buffer_size'] == 32
+    assert teensy.serialnumber() == 'SIMULATED'
+    assert board.commands[0] == 'version'
+
+
+def test_i2c(simulator):
+    board, teensy = simulator
+    teensy.i2c_write_uint8(0x20, 0x10, 0xAB)
+    teensy.i2c_write_uint16(0x20, 0x11, 0x1234)
+    assert teensy.i2c_read_uint8(0x20, 0x10) == 0xAB
+    assert teensy.i2c_read_uint16(0x20, 0x11) == 0x1234
+    assert teensy.i2c_read_payload(0x20, 0x10, 3) == [0xAB, 0x12, 0x34]
+    assert board.i2c_memory(0x20)[0x10] == 0xAB
+
+    teensy.i2c_write_bulk(0x21, bytes([0x00]) + bytes(range(1, 100)))
+    assert teensy.i2c_read_payload(0x21, 0x00, 99, output='bytes') == bytes(range(1, 100))
+
+    # The second bus is independent
+    teensy.i2c_1_write_uint8(0x20, 0x10, 0x01)
+    assert teensy.i2c_read_uint8(0x20, 0x10) == 0xAB
+
+    with pytest.raises(RuntimeError, match='Error Code 6'):
+        teensy.i2c_ping(0x50)
+    teensy.i2c_ping(0x20)
+
+    # Larger writes are split by TeensyToAny, the board rejects them
+    teensy.i2c_begin_transaction(0x20)
+    with pytest.raises(RuntimeError, match='Error Code 90'):
+        teensy.send_raw(encode('i2c_write', encode_payload(bytes(33), base=10)))
+    teensy.i2c_end_transaction()
+
+
+def test_spi_gpio_registers_eeprom(simulator):
+    board, teensy = simulator
+    teensy.spi_begin()
+    assert teensy.spi_transfer_bulk([1, 2, 255]) == [1, 2, 255]
+    assert teensy.spi_transfer(0x5A) == 0x5A
+    assert teensy.spi_transfer16(0x1234) == 0x1234
+
+    teensy.gpio_pin_mode(13, 'OUTPUT')
+    teensy.gpio_digital_write(13, 1)
+    assert teensy.gpio_digital_read(13)
+    teensy.gpio_digital_pulse(13, 'LOW', duration=0.01)
+    assert board.pins[13] == ['OUTPUT', 1]
+
+    teensy.register_write_uint32(0x400D8000, 0x123456789)
+    assert teensy.register_read_uint32(0x400D8000) == 0x23456789
+    assert teensy.register_read_uint8(0x400D8000) == 0x89
+
+    assert teensy.eeprom_read_uint8(10) == 0xFF
+    teensy.eeprom_write_uint8(10, 42)
+    assert teensy.eeprom_read_uint8(10) == 42
+    with pytest.raises(RuntimeError, match='Error Code 22'):
+        teensy.eeprom_read_uint8(len(board.eeprom))
+
+
+def test_large_payloads(simulator):
+    board, teensy = simulator
+    payload = bytes(range(256)) * 4
+    with pytest.raises(ValueError, match='auto_increment'):
+        teensy.i2c_write_payload(0x20, 0x00, payload)
+    assert not any(c.startswith('i2c_write_payload') for c in board.commands)
+    teensy.i2c_write_payload(0x20, 0x00, payload, auto_increment=True)
+    # 30 bytes and a register address of up to 2 bytes fit in the 32 byte buffer
+    assert sum(c.startswith('i2c_write_payload') for c in board.commands) == 35
+    assert teensy.i2c_read_payload(0x20, 0x00, len(payload), output='bytes') == payload
+    teensy.i2c_1_write_payload(0x20, 0x10, [1, 2, 3])
+    assert board.i2c_memory(0x20, bus='i2c_1')[0x12] == 3
+
+    teensy.i2c_begin_transaction(0x21)
+    teensy.i2c_write(bytes([0x00]) + payload[:99])
+    teensy.i2c_end_transaction()
+    assert sum(c.startswith('i2c_write ') for c in board.commands) == 4
+    assert teensy.i2c_read_payload(0x21, 0x00, 99, output='bytes') == payload[:99]
+
+    teensy.spi_begin()
+    data = bytes(range(256)) * 40
+    assert teensy.spi_transfer_bulk(data, output='bytes') == data
+    commands = [c for c in board.commands if c.startswith('spi_transfer_bulk')]
+    assert max(len(c) for c in commands) < INPUT_BUFFER_SIZE
+    assert len(commands) == 21
+
+
+def test_compact_payloads():
+    with TeensyToAnySimulator(
+        i2c_devices=[0x20], payload_encodings=('hex', 'base64'),
+    ) as board:
+        # The encodings are only negotiated on request
+        with TeensyToAny(port=board.port) as teensy:
+            assert teensy.capabilities['payload_encodings'] is None
+            assert teensy.payload_encoding is None
+        assert 'payload_encodings' not in board.commands
+
+        with TeensyToAny(port=board.port, payload_encoding='auto') as teensy:
+            assert teensy.capabilities['payload_encodings'] == ('hex', 'base64')
+            assert teensy.payload_encoding == 'base64'
+            data = bytes(range(256)) * 40
+            assert teensy.spi_transfer_bulk(data, output='bytes') == data
+            commands = [c for c in board.commands if c.startswith('spi_transfer_bulk')]
+            assert all(c.startswith('spi_transfer_bulk_base64 ') for c in commands)
+            assert len(commands) == 7
+            # Lists of integers are encoded too, other values are sent as numbers
+            assert teensy.spi_transfer_bulk(list(data[:10])) == list(data[:10])
+            assert board.commands[-1] == 'spi_transfer_bulk_base64 AAECAwQFBgcICQ=='
+            assert teensy.spi_transfer_bulk(['0x10', 3]) == [0x10, 3]
+            assert board.commands[-1] == 'spi_transfer_bulk 0x10 3'
+
+            teensy.i2c_write_payload(0x20, 0x00, data[:100], auto_increment=True)
+            with teensy.pipeline() as p:
+                first = p.i2c_read_payload(0x20, 0x00, 100, output='bytes')
+            assert first.result() == data[:100]
+            assert board.commands[-1] == 'i2c_read_payload_base64 0x20 0x00 100'
+
+            teensy.fastled_add_leds('NEOPIXEL', 0, 2, 1000)
+            colors = [(i % 256, 0, 255) for i in range(1000)]
+            teensy.fastled_set_rgb_bulk(colors[1:], start=1)
+            assert board.leds[1:] == colors[1:]
+            assert board.commands[-1].startswith('fastled_set_rgb_bulk_base64 ')
+
+        with TeensyToAny(port=board.port, payload_encoding='hex') as teensy:
+            assert teensy.i2c_read_payload(0x20, 0x10, 4) == [16, 17, 18, 19]
+            assert board.commands[-1] == 'i2c_read_payload_hex 0x20 0x10 4'
+
+        with TeensyToAny(port=board.port, payload_encoding='text') as teensy:
+            assert teensy.payload_encoding is None
+            assert teensy.spi_transfer_bulk(data[:10], output='bytes') == data[:10]
+            assert board.commands[-1].startswith('spi_transfer_bulk 0 1 2')
+
+
+def test_text_payloads(simulator):
+    board, teensy = simulator
+    assert teensy.capabilities['payload_encodings'] is None
+    assert teensy.payload_encoding is None
+    teensy.fastled_add_leds('NEOPIXEL', 0, 2, 4)
+    teensy.fastled_set_rgb_bulk([(1, 2, 3), (4, 5, 6)], start=2)
+    assert board.leds == [(0, 0, 0), (0, 0, 0), (1, 2, 3), (4, 5, 6)]
+    assert board.commands[-2:] == ['fastled_set_rgb 2 1 2 3', 'fastled_set_rgb 3 4 5 6']
+    with pytest.raises(RuntimeError, match="does not support the 'hex'"):
+        TeensyToAny(port=board.port, payload_encoding='hex')
+    with TeensyToAny(port=board.port, payload_encoding='auto') as teensy:
+        assert teensy.capabilities['payload_encodings'] == ()
+        assert teensy.payload_encoding is None
+    with pytest.raises(ValueError, match='Unknown payload encoding'):
+        TeensyToAny(port=board.port, payload_encoding='zip', open=False)
+
+
+def test_fastled(simulator):
+    board, teensy = simulator
+    teensy.fastled_add_leds('WS2812', 0, 2, 4)
+    teensy.fastled_set_rgb(1, 10, 20, 30)
+    teensy.fastled_show(100)
+    assert teensy.fastled_get_brightness() == 100
+    assert board.leds == [(0, 0, 0), (10, 20, 30), (0, 0, 0), (0, 0, 0)]
+    with pytest.raises(RuntimeError, match='Error Code 22'):
+        teensy.fastled_set_rgb(4, 0, 0, 0)
+
+
+def test_errors(simulator):
+    _, teensy = simulator
+    # pylint: disable=protected-access
+    with pytest.raises(RuntimeError, match='Error Code 22: Unknown command'):
+        teensy._ask('not_a_command')
+    with pytest.raises(RuntimeError, match='Error Code 22'):
+        teensy._ask('i2c_read_uint8 0x20')
+
+    # The longest line accepted, including its newline, fills the input buffer
+    teensy._ask('nop' + ' ' * (INPUT_BUFFER_SIZE - len('nop\n')))
+    with pytest.raises(RuntimeError, match='Error Code 7'):
+        teensy._ask('nop' + ' ' * (3 * INPUT_BUFFER_SIZE))
+    # The next command is answered normally
+    teensy.nop()
+
+
+def test_latency():
+    with TeensyToAnySimulator(
+        latency=0.01, jitter=0.01, latencies={'version': 0}, seed=0,
+    ) as board:
+        with TeensyToAny(port=board.port) as teensy:
+            start = time.perf_counter()
+            for _ in range(5):
+                teensy.nop()
+            duration = time.perf_counter() - start
+            assert 0.05 <= duration < 0.2
+            start = time.perf_counter()
+            teensy.sleep_seconds(0.05)
+            assert time.perf_counter() - start >= 0.05
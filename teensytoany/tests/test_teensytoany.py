@@ -2,6 +2,7 @@ import pytest
 
 import teensytoany
 from teensytoany import TeensyToAny
+from teensytoany.tests.fake_device import OPEN_COMMANDS, FakeTeensy
 
 
 def test_project_import():
@@ -32,3 +33,43 @@ def test_nop_buffer_size_fail(i):
         with pytest.raises(Exception):
             # pylint: disable=protected-access
             t._ask("nop" + " " * (i + 1 - len("nop\n")))
+
+
+@pytest.mark.usefixtures('fake_teensy')
+def test_capabilities():
+    with TeensyToAny() as t:
+        capabilities = t.capabilities
+        assert capabilities['version'] == '0.18.0'
+        assert capabilities['mcu'] == 'TEENSY40'
+        assert t.mcu == 'TEENSY40'
+        assert capabilities['i2c_payload']
+        assert capabilities['spi_transfer_returns_data']
+        assert capabilities['i2c_buffer_size'] == 32
+        with pytest.raises(TypeError):
+            # pylint: disable=unsupported-assignment-operation
+            capabilities['mcu'] = 'TEENSY32'
+    assert t.capabilities is None
+
+
+def test_capabilities_old_firmware(monkeypatch):
+    def handler(command):
+        if command == 'version':
+            return '0 0.0.13'
+        if command in OPEN_COMMANDS:
+            return '22 Invalid argument'
+        return '0'
+
+    with FakeTeensy(handler) as device:
+        monkeypatch.setattr(
+            TeensyToAny, 'device_serial_number_pairs',
+            staticmethod(lambda *args, **kwargs: [(device.port, 'FAKE')]),
+        )
+        with TeensyToAny() as t:
+            assert not t.capabilities['i2c_payload']
+            assert t.capabilities['mcu'] is None
+            assert t.capabilities['i2c_buffer_size'] is None
+            assert t.spi_transfer(0x12) is None
+            t.i2c_write_payload(0x20, 0x00, [0x00, 0x10, 0xFF])
+        assert device.commands[-1] == 'i2c_write_uint8 0x20 0x0010 0xff'
+    # Firmware that may not answer unknown commands is not probed
+    assert not set(device.commands) & set(OPEN_COMMANDS[1:])
@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany._lock import _FairLock
+from teensytoany.tests.fake_device import FakeTeensy
+
+
+def _echo_register(command):
+    if command == 'version':
+        return '0 0.18.0'
+    if command.startswith('register_read_uint32'):
+        return '0 ' + command.split()[1]
+    return '0'
+
+
+def test_thread_safe_responses_not_interleaved(monkeypatch):
+    with FakeTeensy(_echo_register) as device:
+        monkeypatch.setattr(
+            TeensyToAny, 'device_serial_number_pairs',
+            staticmethod(lambda *args, **kwargs: [(device.port, 'FAKE')]),
+        )
+        with TeensyToAny(thread_safe=True) as teensy:
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(teensy.register_read_uint32, range(400)))
+            statistics = teensy.lock_statistics()
+
+    assert results == list(range(400))
+    # The version and capabilities are queried when the device is opened
+    assert statistics['acquisitions'] == 402
+    assert statistics['queue_depth'] == 0
+
+
+@pytest.mark.usefixtures('fake_teensy')
+def test_lock_statistics_requires_thread_safe():
+    with TeensyToAny() as teensy:
+        with pytest.raises(RuntimeError, match="thread_safe=True"):
+            teensy.lock_statistics()
+
+
+def test_fair_lock_priority_order():
+    lock = _FairLock()
+    order = []
+
+    def worker(name, priority):
+        with lock.priority(priority):
+            with lock:
+                order.append(name)
+
+    lock.acquire()
+    threads = []
+    for name, priority in [('low', 0), ('second_low', 0), ('high', 10)]:
+        thread = threading.Thread(target=worker, args=(name, priority))
+        thread.start()
+        threads.append(thread)
+        # Make sure the threads are queued in a known order
+        while lock.statistics()['queue_depth'] < len(threads):
+            time.sleep(0.001)
+    lock.release()
+    for thread in threads:
+        thread.join()
+
+    assert order == ['high', 'low', 'second_low']
+    statistics = lock.statistics()
+    assert statistics['contended_acquisitions'] == 3
+    assert statistics['max_queue_depth'] == 3
+    assert statistics['max_wait_time'] > 0
+
+
+def test_thread_safe_blocking_commands(monkeypatch):
+    def handler(command):
+        if command.startswith('sleep'):
+            time.sleep(float(command.split()[1]))
+        return {'version': '0 0.18.0'}.get(command, '0')
+
+    with FakeTeensy(handler) as device:
+        monkeypatch.setattr(
+            TeensyToAny, 'device_serial_number_pairs',
+            staticmethod(lambda *args, **kwargs: [(device.port, 'FAKE')]),
+        )
+        with TeensyToAny(thread_safe=True, timeout=0.1) as teensy:
+            # The second sleep is longer than the timeout, but shorter than
+            # the timeout increased for the first
+            with ThreadPoolExecutor(2) as executor:
+                first = executor.submit(teensy.sleep_seconds, 0.5)
+                while teensy.timeout == 0.1:
+                    time.sleep(0.001)
+                second = executor.submit(teensy.sleep_seconds, 0.3)
+                first.result()
+                second.result()
+            assert teensy.timeout == 0.1
+            assert teensy.resync_statistics()['resyncs'] == 0
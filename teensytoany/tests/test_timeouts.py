@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from teensytoany import TeensyToAny
+from teensytoany.simulator import TeensyToAnySimulator
+from teensytoany.timeouts import AdaptiveTimeoutPolicy, TimeoutPolicy
+
+
+def test_sleep_outlasts_the_timeout(simulator):
+    board, teensy = simulator
+    start = time.perf_counter()
+    teensy.sleep_seconds(0.3)
+    assert time.perf_counter() - start >= 0.3
+    teensy.gpio_digital_pulse(13, 1, duration=0.3)
+    assert board.commands[-1].startswith('gpio_digital_pulse')
+    teensy.nop()
+
+
+def test_known_durations():
+    policy = TimeoutPolicy(margin=0.1)
+    assert policy.timeout('sleep', ['0.5'], 0.205) == pytest.approx(0.6)
+    assert policy.timeout('sleep', ['0.01'], 0.205) == 0.205
+    assert policy.timeout('analog_pulse', ['3', '10', '0', '1'], 0.205) == pytest.approx(1.1)
+    assert policy.timeout('sleep', [], 0.205) == 0.205
+    assert policy.timeout('nop', [], 0.205) == 0.205
+
+
+def test_adaptive_timeouts():
+    policy = AdaptiveTimeoutPolicy(min_samples=20, minimum=0.02)
+    with TeensyToAnySimulator(latency=0.001) as board:
+        with TeensyToAny(board.serial_number, port=board.port,
+                         timeout_policy=policy) as teensy:
+            assert teensy.timeout_policy is policy
+            for _ in range(20):
+                teensy.nop()
+                teensy.i2c_init()
+            learned = policy.timeout('nop', [], teensy.timeout)
+            assert 0.02 <= learned < teensy.timeout
+            assert policy.timeout('i2c_init', ['100100', '200000', '1'], 0.205) == 0.205
+            assert policy.statistics()['nop'][3]['timeout'] == learned
+            assert 'i2c_init' not in policy.statistics()
+
+            # Long commands are not cut short by what was learned
+            teensy.sleep_seconds(0.3)
+
+            # A device that stops answering is noticed sooner than the timeout
+            board.latencies['nop'] = 0.3
+            start = time.perf_counter()
+            with pytest.raises(RuntimeError, match='Failed to read a response'):
+                teensy.nop()
+            assert time.perf_counter() - start < teensy.timeout
+            assert policy.statistics()['nop'][3] == {
+                'samples': 0, 'timeout': None, 'timeouts': 1}
+            assert policy.timeout('nop', [], teensy.timeout) == teensy.timeout
@@ -0,0 +1,162 @@
+import os
+import socket
+import sys
+import time
+
+import pytest
+from serial import Serial, SerialException
+
+from teensytoany import TeensyToAny
+from teensytoany.simulator import TeensyToAnySimulator
+from teensytoany.tests.fake_device import OPEN_COMMANDS, FakeTeensy
+from teensytoany.transport import (FdTransport, SocketTransport,
+                                   ThreadedReaderTransport)
+
+linux_only = pytest.mark.skipif(sys.platform != 'linux', reason='termios and flock')
+
+
+def test_threaded_transport(fake_teensy):
+    with TeensyToAny(transport='thread') as teensy:
+        assert teensy.version == '0.18.0'
+        assert teensy.i2c_read_uint8(0x20, 0x0F) == 0x2a
+        with pytest.raises(RuntimeError, match="Responded with Error Code 6"):
+            teensy.i2c_ping(0x20)
+        with teensy.pipeline() as p:
+            values = [p.i2c_read_uint8(0x20, register) for register in range(100)]
+        assert [value.result() for value in values] == [0x2a] * 100
+    assert len(fake_teensy.commands) == len(OPEN_COMMANDS) + 102
+
+
+def test_threaded_transport_timeout(monkeypatch):
+    def handler(command):
+        if command == 'version':
+            return '0 0.18.0'
+        return None
+
+    with FakeTeensy(handler) as device:
+        monkeypatch.setattr(
+            TeensyToAny, 'device_serial_number_pairs',
+            staticmethod(lambda *args, **kwargs: [(device.port, 'FAKE')]),
+        )
+        with TeensyToAny(transport='thread', timeout=0.05) as teensy:
+            with pytest.raises(RuntimeError, match="Failed to read a response"):
+                teensy.nop()
+
+
+def test_threaded_transport_reset():
+    with FakeTeensy() as device:
+        transport = ThreadedReaderTransport(Serial(device.port, timeout=1))
+        try:
+            # A partial line that the reader thread buffers
+            os.write(device._master, b'0 stale')  # pylint: disable=protected-access
+            time.sleep(0.2)
+            transport.reset_input_buffer()
+            transport.write(b'nop\n')
+            assert transport.read_until() == b'0\n'
+        finally:
+            transport.close()
+
+
+def test_unknown_transport():
+    with pytest.raises(ValueError, match="Unknown transport"):
+        TeensyToAny(transport='carrier_pigeon', open=False)
+
+
+@linux_only
+def test_fd_transport():
+    with TeensyToAnySimulator(i2c_devices=[0x20]) as board:
+        with TeensyToAny(board.serial_number, port=board.port, transport='fd') as teensy:
+            assert teensy.version == board.version
+            teensy.i2c_init()
+            teensy.i2c_write_bulk(0x20, bytes(range(100)))
+            assert teensy.i2c_read_payload(0x20, 0, 99, output='bytes') == bytes(range(1, 100))
+            with teensy.pipeline() as p:
+                values = [p.i2c_read_uint8(0x20, register) for register in range(100)]
+            assert [value.result() for value in values] == list(range(1, 100)) + [0]
+
+            # The port is locked until it is closed
+            with pytest.raises(SerialException, match='exclusively lock'):
+                TeensyToAny(board.serial_number, port=board.port, transport='fd')
+
+            board.latency = 0.1
+            with teensy.increased_timeout(0.05):
+                with pytest.raises(RuntimeError, match="Failed to read a response"):
+                    teensy.nop()
+            board.latency = 0
+            teensy.nop()
+
+        with TeensyToAny(board.serial_number, port=board.port, transport='fd') as teensy:
+            teensy.nop()
+
+
+@linux_only
+def test_fd_transport_partial_lines():
+    with TeensyToAnySimulator() as board:
+        transport = FdTransport(board.port, timeout=0.5)
+        try:
+            transport.write(b'version\nmcu\n')
+            assert transport.read_until(size=4) == b'0 0.'
+            assert transport.read_until().endswith(b'\n')
+            assert transport.read_until() == b'0 TEENSY40\n'
+            transport.timeout = 0.01
+            assert transport.read_until() == b''
+        finally:
+            transport.close()
+
+
+def test_socket_transport(ser2net):
+    # pylint: disable=protected-access
+    board, server = ser2net
+    # Local discovery is skipped for URLs
+    with TeensyToAny(server.url) as teensy:
+        assert isinstance(teensy._serial, SocketTransport)
+        assert teensy._serial._socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert teensy.serial_number == server.url
+        assert teensy.capabilities['mcu'] == 'TEENSY32'
+        teensy.i2c_init()
+        teensy.i2c_write_bulk(0x20, bytes(range(100)))
+        assert teensy.i2c_read_payload(0x20, 0, 99, output='bytes') == bytes(range(1, 100))
+        with teensy.pipeline() as p:
+            values = [p.i2c_read_uint8(0x20, register) for register in range(100)]
+        assert [value.result() for value in values] == list(range(1, 100)) + [0]
+
+        board.latency = 0.1
+        with teensy.increased_timeout(0.05):
+            with pytest.raises(RuntimeError, match="Failed to read a response"):
+                teensy.nop()
+        board.latency = 0
+        teensy.nop()
+
+    with TeensyToAny(board.serial_number, port=server.url, transport='thread') as teensy:
+        assert teensy.gpio_digital_read(13) == 0
+    assert server.connections == 2
+
+    with pytest.raises(ValueError, match="cannot open the URL"):
+        TeensyToAny(port=server.url, transport='fd')
+
+
+def test_socket_transport_closed(ser2net):
+    # pylint: disable=protected-access
+    _, server = ser2net
+    transport = SocketTransport(server.url, timeout=0.5, nodelay=False)
+    try:
+        assert not transport._socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        transport.write(b'version\nmcu\n')
+        assert transport.read_until(size=4) == b'0 0.'
+        assert transport.read_until().endswith(b'\n')
+        assert transport.read_until() == b'0 TEENSY32\n'
+        assert transport.is_open
+        transport.write(b'nop\n')
+        time.sleep(0.05)
+        transport.reset_input_buffer()
+        transport.timeout = 0.01
+        assert transport.read_until() == b''
+        server.close()
+        with pytest.raises(SerialException, match='closed'):
+            transport.read_until()
+        assert not transport.is_open
+    finally:
+        transport.close()
+
+    with pytest.raises(SerialException, match='Could not connect'):
+        SocketTransport(server.url)
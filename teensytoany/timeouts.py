@@ -0,0 +1,199 @@
+"""Choose the read timeout of each command sent to a device.
+
+By default ``TeensyToAny`` waits up to its ``timeout`` for every response.
+A timeout policy chooses the timeout of each command instead::
+
+    from teensytoany.timeouts import AdaptiveTimeoutPolicy
+
+    policy = AdaptiveTimeoutPolicy()
+    with TeensyToAny(timeout_policy=policy) as teensy:
+        run_acquisition(teensy)
+        print(policy.statistics())
+
+:class:`TimeoutPolicy` extends the timeout of the commands that keep the
+firmware busy for a duration given as argument, such as ``sleep`` and the
+pulses. :class:`AdaptiveTimeoutPolicy` also learns the round trips of the
+other commands and waits only a few times their usual latency, so that a
+device that stopped answering is noticed in milliseconds rather than after
+the full timeout.
+
+Custom policies derive from :class:`TimeoutPolicy` and override
+:meth:`~TimeoutPolicy.timeout` and :meth:`~TimeoutPolicy.observe`.
+"""
+import threading
+from collections import deque
+
+__all__ = [
+    'AdaptiveTimeoutPolicy',
+    'TimeoutPolicy',
+]
+
+
+class TimeoutPolicy:
+    """Extend the timeout of commands that block for a known duration.
+
+    Parameters
+    ----------
+    margin: float
+        Time, in seconds, allowed on top of the duration of a blocking
+        command for its response to arrive.
+    """
+
+    # The index of the argument of each blocking command that gives, in
+    # seconds, how long the firmware is busy
+    DURATION_ARGUMENTS = {
+        'sleep': 0,
+        'gpio_digital_pulse': 3,
+        'analog_pulse': 3,
+    }
+
+    def __init__(self, *, margin=0.1):
+        self.margin = margin
+
+    def duration(self, verb, arguments):
+        """The time, in seconds, the firmware is busy with a command, if known."""
+        index = self.DURATION_ARGUMENTS.get(verb)
+        if index is None:
+            return None
+        try:
+            return float(arguments[index])
+        except (IndexError, ValueError):
+            return None
+
+    def timeout(self, verb, arguments, default):
+        """Return the read timeout, in seconds, of a command.
+
+        Parameters
+        ----------
+        verb: str
+            The name of the command.
+
+        arguments: list of str
+            The arguments of the command.
+
+        default: float
+            The timeout of the device.
+        """
+        duration = self.duration(verb, arguments)
+        if duration is None:
+            return default
+        return max(default, duration + self.margin)
+
+    def observe(self, verb, arguments, duration, timed_out):
+        """Called with the round trip, in seconds, of every command.
+
+        ``timed_out`` is True if no complete response arrived in time.
+        """
+
+
+def _size_class(verb, arguments):
+    """Group commands whose length has the same number of bits."""
+    return (len(verb) + sum(len(argument) + 1 for argument in arguments)).bit_length()
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+
+class AdaptiveTimeoutPolicy(TimeoutPolicy):
+    """Learn the round trips of each command to time them out sooner.
+
+    The round trips are learned for each verb and size of command, since
+    the commands sending large payloads take longer. Once ``min_samples``
+    round trips of a command were observed, its timeout becomes
+    ``multiplier`` times the ``percentile`` of the last ``window`` round
+    trips plus ``margin``, at least ``minimum`` and at most the timeout of
+    the device. A command that times out forgets what was learned and waits
+    for the timeout of the device until it learns again.
+
+    Commands with a known duration are handled as by :class:`TimeoutPolicy`.
+    Verbs starting with one of the ``exclude`` prefixes always wait for the
+    timeout of the device: by default the i2c commands, which answer once
+    the bus times out if a peripheral does not respond.
+
+    The policy may be shared by several devices of the same kind.
+    """
+
+    def __init__(
+        self, *,
+        percentile=99,
+        multiplier=2,
+        margin=0.005,
+        minimum=0.010,
+        min_samples=50,
+        window=1000,
+        exclude=('i2c_',),
+    ):
+        super().__init__()
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.learned_margin = margin
+        self.minimum = minimum
+        self.min_samples = min_samples
+        self.window = window
+        self.exclude = tuple(exclude)
+        self._mutex = threading.Lock()
+        self._samples = {}
+        self._observed = {}
+        self._learned = {}
+        self._timeouts = {}
+
+    def _learns(self, verb):
+        return verb not in self.DURATION_ARGUMENTS and not verb.startswith(self.exclude)
+
+    def timeout(self, verb, arguments, default):
+        if not self._learns(verb):
+            return super().timeout(verb, arguments, default)
+        learned = self._learned.get((verb, _size_class(verb, arguments)))
+        if learned is None:
+            return default
+        return min(learned, default)
+
+    def observe(self, verb, arguments, duration, timed_out):
+        if not self._learns(verb):
+            return
+        key = (verb, _size_class(verb, arguments))
+        with self._mutex:
+            if timed_out:
+                self._timeouts[key] = self._timeouts.get(key, 0) + 1
+                self._samples.pop(key, None)
+                self._observed.pop(key, None)
+                self._learned.pop(key, None)
+                return
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(duration)
+            self._observed[key] = observed = self._observed.get(key, 0) + 1
+            # Sorting the window on every command would cost more than the
+            # round trip of fast commands, refresh the timeout periodically
+            if len(samples) >= self.min_samples and (
+                    observed == self.min_samples or observed % 16 == 0):
+                self._learned[key] = max(
+                    self.minimum,
+                    self.multiplier * _percentile(samples, self.percentile)
+                    + self.learned_margin,
+                )
+
+    def statistics(self):
+        """Report what was learned about each command.
+
+        Returns
+        -------
+        statistics: dict
+            For each verb, a dict keyed by the largest length, in characters,
+            of the commands it covers, of the number of round trips
+            ``samples`` kept, the learned ``timeout`` in seconds, or None
+            while it is still learning, and the number of ``timeouts``.
+        """
+        with self._mutex:
+            keys = set(self._samples) | set(self._timeouts)
+            statistics = {}
+            for verb, bits in sorted(keys):
+                statistics.setdefault(verb, {})[2 ** bits - 1] = {
+                    'samples': len(self._samples.get((verb, bits), ())),
+                    'timeout': self._learned.get((verb, bits)),
+                    'timeouts': self._timeouts.get((verb, bits), 0),
+                }
+        return statistics
@@ -0,0 +1,502 @@
+import array
+import os
+import queue
+import select
+import socket
+import threading
+from time import monotonic
+from urllib.parse import urlsplit
+
+from serial import LF, SerialException
+
+__all__ = [
+    'FdTransport',
+    'SocketTransport',
+    'ThreadedReaderTransport',
+]
+
+# From linux/serial.h, the flags are the fifth int of struct serial_struct
+_TIOCGSERIAL = 0x541E
+_TIOCSSERIAL = 0x541F
+_ASYNC_LOW_LATENCY = 0x2000
+_SERIAL_STRUCT_FLAGS = 4
+
+
+class ThreadedReaderTransport:
+    """Read a serial port from a background thread.
+
+    A dedicated thread drains the port in chunks as large as the data that
+    is waiting, splits it into lines and queues them for :meth:`read_until`.
+    Compared to ``Serial.read_until``, which reads the response in many small
+    pieces, this reduces the number of system calls and the CPU time spent
+    per command.
+
+    The transport implements the subset of the ``serial.Serial`` interface
+    used by :class:`TeensyToAny`, which selects it with
+    ``transport='thread'``.
+
+    Parameters
+    ----------
+    serial: serial.Serial
+        The opened port. The transport takes ownership of it and closes it
+        when it is closed.
+
+    poll_interval: float
+        How often, in seconds, the reader thread checks whether it should
+        stop while the port is idle.
+    """
+
+    def __init__(self, serial, *, poll_interval=0.05):
+        self._serial = serial
+        self._timeout = serial.timeout
+        self._serial.timeout = poll_interval
+        self._lines = queue.Queue()
+        self._leftover = b''
+        self._error = None
+        # Set by reset_input_buffer for the reader to drop its partial line
+        self._reset_lock = threading.Lock()
+        self._reset = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._reader,
+            name=f'TeensyToAny reader {serial.port}',
+            daemon=True,
+        )
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self._serial.port
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self._timeout = value
+
+    def _reader(self):
+        serial = self._serial
+        buffer = bytearray()
+        while not self._stop.is_set():
+            try:
+                data = serial.read(1)
+                if not data:
+                    continue
+                waiting = serial.in_waiting
+                if waiting:
+                    data += serial.read(waiting)
+            except (SerialException, OSError, TypeError) as e:
+                # pyserial raises TypeError when the port is closed under it
+                if not self._stop.is_set():
+                    self._error = e
+                    # Wake up anybody waiting for a line
+                    self._lines.put(None)
+                return
+
+            with self._reset_lock:
+                if self._reset:
+                    self._reset = False
+                    buffer.clear()
+                buffer += data
+                start = 0
+                while True:
+                    end = buffer.find(LF, start)
+                    if end < 0:
+                        break
+                    self._lines.put(bytes(buffer[start:end + 1]))
+                    start = end + 1
+                del buffer[:start]
+
+    def _get_line(self, timeout):
+        if self._error is not None:
+            raise SerialException(f"Reading from the port failed: {self._error}")
+        try:
+            if timeout is None:
+                line = self._lines.get()
+            else:
+                line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            return b''
+        if line is None:
+            raise SerialException(f"Reading from the port failed: {self._error}")
+        return line
+
+    def read_until(self, expected=LF, size=None):
+        """Return the next line, or ``b''`` if none arrives before the timeout.
+
+        Only ``LF`` terminated lines are supported.
+        """
+        if expected != LF:
+            raise ValueError("Only LF terminated lines are supported.")
+
+        if self._leftover:
+            line, self._leftover = self._leftover, b''
+        else:
+            line = self._get_line(self._timeout)
+        if size is not None and len(line) > size:
+            line, self._leftover = line[:size], line[size:]
+        return line
+
+    def write(self, data):
+        return self._serial.write(data)
+
+    def flush(self):
+        self._serial.flush()
+
+    def reset_output_buffer(self):
+        self._serial.reset_output_buffer()
+
+    def reset_input_buffer(self):
+        with self._reset_lock:
+            self._serial.reset_input_buffer()
+            self._leftover = b''
+            self._reset = True
+            self._clear_lines()
+
+    def _clear_lines(self):
+        while True:
+            try:
+                self._lines.get_nowait()
+            except queue.Empty:
+                break
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self._serial.close()
+
+
+class _LineReader:  # pylint: disable=too-few-public-methods
+    """Split the responses read in chunks into lines.
+
+    Subclasses append the data they receive to ``_buffer`` in ``_receive``.
+    """
+
+    def __init__(self, port, timeout):
+        self.port = port
+        self.timeout = timeout
+        self._buffer = bytearray()
+
+    def _check_open(self):
+        raise NotImplementedError
+
+    def _receive(self, deadline):
+        """Append the data waiting to the buffer, waiting for some until ``deadline``.
+
+        Returns False if nothing arrived in time.
+        """
+        raise NotImplementedError
+
+    def read_until(self, expected=LF, size=None):
+        """Return the next line, or what arrived before the timeout.
+
+        Only ``LF`` terminated lines are supported.
+        """
+        if expected != LF:
+            raise ValueError("Only LF terminated lines are supported.")
+        self._check_open()
+        buffer = self._buffer
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        start = 0
+        while True:
+            end = buffer.find(LF, start)
+            if end >= 0:
+                end += 1
+                break
+            start = len(buffer)
+            if (size is not None and start >= size) or not self._receive(deadline):
+                end = start
+                break
+        if size is not None and end > size:
+            end = size
+        line = bytes(buffer[:end])
+        del buffer[:end]
+        return line
+
+
+class FdTransport(_LineReader):
+    """Read and write a tty with system calls, without pyserial.
+
+    The port is opened with ``os.open`` and configured with ``termios`` in
+    raw mode, with ``VMIN`` and ``VTIME`` set to 0 since reads are non
+    blocking. Responses are read in chunks as large as the data waiting,
+    with ``poll`` enforcing the timeout, where ``Serial.read_until`` reads
+    one byte per call. Only available on Linux and other POSIX systems.
+
+    The transport implements the subset of the ``serial.Serial`` interface
+    used by :class:`TeensyToAny`, which selects it with ``transport='fd'``.
+
+    Parameters
+    ----------
+    port: str
+        The path of the tty.
+
+    baudrate: int
+        The baudrate, which USB serial devices such as the Teensy ignore.
+
+    timeout: float or None
+        Time, in seconds, to wait for a response. None waits forever.
+
+    exclusive: bool
+        If True, another process opening the port fails. The port is marked
+        with ``TIOCEXCL``, which does not apply to root, and locked with
+        ``flock``, which other ``FdTransport`` and pyserial ports opened with
+        ``exclusive=True`` respect.
+
+    low_latency: bool
+        If True, set ``ASYNC_LOW_LATENCY`` on drivers that support it, such
+        as those of USB to serial adapters, to deliver data without waiting
+        for their latency timer.
+    """
+
+    def __init__(self, port, *, baudrate=115200, timeout=None, exclusive=True,
+                 low_latency=True):
+        # Not available on Windows
+        # pylint: disable=import-outside-toplevel
+        import fcntl
+        import termios
+
+        super().__init__(port, timeout)
+        self._fcntl = fcntl
+        self._termios = termios
+        self._fd = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        self._exclusive = False
+        try:
+            if exclusive:
+                try:
+                    fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError as e:
+                    raise SerialException(
+                        f"Could not exclusively lock port {port}: {e}") from e
+                fcntl.ioctl(self._fd, termios.TIOCEXCL)
+                self._exclusive = True
+            self._configure(baudrate)
+            if low_latency:
+                self._set_low_latency()
+        except BaseException:
+            self.close()
+            raise
+        self._poll = select.poll()
+        self._poll.register(self._fd, select.POLLIN)
+
+    def _configure(self, baudrate):
+        termios = self._termios
+        iflag, oflag, cflag, lflag, ispeed, ospeed, cc = termios.tcgetattr(self._fd)
+        iflag &= ~(termios.IGNBRK | termios.BRKINT | termios.PARMRK | termios.ISTRIP |
+                   termios.INLCR | termios.IGNCR | termios.ICRNL | termios.IXON |
+                   termios.IXOFF | termios.IXANY)
+        oflag &= ~termios.OPOST
+        lflag &= ~(termios.ECHO | termios.ECHONL | termios.ICANON | termios.ISIG |
+                   termios.IEXTEN)
+        cflag &= ~(termios.CSIZE | termios.PARENB | termios.CSTOPB | termios.CRTSCTS)
+        cflag |= termios.CS8 | termios.CLOCAL | termios.CREAD
+        speed = getattr(termios, f'B{baudrate}', None)
+        if speed is not None:
+            ispeed = ospeed = speed
+        cc[termios.VMIN] = 0
+        cc[termios.VTIME] = 0
+        termios.tcsetattr(
+            self._fd, termios.TCSANOW, [iflag, oflag, cflag, lflag, ispeed, ospeed, cc])
+
+    def _set_low_latency(self):
+        serial_struct = array.array('i', [0] * 32)
+        try:
+            self._fcntl.ioctl(self._fd, _TIOCGSERIAL, serial_struct)
+            serial_struct[_SERIAL_STRUCT_FLAGS] |= _ASYNC_LOW_LATENCY
+            self._fcntl.ioctl(self._fd, _TIOCSSERIAL, serial_struct)
+        except OSError:
+            # Pseudo-terminals and USB CDC devices have no latency timer
+            pass
+
+    def _check_open(self):
+        if self._fd is None:
+            raise SerialException("The port is closed.")
+
+    def _receive(self, deadline):
+        ready = False
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except BlockingIOError:
+                data = b''
+            if data:
+                self._buffer += data
+                return True
+            if ready:
+                raise SerialException(
+                    f"The port {self.port} reported data to read but returned none, "
+                    "the device may have been disconnected.")
+            if deadline is None:
+                remaining = None
+            else:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return False
+                remaining = max(1, int(remaining * 1000))
+            ready = bool(self._poll.poll(remaining))
+
+    def write(self, data):
+        self._check_open()
+        data = memoryview(data)
+        written = 0
+        while written < len(data):
+            try:
+                written += os.write(self._fd, data[written:])
+            except BlockingIOError:
+                select.select([], [self._fd], [])
+        return len(data)
+
+    def flush(self):
+        self._termios.tcdrain(self._fd)
+
+    def reset_output_buffer(self):
+        self._termios.tcflush(self._fd, self._termios.TCOFLUSH)
+
+    def reset_input_buffer(self):
+        self._termios.tcflush(self._fd, self._termios.TCIFLUSH)
+        self._buffer.clear()
+
+    def close(self):
+        if self._fd is None:
+            return
+        try:
+            if self._exclusive:
+                # The flag stays on the tty while others hold it open
+                self._fcntl.ioctl(self._fd, self._termios.TIOCNXCL)
+        except OSError:
+            pass
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SocketTransport(_LineReader):
+    """Talk to a device exposed on the network by a TCP serial server.
+
+    Serial servers such as ``ser2net`` forward the bytes of a TCP connection
+    to a serial port, here given as ``socket://host:port``. Unlike the
+    ``socket://`` handler of pyserial, which reads one byte per call and
+    leaves Nagle's algorithm enabled, responses are read in chunks and
+    ``TCP_NODELAY`` is set by default, so that short commands are sent
+    without waiting for the acknowledgment of the previous ones.
+
+    The transport implements the subset of the ``serial.Serial`` interface
+    used by :class:`TeensyToAny`, which selects it for ``socket://`` ports.
+
+    Parameters
+    ----------
+    port: str
+        The URL of the server, ``socket://host:port``.
+
+    baudrate: int
+        Ignored, the baudrate of the serial port is set on the server.
+
+    timeout: float or None
+        Time, in seconds, to wait for a response. None waits forever.
+
+    nodelay: bool
+        If True, set ``TCP_NODELAY`` on the connection.
+
+    connect_timeout: float
+        Time, in seconds, to wait for the connection to the server.
+
+    write_timeout: float or None
+        Time, in seconds, to wait for a command to be sent. None waits
+        forever.
+    """
+
+    def __init__(self, port, *, baudrate=None, timeout=None, nodelay=True,
+                 connect_timeout=5, write_timeout=None):
+        # pylint: disable=unused-argument
+        url = urlsplit(str(port))
+        if url.scheme != 'socket' or not url.hostname or url.port is None:
+            raise ValueError(
+                f"Expected a URL like 'socket://host:port', got '{port}'.")
+        super().__init__(port, timeout)
+        self.write_timeout = write_timeout
+        self._socket_timeout = connect_timeout
+        try:
+            self._socket = socket.create_connection(
+                (url.hostname, url.port), timeout=connect_timeout)
+        except OSError as e:
+            raise SerialException(f"Could not connect to {port}: {e}") from e
+        if nodelay:
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    @property
+    def is_open(self):
+        """False once the connection is closed, by either end."""
+        if self._socket is None:
+            return False
+        self._settimeout(0)
+        try:
+            return bool(self._socket.recv(1, socket.MSG_PEEK))
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    def _settimeout(self, timeout):
+        # Changing the timeout of a socket costs system calls
+        if timeout != self._socket_timeout:
+            self._socket.settimeout(timeout)
+            self._socket_timeout = timeout
+
+    def _check_open(self):
+        if self._socket is None:
+            raise SerialException("The port is closed.")
+
+    def _receive(self, deadline):
+        if deadline is None:
+            self._settimeout(None)
+        else:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            self._settimeout(remaining)
+        try:
+            data = self._socket.recv(4096)
+        except socket.timeout:
+            return False
+        except OSError as e:
+            raise SerialException(f"Reading from {self.port} failed: {e}") from e
+        if not data:
+            raise SerialException(f"The connection to {self.port} was closed.")
+        self._buffer += data
+        return True
+
+    def write(self, data):
+        self._check_open()
+        self._settimeout(self.write_timeout)
+        try:
+            self._socket.sendall(data)
+        except OSError as e:
+            raise SerialException(f"Writing to {self.port} failed: {e}") from e
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_output_buffer(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._check_open()
+        self._buffer.clear()
+        self._settimeout(0)
+        while True:
+            try:
+                if not self._socket.recv(4096):
+                    break
+            except (BlockingIOError, socket.timeout):
+                break
+
+    def close(self):
+        if self._socket is None:
+            return
+        try:
+            self._socket.close()
+        finally:
+            self._socket = None